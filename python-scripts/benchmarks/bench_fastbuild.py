@@ -0,0 +1,73 @@
+################################################################################
+#
+# Object construction benchmark: stix2.parse against menpo.fastbuild on the
+# indicators and relationships of a generated address list (see
+# menpo/addresses.py).  Both builders must give the same serialized objects,
+# which is checked on a sample before anything is timed.
+#
+#   cd python-scripts/benchmarks
+#   python3 bench_fastbuild.py [--indicators 100000] [--scos] [--check 1000]
+#
+################################################################################
+import argparse, os, random, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from stix2.parsing import parse
+from menpo.addresses import build_objects
+from menpo.fastbuild import FastBuilder
+
+THREAT_ACTOR = "threat-actor--6f2b3c59-5a1b-5d6e-9d1c-3f7b2a8e4c10"
+BLOCKCHAINS = ("ethereum", "bsc", "polygon", "arbitrum", "ethereum|polygon")
+ROLES = ("attacker", "receiver", "mixer", "")
+
+
+def generate_rows(count, seed):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield {
+            "address": "0x%040x" % rng.getrandbits(160),
+            "blockchain": rng.choice(BLOCKCHAINS),
+            "role": rng.choice(ROLES),
+        }
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="stix2.parse against menpo.fastbuild")
+    parser.add_argument("--indicators", type=int, default=100000, help="rows of the address list")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scos", action="store_true", help="also build x-defi-address SCOs")
+    parser.add_argument("--check", type=int, default=1000, help="objects compared between both builders")
+    args = parser.parse_args()
+
+    stix_dicts = list(build_objects(
+        generate_rows(args.indicators, args.seed), THREAT_ACTOR, "2023-01-01T00:00:00.000Z", scos=args.scos,
+    ))
+    print(f"{len(stix_dicts)} objects from {args.indicators} addresses\n")
+
+    builder = FastBuilder(allow_custom=True)
+    sample = random.Random(args.seed).sample(stix_dicts, min(args.check, len(stix_dicts)))
+    for stix_dict in sample:
+        expected = parse(stix_dict, allow_custom=True)
+        if builder.build(stix_dict).serialize(pretty=True) != expected.serialize(pretty=True):
+            sys.exit("fastbuild differs from stix2 on %s" % stix_dict["id"])
+
+    builder = FastBuilder(allow_custom=True)
+    parse_seconds, _ = timed(lambda: [parse(stix_dict, allow_custom=True) for stix_dict in stix_dicts])
+    fast_seconds, _ = timed(builder.build_batch, stix_dicts)
+
+    print(f"{'builder':<12}{'objects':>10}{'seconds':>12}{'per sec':>12}{'us/object':>12}")
+    for name, seconds in (("stix2.parse", parse_seconds), ("fastbuild", fast_seconds)):
+        print(f"{name:<12}{len(stix_dicts):>10}{seconds:>12.3f}{len(stix_dicts) / seconds:>12.0f}"
+              f"{seconds / len(stix_dicts) * 1e6:>12.1f}")
+    print(f"\n{parse_seconds / fast_seconds:.1f}x faster, {builder.fallbacks} objects parsed by stix2, "
+          f"{len(sample)} checked identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+################################################################################
+#
+# Flagged address filter benchmark: builds the per-blockchain Bloom filters of
+# menpo.flagged_export over generated addresses, writes and loads them in the
+# file format of menpo.flagged, then checks listed and random addresses.
+# Reports the file size per address, the load time, the checks per second and
+# the measured false positive rate.
+#
+#   cd python-scripts/benchmarks
+#   python3 bench_flagged.py [--addresses 1000000] [--error-rate 0.001]
+#                            [--checks 1000000]
+#
+################################################################################
+import argparse, os, random, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from menpo.flagged import FlaggedFilters
+from menpo.flagged_export import build_filters, write_filters
+from menpo.normalize import normalize_address, split_blockchains
+from bench_fastbuild import generate_rows
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flagged address filter benchmark")
+    parser.add_argument("--addresses", type=int, default=1000000)
+    parser.add_argument("--error-rate", type=float, default=0.001)
+    parser.add_argument("--checks", type=int, default=1000000, help="addresses checked, half of them listed")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = list(generate_rows(args.addresses, args.seed))
+    addresses = {}
+    for row in rows:
+        for blockchain in split_blockchains(row["blockchain"]):
+            addresses.setdefault(blockchain, set()).add(normalize_address(row["address"]))
+
+    rng = random.Random(args.seed + 1)
+    listed = [(row["blockchain"].split("|")[0], row["address"].upper().replace("0X", "0x"))
+              for row in rng.choices(rows, k=args.checks // 2)]
+    unlisted = [("ethereum", "0x%040x" % rng.getrandbits(160)) for _ in range(args.checks - len(listed))]
+
+    build_seconds, filters = timed(build_filters, addresses, args.error_rate)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "flagged.bin")
+        write_filters(filters, path)
+        file_size = os.path.getsize(path)
+        load_seconds, filters = timed(FlaggedFilters.load, path)
+
+    maybe_flagged = filters.maybe_flagged
+    listed_seconds, found = timed(lambda: sum(maybe_flagged(blockchain, value) for blockchain, value in listed))
+    unlisted_seconds, false_positives = timed(lambda: sum(maybe_flagged(b, v) for b, v in unlisted))
+
+    print(f"{len(filters)} addresses on {len(filters.filters)} blockchains, error rate {args.error_rate}\n")
+    print(f"file size     {file_size / 1e6:.2f}MB, {file_size * 8 / len(filters):.1f} bits per address")
+    print(f"build         {build_seconds:.2f}s")
+    print(f"load          {load_seconds * 1e3:.1f}ms")
+    print(f"\n{'check':<12}{'count':>10}{'seconds':>10}{'per sec':>12}{'ns each':>10}{'flagged':>10}")
+    for name, checks, seconds, flagged in (
+        ("listed", listed, listed_seconds, found),
+        ("unlisted", unlisted, unlisted_seconds, false_positives),
+    ):
+        print(f"{name:<12}{len(checks):>10}{seconds:>10.3f}{len(checks) / seconds:>12.0f}"
+              f"{seconds / len(checks) * 1e9:>10.0f}{flagged:>10}")
+    print(f"\nfalse positive rate {false_positives / len(unlisted):.4%}, every listed address found: {found == len(listed)}")
+
+
+if __name__ == "__main__":
+    main()
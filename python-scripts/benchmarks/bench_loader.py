@@ -0,0 +1,42 @@
+################################################################################
+#
+# Bulk loader benchmark: files/sec when materializing a db/ tree in memory
+# with 1, 4 and 16 workers.
+#
+#   cd python-scripts/benchmarks
+#   python3 bench_loader.py [--stix-dir ../../db] [--threads] [--repeat 3]
+#
+################################################################################
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from menpo.index import version_paths
+from menpo.loader import load_graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk loader benchmark")
+    parser.add_argument("--stix-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "db"))
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--threads", action="store_true", help="use a thread pool instead of a process pool")
+    parser.add_argument("--repeat", type=int, default=3, help="keep the best of N runs")
+    args = parser.parse_args()
+
+    files = len(version_paths(args.stix_dir))
+    print(f"{files} files in {os.path.abspath(args.stix_dir)}, {os.cpu_count()} cpus, "
+          f"{'threads' if args.threads else 'processes'}\n")
+    print(f"{'workers':>8}{'seconds':>12}{'files/sec':>14}{'objects':>10}")
+
+    for workers in args.workers:
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            graph = load_graph(args.stix_dir, workers=workers, use_threads=args.threads)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        print(f"{workers:>8}{best:>12.3f}{files / best:>14.0f}{len(graph):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+################################################################################
+#
+# Indicator matching benchmark: compiles the indicators of a generated address
+# list (see menpo/addresses.py) with menpo.matcher, then matches a stream of
+# observed addresses against all of them, a share of which are listed (in
+# another case, as checksummed addresses come).  The per-pattern cost of the
+# STIX pattern grammar, which evaluating patterns one by one would pay for
+# every observation, is shown for comparison.
+#
+#   cd python-scripts/benchmarks
+#   python3 bench_matcher.py [--indicators 100000] [--observations 1000000]
+#                            [--hit-rate 0.1]
+#
+################################################################################
+import argparse, os, random, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from menpo.addresses import build_objects
+from menpo.matcher import IndicatorMatcher, parse_pattern, compile_predicate
+from bench_fastbuild import THREAT_ACTOR, generate_rows
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def generate_observations(rows, count, hit_rate, seed):
+    rng = random.Random(seed)
+    observations = []
+    for _ in range(count):
+        if rng.random() < hit_rate:
+            row = rng.choice(rows)
+            observations.append((row["blockchain"].split("|")[0], "0x" + row["address"][2:].upper()))
+        else:
+            observations.append(("ethereum", "0x%040x" % rng.getrandbits(160)))
+    return observations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indicator matching benchmark")
+    parser.add_argument("--indicators", type=int, default=100000)
+    parser.add_argument("--observations", type=int, default=1000000)
+    parser.add_argument("--hit-rate", type=float, default=0.1, help="share of observed addresses which are listed")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = list(generate_rows(args.indicators, args.seed))
+    indicators = [
+        stix_obj for stix_obj in build_objects(rows, THREAT_ACTOR, "2023-01-01T00:00:00.000Z")
+        if stix_obj["type"] == "indicator"
+    ]
+    observations = generate_observations(rows, args.observations, args.hit_rate, args.seed + 1)
+
+    matcher = IndicatorMatcher()
+    compile_seconds, _ = timed(lambda: [matcher.add_indicator(indicator) for indicator in indicators])
+    match_seconds, hits = timed(matcher.match_batch, observations)
+
+    sample = indicators[:min(len(indicators), 200)]
+    grammar_seconds, predicates = timed(lambda: [compile_predicate(parse_pattern(i["pattern"])) for i in sample])
+    observed = {"type": "x-defi-address", "blockchain": observations[0][0], "value": observations[0][1]}
+    evaluate_seconds, _ = timed(lambda: [predicate(observed) for predicate in predicates])
+
+    print(f"{len(indicators)} indicators: {matcher.lowered} lowered to hash lookups, "
+          f"{len(matcher.evaluated)} evaluated, {len(matcher.unsupported)} unsupported\n")
+    print(f"{'operation':<28}{'count':>10}{'seconds':>12}{'per sec':>14}")
+    for operation, count, seconds in (
+        ("compile", len(indicators), compile_seconds),
+        ("match-batch", len(observations), match_seconds),
+        ("grammar parse (sample)", len(sample), grammar_seconds),
+        ("evaluate one by one", len(sample), evaluate_seconds),
+    ):
+        print(f"{operation:<28}{count:>10}{seconds:>12.3f}{count / seconds:>14.0f}")
+
+    one_by_one = evaluate_seconds / len(sample) * len(indicators)
+    print(f"\n{len(hits)} observations matched; evaluating every pattern one by one would take "
+          f"{one_by_one * 1e3:.1f}ms per observation")
+
+
+if __name__ == "__main__":
+    main()
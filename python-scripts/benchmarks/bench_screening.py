@@ -0,0 +1,91 @@
+################################################################################
+#
+# Transaction screening benchmark: builds a menpo.screening screener over the
+# indicators of a generated address list (see menpo/addresses.py), then
+# screens batches of transactions (from, to and hash), a share of which send
+# to a listed address.  Reports the p50/p99 latency of a batch and the
+# transactions screened per second, with and without the Bloom prefilter.
+#
+#   cd python-scripts/benchmarks
+#   python3 bench_screening.py [--indicators 100000] [--transactions 1000000]
+#                              [--batch-size 1000] [--hit-rate 0.01]
+#
+################################################################################
+import argparse, os, random, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from menpo.addresses import build_objects
+from menpo.matcher import IndicatorMatcher
+from menpo.screening import TransactionScreener
+from bench_fastbuild import THREAT_ACTOR, generate_rows
+
+REPORT = "report--0b9e4a6c-2f0d-5c3e-8b7a-6d1f4e2a9c35"
+
+
+def generate_transactions(rows, count, hit_rate, seed):
+    rng = random.Random(seed)
+    transactions = []
+    for _ in range(count):
+        transaction = {
+            "blockchain": "ethereum",
+            "hash": "0x%064x" % rng.getrandbits(256),
+            "from": "0x%040x" % rng.getrandbits(160),
+            "to": "0x%040x" % rng.getrandbits(160),
+        }
+        if rng.random() < hit_rate:
+            row = rng.choice(rows)
+            transaction["blockchain"] = row["blockchain"].split("|")[0]
+            transaction["to"] = "0x" + row["address"][2:].upper()
+        transactions.append(transaction)
+    return transactions
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def run(screener, batches):
+    latencies, hits = [], 0
+    for batch in batches:
+        start = time.perf_counter()
+        hits += len(screener.screen_batch(batch))
+        latencies.append(time.perf_counter() - start)
+    return latencies, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transaction screening benchmark")
+    parser.add_argument("--indicators", type=int, default=100000)
+    parser.add_argument("--transactions", type=int, default=1000000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--hit-rate", type=float, default=0.01, help="share of transactions to a listed address")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = list(generate_rows(args.indicators, args.seed))
+    matcher = IndicatorMatcher()
+    for stix_obj in build_objects(rows, THREAT_ACTOR, "2023-01-01T00:00:00.000Z"):
+        if stix_obj["type"] == "indicator":
+            matcher.add_indicator(stix_obj)
+    transactions = generate_transactions(rows, args.transactions, args.hit_rate, args.seed + 1)
+    batches = [transactions[i:i + args.batch_size] for i in range(0, len(transactions), args.batch_size)]
+
+    def context(stix_id):
+        return {THREAT_ACTOR}, {REPORT}
+
+    print(f"{len(matcher)} indicators, {len(transactions)} transactions in batches of {args.batch_size}\n")
+    print(f"{'prefilter':<12}{'build s':>10}{'hits':>10}{'p50 ms':>10}{'p99 ms':>10}{'tx/sec':>12}")
+    for name, prefilter in (("none", False), ("bloom", True)):
+        start = time.perf_counter()
+        screener = TransactionScreener(matcher, context=context, prefilter=prefilter)
+        build_seconds = time.perf_counter() - start
+        latencies, hits = run(screener, batches)
+        print(f"{name:<12}{build_seconds:>10.2f}{hits:>10}{percentile(latencies, 0.5) * 1e3:>10.3f}"
+              f"{percentile(latencies, 0.99) * 1e3:>10.3f}{len(transactions) / sum(latencies):>12.0f}")
+    print(f"\nBloom filter: {screener.bloom.size // 8 / 1e6:.1f}MB, {screener.bloom.probes} probes, "
+          f"{screener.bloom.false_positive_rate():.2%} false positives")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+################################################################################
+#
+# Full-text search benchmark: writes generated notes into a temporary store
+# with menpo.bulk, which updates a menpo.search index with every batch, and
+# times a set of analyst queries as the corpus grows.  Note texts draw words
+# from a Zipf-distributed vocabulary, with some of the queried phrases in a
+# small share of them.  Reports the p50/p99 latency of every query at every
+# corpus size, the time spent updating and saving the search index, and the
+# cold-load time: opening the search database in a new SearchIndex and
+# answering a first query.
+#
+#   cd python-scripts/benchmarks
+#   python3 bench_search.py [--sizes 1000,10000,100000] [--words 60]
+#
+################################################################################
+import argparse, os, random, sys, tempfile, time, uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from menpo.bulk import BulkWriter
+from menpo.search import SearchIndex
+
+QUERIES = ("reentrancy", "oracle manipulation", '"oracle manipulation"', '"private key" leaked', "flash loan attack")
+PHRASES = ("reentrancy", "oracle manipulation", "private key", "flash loan")
+
+
+def generate_notes(start, count, words, seed):
+    rng = random.Random(seed)
+    vocabulary = ["w%d" % i for i in range(20000)] + ["attack", "leaked", "loan", "key", "oracle"]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    for i in range(start, start + count):
+        text = rng.choices(vocabulary, weights, k=words)
+        if rng.random() < 0.02:
+            text.insert(rng.randrange(len(text)), rng.choice(PHRASES))
+        yield {
+            "type": "note",
+            "spec_version": "2.1",
+            "id": "note--%s" % uuid.UUID(int=rng.getrandbits(128), version=4),
+            "created": "2023-01-01T00:00:00.000Z",
+            "modified": "2023-01-01T00:00:00.000Z",
+            "content": " ".join(text),
+            "object_refs": ["report--0b9e4a6c-2f0d-5c3e-8b7a-6d1f4e2a9c35"],
+        }
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text search benchmark")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="corpus sizes, comma separated")
+    parser.add_argument("--words", type=int, default=60, help="words per note")
+    parser.add_argument("--repeat", type=int, default=50, help="runs of every query")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    with tempfile.TemporaryDirectory(dir="/dev/shm" if os.path.isdir("/dev/shm") else None) as stix_dir:
+        search = SearchIndex(stix_dir)
+        writer = BulkWriter(stix_dir, validate=False, sync=False, search=search)
+
+        print(f"{'documents':>10}  {'query':<24}{'hits':>8}{'p50 ms':>10}{'p99 ms':>10}")
+        written = 0
+        for size in sizes:
+            start = time.perf_counter()
+            writer.write_batches(generate_notes(written, size - written, args.words, args.seed + written))
+            write_seconds = time.perf_counter() - start
+            written = size
+
+            for query in QUERIES:
+                latencies = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    hits = search.search(query, limit=10)
+                    latencies.append(time.perf_counter() - start)
+                matches = len(search.search(query, limit=None))
+                print(f"{len(search):>10}  {query:<24}{matches:>8}{percentile(latencies, 0.5) * 1e3:>10.3f}"
+                      f"{percentile(latencies, 0.99) * 1e3:>10.3f}")
+            start = time.perf_counter()
+            cold = SearchIndex(stix_dir)
+            open_seconds = time.perf_counter() - start
+            cold.search(QUERIES[-1], limit=10)
+            cold_seconds = time.perf_counter() - start
+            cold.close()
+
+            size_bytes = sum(os.path.getsize(path) for path in (search.path, search.path + "-wal") if os.path.exists(path))
+            print(f"{'':>10}  written and indexed in {write_seconds:.1f}s, search database {size_bytes / 1e6:.1f}MB, "
+                  f"cold load {open_seconds * 1e3:.1f}ms, {cold_seconds * 1e3:.1f}ms with a first query\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+################################################################################
+#
+# Store benchmark on a synthetic corpus (see menpo/synthetic.py): ingestion,
+# type queries, get-by-id, relationship expansion and report extraction, for
+# every Menpo data source.
+#
+#   cd python-scripts/benchmarks
+#   python3 bench_store.py [--objects 10000] [--seed 0] [--stix-dir DIR]
+#                          [--sources [fs] indexed lazy sqlite graph]
+#                          [--samples 100] [--output results.json]
+#
+# The corpus is written to a temporary directory unless --stix-dir is given
+# (an existing corpus is reused as is).  With --output, the results are also
+# written as JSON, one record per (source, operation), to be compared between
+# runs.
+#
+################################################################################
+import argparse, json, os, platform, random, shutil, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from stix2 import FileSystemSource, Filter
+from menpo.bulk import BulkWriter
+from menpo.extract import extract_report
+from menpo.index import FileSystemIndex, IndexedFileSystemSource, IndexedFileSystemStore, version_paths
+from menpo.loader import load_graph
+from menpo.manifest import Manifest
+from menpo.sqlite_store import SQLiteStore, import_directory
+from menpo.synthetic import generate_corpus, write_corpus
+from menpo.views import LazyFileSystemSource
+
+SOURCES = ("fs", "indexed", "lazy", "sqlite", "graph")
+# Plain FileSystemSource reads every relationship file for each expansion:
+# too slow past a few thousand objects, only run when asked for
+DEFAULT_SOURCES = ("indexed", "lazy", "sqlite", "graph")
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def open_source(name, stix_dir, work_dir):
+    """Returns (seconds to open, source)."""
+    if name == "fs":
+        return timed(FileSystemSource, stix_dir, allow_custom=True)
+    if name == "indexed":
+        return timed(IndexedFileSystemSource, stix_dir)
+    if name == "lazy":
+        return timed(LazyFileSystemSource, stix_dir)
+    if name == "graph":
+        return timed(load_graph, stix_dir)
+    if name == "sqlite":
+        db_path = os.path.join(work_dir, "bench.sqlite")
+        if not os.path.exists(db_path):
+            import_directory(stix_dir, db_path)
+        return timed(SQLiteStore, db_path)
+    raise ValueError("unknown source %r" % name)
+
+
+def bench_ingestion(args, work_dir):
+    """Ingest `--ingest` objects through IndexedFileSystemStore.add and
+    through BulkWriter (synced, in batches of 10000), and the whole corpus
+    through the SQLite importer."""
+    results = []
+
+    stix_objs = list(generate_corpus(args.ingest, seed=args.seed + 1))
+    ingest_dir = os.path.join(work_dir, "ingest")
+    os.makedirs(ingest_dir)
+    store = IndexedFileSystemStore(ingest_dir, allow_custom=True)
+    seconds, _ = timed(store.add, stix_objs)
+    results.append(record("indexed", "ingest", seconds, len(stix_objs)))
+
+    bulk_dir = os.path.join(work_dir, "bulk")
+    os.makedirs(bulk_dir)
+    index = FileSystemIndex(bulk_dir)
+    writer = BulkWriter(bulk_dir, allow_custom=True, index=index, manifest=Manifest(bulk_dir))
+    seconds, written = timed(writer.write_batches, stix_objs)
+    results.append(record("bulk", "ingest", seconds, written))
+
+    db_path = os.path.join(work_dir, "ingest.sqlite")
+    seconds, inserted = timed(import_directory, args.stix_dir, db_path)
+    results.append(record("sqlite", "import", seconds, inserted))
+    return results
+
+
+def record(source, operation, seconds, count):
+    return {
+        "source": source,
+        "operation": operation,
+        "count": count,
+        "seconds": round(seconds, 6),
+        "per_second": round(count / seconds, 1) if seconds else None,
+    }
+
+
+def bench_source(name, source, open_seconds, samples):
+    results = [record(name, "open", open_seconds, 1)]
+
+    seconds, reports = timed(source.query, [Filter("type", "=", "report")])
+    results.append(record(name, "query-type", seconds, len(reports)))
+
+    seconds, _ = timed(lambda: [source.get(stix_id) for stix_id in samples["get"]])
+    results.append(record(name, "get", seconds, len(samples["get"])))
+
+    seconds, _ = timed(lambda: [source.related_to(stix_id) for stix_id in samples["related_to"]])
+    results.append(record(name, "related-to", seconds, len(samples["related_to"])))
+
+    seconds, _ = timed(lambda: [extract_report(source, stix_id) for stix_id in samples["extract"]])
+    results.append(record(name, "extract-report", seconds, len(samples["extract"])))
+
+    return results
+
+
+def pick_samples(stix_dir, count, seed):
+    """Ids used by every source, picked from the tree layout."""
+    by_type = {}
+    for path in version_paths(stix_dir):
+        type_name, rest = path.split("/", 1)
+        by_type.setdefault(type_name, set()).add(rest.split("/")[0].replace(".json", ""))
+
+    rng = random.Random(seed)
+    all_ids = sorted(stix_id for ids in by_type.values() for stix_id in ids)
+
+    def sample(ids):
+        ids = sorted(ids)
+        return rng.sample(ids, min(count, len(ids)))
+
+    return {
+        "get": sample(all_ids),
+        "related_to": sample(by_type.get("threat-actor", ())),
+        "extract": sample(by_type.get("report", ())),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store benchmark on a synthetic corpus")
+    parser.add_argument("--objects", type=int, default=10000, help="size of the generated corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stix-dir", help="corpus directory, generated there when missing")
+    parser.add_argument("--sources", nargs="+", choices=SOURCES, default=list(DEFAULT_SOURCES))
+    parser.add_argument("--samples", type=int, default=100, help="ids per get/related-to/extract run")
+    parser.add_argument("--ingest", type=int, default=1000, help="objects ingested through IndexedFileSystemStore")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="menpo-bench-")
+    try:
+        if args.stix_dir is None:
+            args.stix_dir = os.path.join(work_dir, "corpus")
+        if not os.path.isdir(args.stix_dir) or not os.listdir(args.stix_dir):
+            os.makedirs(args.stix_dir, exist_ok=True)
+            seconds, written = timed(write_corpus, args.stix_dir, args.objects, seed=args.seed)
+            print(f"Generated {written} objects in {seconds:.1f}s")
+
+        files = len(version_paths(args.stix_dir))
+        print(f"{files} files in {os.path.abspath(args.stix_dir)}\n")
+
+        samples = pick_samples(args.stix_dir, args.samples, args.seed)
+        results = bench_ingestion(args, work_dir)
+        for name in args.sources:
+            open_seconds, source = open_source(name, args.stix_dir, work_dir)
+            results.extend(bench_source(name, source, open_seconds, samples))
+            if name == "sqlite":
+                source.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'source':<10}{'operation':<16}{'count':>8}{'seconds':>12}{'per sec':>12}")
+    for result in results:
+        per_second = "" if result["per_second"] is None else f"{result['per_second']:.0f}"
+        print(f"{result['source']:<10}{result['operation']:<16}{result['count']:>8}{result['seconds']:>12.4f}{per_second:>12}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "corpus": {"files": files, "objects": args.objects, "seed": args.seed},
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": results,
+            }, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,24 @@
-from stix2 import AttackPattern, ExternalReference, FileSystemStore, \
-    Identity, Indicator, Note, Relationship, Report, ThreatActor
+from stix2 import AttackPattern, ExternalReference, Identity, \
+    Indicator, Note, Relationship, Report, ThreatActor
 from stix2.base import STIXJSONEncoder
-from stix2.properties import EnumProperty, IntegerProperty, StringProperty, TimestampProperty
-from stix2.v21 import CustomExtension, CustomObservable
 import json
 import os
+import sys
 
 ################################################################################
 ##
 ## STIX Extension definitions
 ##
-## - x_defi_estimated_loss_usd for the report SDO
-## - x_defi_taxonomy_* for the attack-pattern SDO
-## - x-defi-address SCO
+## The Menpo extensions (x_defi_estimated_loss_usd for the report SDO,
+## x_defi_taxonomy_* for the attack-pattern SDO) and SCOs are registered
+## once per process by menpo/schema.py
 ##
 ################################################################################
 
-# We can get the UUID with
-#   python3 -c "import uuid; print(str(uuid.uuid4()))"
-REPORT_EXTENSION_DEFINITION_ID = "extension-definition--393acb6c-fe64-42b5-92d5-a8ec243c4876"
-
-@CustomExtension(
-    REPORT_EXTENSION_DEFINITION_ID, [
-        ("x_defi_estimated_loss_usd", IntegerProperty(required=True)),
-    ],
-)
-
-class ReportExtension:
-    extension_type = "toplevel-property-extension"
-
-ATTACK_PATTERN_EXTENSION_DEFINITION_ID = "extension-definition--59cde1e5-2ce1-4732-a09d-596f401ba65b"
-
-@CustomExtension(
-    ATTACK_PATTERN_EXTENSION_DEFINITION_ID, [
-        ("x_defi_taxonomy_layer", EnumProperty(["NET", "CON", "SC", "PRO", "AUX"], required=True)),
-        ("x_defi_taxonomy_incident_cause", StringProperty(required=True)),
-        ("x_defi_taxonomy_incident_type", StringProperty(required=True)),
-    ],
-)
-
-class AttackPatternExtension:
-    extension_type = "toplevel-property-extension"
-
-@CustomObservable('x-defi-address', [
-    ('name', StringProperty(required=True)),
-    ('description', StringProperty(required=True)),
-    ('created', TimestampProperty(required=True)),
-    ('modified', TimestampProperty(required=True)),
-    ('blockchain', StringProperty(required=True)),
-    ('value', StringProperty(required=True)),
-])
-class XDefiAddress():
-    pass
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from menpo.ids import assign_ids
+from menpo.ingest import write_objects
+from menpo.schema import XDefiAddress
 
 ################################################################################
 ##
@@ -304,8 +271,9 @@ incident_note_objects_comments = [
 
 ################################################################################
 
-fs = FileSystemStore("../../db")
-fs.add([
+# Every object of the incident, with deterministic ids, written by
+# `python3 <script>` or collected by the batch driver (python3 -m menpo.ingest)
+objects = assign_ids([
     attacker,
     attacker_indicator["00"],
     relationship_attacker_indicator["00"],
@@ -322,5 +290,9 @@ fs.add([
     incident_note_objects_comments[2],
     incident_note_objects_comments[3],
     incident_note_objects_comments[4],
-    incident_note_objects_comments[5]
+    incident_note_objects_comments[5],
 ])
+
+if __name__ == "__main__":
+    written = write_objects("../../db", objects)
+    print(", ".join("%d %s" % (len(v), k) for k, v in written.items()))
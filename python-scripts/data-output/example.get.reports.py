@@ -1,9 +1,13 @@
-import json
+import json, os, sys
 
-from stix2 import FileSystemSource, Filter
+from stix2 import Filter
 from stix2.base import STIXJSONEncoder
 
-fs = FileSystemSource("../../db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from menpo.timeindex import TimeIndex
+from menpo.views import LazyFileSystemSource
+
+fs = LazyFileSystemSource("../../db")
 
 # Do the query
 filt = Filter('type', '=', 'report')
@@ -14,9 +18,13 @@ json_str = json.dumps(reports, indent=4, cls=STIXJSONEncoder)
 print(json_str)
 
 # Or, if you don't like json, we can give you a more compact one
-sorted_reports = sorted(reports, key=lambda x: x["published"])
+# straight from the index, without opening the report files, in
+# publication order from the time index
+times = TimeIndex("../../db")
+times.refresh(fs.index)
+sorted_reports = [fs.index.lookup(report_id) for _, report_id in times.range("published", types=["report"])]
 
 print("Reports in the DB:", len(sorted_reports), "\n")
 
 for report in sorted_reports:
-  print("-", report.name)
+  print("-", report["name"])
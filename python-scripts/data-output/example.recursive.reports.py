@@ -1,10 +1,16 @@
 import json, os, shutil, sys, tempfile, webbrowser
 
 from urllib.parse import urlunparse
-from stix2 import FileSystemSource, Filter
 from stix2.base import STIXJSONEncoder
 
-fs = FileSystemSource("../../db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from menpo.cache import CachedSource
+from menpo.extract import extract_report
+from menpo.views import LazyFileSystemSource
+
+# Objects loaded while walking the relationships are cached, so getting
+# them again costs a stat() instead of a file parse
+fs = CachedSource(LazyFileSystemSource("../../db"))
 
 ################################################################################
 #
@@ -14,8 +20,9 @@ fs = FileSystemSource("../../db")
 def start_no_command_line_arguments():
   print("Please provide the uuid of a report to render it.\n")
 
-  filt = Filter('type', '=', 'report')
-  reports = fs.query([filt])
+  # Names and publication dates are answered by the index,
+  # no report file needs to be opened
+  reports = fs.index.entries("report")
   sorted_reports = sorted(reports, key=lambda x: x["published"])
 
   # Define column widths
@@ -27,8 +34,8 @@ def start_no_command_line_arguments():
 
   # Iterate through sorted_reports and print each row
   for report in sorted_reports:
-      trimmed_id = report.id.replace("report--", "")  # Trim 'report--' from the ID
-      print(f"{report.name[:name_width]:<{name_width}}{trimmed_id[:id_width]:<{id_width}}")
+      trimmed_id = report["id"].replace("report--", "")  # Trim 'report--' from the ID
+      print(f"{report['name'][:name_width]:<{name_width}}{trimmed_id[:id_width]:<{id_width}}")
 
 ################################################################################
 #
@@ -41,16 +48,13 @@ def start_command_line_arg_found():
 
   # You can see here my blatant disregard for input parameter validation...
   report_id = "report--" + uuid_str
-  report = fs.get(report_id)
-
-  report_stix_ids = [report_id]
 
   # In reports, `fs.relationships(report) will return []
   # Understandable, as the engine is looking for SROs
   # We need to take a more indirect approach by fecthing
-  # the items from object_refs as they are
-  for object_ref in report.object_refs:
-    recurse_and_append_objects(report_stix_ids, object_ref)
+  # the items from object_refs as they are, and walking the
+  # relationships from there
+  report_objects = extract_report(fs, report_id)
 
   # The visualizer application doesn't allow to use file:///
   # https://github.com/oasis-open/cti-stix-visualization/blob/5ce57915ef1c3e5a7472adf765d93d24dec189f5/application.js#L771
@@ -63,7 +67,7 @@ def start_command_line_arg_found():
 
   # Prepare the `latest.js` file contents
   # We are producing a requireJS module
-  json_content = json.dumps([fs.get(id) for id in report_stix_ids], indent=4, cls=STIXJSONEncoder)
+  json_content = json.dumps(report_objects, indent=4, cls=STIXJSONEncoder)
   javascript_code = f'''var data = `
   {json_content}
 `
@@ -88,25 +92,6 @@ define(function() {{
 
   webbrowser.open(url)
 
-################################################################################
-#
-# Performs recursion to get objects, adds them into the given list
-#
-################################################################################
-def recurse_and_append_objects(report_stix_ids, obj_id):
-  if obj_id is None or obj_id in report_stix_ids:
-    return
-
-  else:
-    report_stix_ids.append(obj_id)
-
-    for relationship in fs.relationships(obj_id):
-      if relationship.id not in report_stix_ids:
-        report_stix_ids.append(relationship.id)
-
-    for related_obj in fs.related_to(obj_id):
-      recurse_and_append_objects(report_stix_ids, related_obj["id"])
-
 ################################################################################
 #
 # "main"
@@ -0,0 +1,5 @@
+"""Menpo: DeFi incidents in STIX 2.1.
+
+Helpers shared by the `data-input` and `data-output` scripts for reading and
+writing the `db/` FileSystemStore tree.
+"""
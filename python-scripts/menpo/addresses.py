@@ -0,0 +1,279 @@
+"""Indicators and relationships built from address lists.
+
+Laundering addresses come by the thousand, far too many to write an
+`Indicator` by hand for each of them as the `data-input` scripts do.  This
+module streams a CSV or JSONL file of addresses, one per row:
+
+    address,blockchain,role,description
+    0xfd6f294f3c9e117dde30495770ba9b073c33b065,polygon,receiver,KyberSwap Attacker Address Receiving Tokens
+    0x57A72cE4fd69eBEdEfC1a938b690fbf11A7Dff80,ethereum|polygon,attacker,
+
+and builds, for every row, an indicator with an `x-defi-address` pattern
+(several blockchains separated by `|` give an OR pattern) and its
+`indicates` relationship to a threat actor, plus optionally the
+`x-defi-address` SCO and a `uses` relationship from the threat actor to it.
+The role, when given, is kept in the indicator `labels`, and addresses
+which are already stored reuse their SCO (see `menpo.registry`).
+
+Ids are deterministic (see `menpo.ids`) and the objects are written in
+atomic batches (see `menpo.bulk`), skipping the versions the manifest
+already has, so rows are never all held in memory and loading the same
+list again writes nothing:
+
+    cd python-scripts
+    python3 -m menpo.addresses addresses.csv --threat-actor threat-actor--... [--scos]
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import time
+
+from stix2.utils import format_datetime, parse_into_datetime
+
+from menpo.bulk import BulkWriter, recover
+from menpo.ids import deterministic_id
+from menpo.index import FileSystemIndex
+from menpo.manifest import ChangedVersionError, Manifest, refuse_changed
+from menpo.registry import AddressRegistry
+
+BLOCKCHAIN_SEPARATOR = "|"
+
+
+class AddressListError(Exception):
+    """Raised when a row of an address list cannot be used."""
+    pass
+
+
+def read_rows(path, format=None, encoding="utf-8"):
+    """Yield the rows of a CSV (with a header line) or JSONL address list
+    as dicts, one at a time.
+
+    Args:
+        path (str): path of the list
+        format (str): "csv" or "jsonl", from the file extension by default
+        encoding (str): The encoding to use when reading the file.
+
+    """
+    if format is None:
+        format = "jsonl" if os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson") else "csv"
+
+    with io.open(path, "r", encoding=encoding, newline="") as f:
+        if format == "csv":
+            for row in csv.DictReader(f):
+                yield row
+        elif format == "jsonl":
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            raise ValueError("unknown address list format %r" % format)
+
+
+def _quote(value):
+    return "'%s'" % value.replace("\\", "\\\\").replace("'", "\\'")
+
+
+def _blockchains(row):
+    blockchain = row.get("blockchain") or ""
+    if isinstance(blockchain, (list, tuple)):
+        blockchains = blockchain
+    else:
+        blockchains = blockchain.split(BLOCKCHAIN_SEPARATOR)
+    return [b.strip().lower() for b in blockchains if b.strip()]
+
+
+def address_pattern(value, blockchains):
+    """STIX pattern matching an address on any of `blockchains`."""
+    blockchain_terms = ["x-defi-address:blockchain = %s" % _quote(b) for b in blockchains]
+    if len(blockchain_terms) > 1:
+        blockchain = "(%s)" % " OR ".join(blockchain_terms)
+    else:
+        blockchain = blockchain_terms[0]
+    return "[x-defi-address:value = %s AND %s]" % (_quote(value), blockchain)
+
+
+def build_objects(rows, threat_actor_ref, created, threat_actor_name=None, scos=False, registry=None):
+    """Yield the STIX dicts of an address list, row after row.
+
+    Args:
+        rows (iterable): dicts with "address", "blockchain" and optionally
+            "role" and "description" keys
+        threat_actor_ref (str): id of the threat actor the addresses
+            indicate
+        created (str): `created`, `modified` and `valid_from` of every
+            object
+        threat_actor_name (str): used in the default descriptions
+        scos (bool): also yield an `x-defi-address` SCO per blockchain and
+            a `uses` relationship from the threat actor to it
+        registry (AddressRegistry): when given, addresses it already has
+            are not yielded again, the `uses` relationships point at their
+            canonical SCOs
+
+    Raises:
+        AddressListError: a row has no address or no blockchain
+
+    """
+    # Formatted the way stix2 serializes them, so that the dicts hash like
+    # the files written from them
+    stamp = format_datetime(parse_into_datetime(created, precision="millisecond"))
+    sco_stamp = format_datetime(parse_into_datetime(created))
+    owner = threat_actor_name or "Threat Actor"
+
+    def relationship(relationship_type, source_ref, target_ref):
+        stix_obj = {
+            "type": "relationship",
+            "spec_version": "2.1",
+            "created": stamp,
+            "modified": stamp,
+            "relationship_type": relationship_type,
+            "source_ref": source_ref,
+            "target_ref": target_ref,
+        }
+        stix_obj["id"] = deterministic_id(stix_obj)
+        return stix_obj
+
+    for number, row in enumerate(rows, 1):
+        value = (row.get("address") or "").strip()
+        blockchains = _blockchains(row)
+        if not value or not blockchains:
+            raise AddressListError("row %d: an address and a blockchain are required" % number)
+
+        role = (row.get("role") or "").strip()
+        description = (row.get("description") or "").strip() or "%s %s Address" % (owner, role.capitalize() if role else "")
+        indicator = {
+            "type": "indicator",
+            "spec_version": "2.1",
+            "created": stamp,
+            "modified": stamp,
+            "valid_from": sco_stamp,
+            "name": value,
+            "description": " ".join(description.split()),
+            "pattern": address_pattern(value, blockchains),
+            "pattern_type": "stix",
+            "pattern_version": "2.1",
+        }
+        if role:
+            indicator["labels"] = [role]
+        indicator["id"] = deterministic_id(indicator)
+        yield indicator
+        yield relationship("indicates", indicator["id"], threat_actor_ref)
+
+        if scos:
+            for blockchain in blockchains:
+                address = {
+                    "type": "x-defi-address",
+                    "spec_version": "2.1",
+                    "name": "%s - %s" % (value, blockchain.capitalize()),
+                    "description": indicator["description"],
+                    "created": sco_stamp,
+                    "modified": sco_stamp,
+                    "blockchain": blockchain,
+                    "value": value,
+                }
+                address["id"] = deterministic_id(address)
+                address_ref = registry.resolve(address) if registry is not None else address["id"]
+                if address_ref == address["id"]:
+                    yield address
+                yield relationship("uses", threat_actor_ref, address_ref)
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def write_address_list(stix_dir, rows, threat_actor_ref, created=None, scos=False, batch_size=10000):
+    """Build the objects of an address list and write them, one atomic
+    batch of at most `batch_size` objects at a time.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        rows (iterable): rows of the list, see `build_objects`
+        threat_actor_ref (str): id of the threat actor the addresses
+            indicate, which must be in the store unless `created` is given
+        created (str): timestamp of the built objects, the `created` of the
+            threat actor by default
+        scos (bool): also write `x-defi-address` SCOs
+        batch_size (int): objects per batch
+
+    Returns:
+        dict: the numbers of "added", "changed" and "unchanged" objects
+
+    Raises:
+        AddressListError: the threat actor is not in the store (and
+            `created` is not given), or a row cannot be used
+        ChangedVersionError: a stored version changed, e.g. the role or
+            description of an address, the batches before it are written
+
+    """
+    recover(stix_dir)
+    index = FileSystemIndex(stix_dir)
+    index.refresh()
+
+    entry = index.lookup(threat_actor_ref)
+    if entry is None and created is None:
+        raise AddressListError("%s is not in %s" % (threat_actor_ref, stix_dir))
+    if created is None:
+        created = entry["created"]
+
+    manifest = Manifest(stix_dir)
+    registry = AddressRegistry(stix_dir)
+    registry.refresh(index)
+    # The objects are built here from plain strings: the fast path builds
+    # them as the regular constructors would
+    writer = BulkWriter(stix_dir, allow_custom=True, index=index, manifest=manifest, fast=True, registry=registry)
+    stix_objs = build_objects(
+        rows, threat_actor_ref, created,
+        threat_actor_name=entry.get("name") if entry is not None else None, scos=scos, registry=registry,
+    )
+
+    counts = {"added": 0, "changed": 0, "unchanged": 0}
+    for batch in _batches(stix_objs, batch_size):
+        added, changed, unchanged = manifest.classify(batch)
+        counts["added"] += len(added)
+        counts["changed"] += len(changed)
+        counts["unchanged"] += len(unchanged)
+        refuse_changed(changed)
+        if added:
+            writer.write([stix_obj for stix_obj, _ in added], digests=[digest for _, digest in added])
+    manifest.save()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m menpo.addresses", description="Build indicators from an address list")
+    parser.add_argument("path", help="CSV or JSONL address list")
+    parser.add_argument("--threat-actor", required=True, help="id of the threat actor the addresses indicate")
+    parser.add_argument("--stix-dir", default=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "db"))
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="format of the list, from its extension by default")
+    parser.add_argument("--created", help="timestamp of the objects, the threat actor's created by default")
+    parser.add_argument("--scos", action="store_true", help="also write x-defi-address SCOs")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        counts = write_address_list(
+            args.stix_dir, read_rows(args.path, args.format), args.threat_actor,
+            created=args.created, scos=args.scos, batch_size=args.batch_size,
+        )
+    except (AddressListError, ChangedVersionError) as e:
+        print("Error:", e, file=sys.stderr)
+        return 1
+
+    print(f"{counts['added']} added, {counts['changed']} changed, {counts['unchanged']} unchanged "
+          f"in {time.perf_counter() - start:.3f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""Bloom filter over string keys.
+
+A Bloom filter answers "certainly not in the set" or "maybe in the set"
+from a few bits per key: `m` bits and `k` probes are sized from the number
+of keys and the acceptable false positive rate,
+
+    m = -n ln(p) / ln(2)^2        k = m / n ln(2)
+
+The `k` probes are derived from the first 64 bits of the BLAKE2b digest of
+the key by enhanced double hashing (Dillinger and Manolios), so the bits of
+a key do not depend on the process (unlike `hash()`) and a filter can be
+written to a file (`to_bytes`) and read by another process (`from_buffer`):
+
+    from menpo.bloom import BloomFilter
+
+    bloom = BloomFilter.from_keys(["ethereum:0x57a7..."], error_rate=0.001)
+    "ethereum:0x57a7..." in bloom
+"""
+import hashlib
+import math
+import struct
+
+# Error rate used when none is given
+DEFAULT_ERROR_RATE = 0.001
+
+# Probes are taken modulo the size, from 32-bit hashes
+MAX_SIZE = 2 ** 32
+
+# Count, size in bits and probes, before the bits
+_HEADER = struct.Struct("<QQB")
+
+_HASHES = struct.Struct("<II")
+_blake2b = hashlib.blake2b
+
+
+def _hashes(key):
+    # The default digest size is the fastest to ask for, and 32-bit halves
+    # keep the probe arithmetic on small ints
+    return _HASHES.unpack_from(_blake2b(key.encode("utf-8")).digest())
+
+
+class BloomFilter(object):
+    """Set membership with false positives.
+
+    Args:
+        capacity (int): the number of keys the filter is sized for
+        error_rate (float): the false positive rate once `capacity` keys
+            are added
+
+    Attributes:
+        size (int): the number of bits, `m`
+        probes (int): the number of bits of a key, `k`
+
+    """
+    def __init__(self, capacity, error_rate=DEFAULT_ERROR_RATE):
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1, not %r" % (error_rate,))
+        capacity = max(int(capacity), 1)
+        size = -capacity * math.log(error_rate) / math.log(2) ** 2
+        self.probes = max(int(round(size / capacity * math.log(2))), 1)
+        # At least 64 bits: the probes of tiny filters would overlap
+        self.size = max(int(math.ceil(size)), 64)
+        if self.size > MAX_SIZE:
+            raise ValueError("a filter of %d bits is larger than %d bits" % (self.size, MAX_SIZE))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    @classmethod
+    def from_keys(cls, keys, error_rate=DEFAULT_ERROR_RATE):
+        """Return a filter sized for, and holding, `keys`."""
+        keys = list(keys)
+        bloom = cls(len(keys), error_rate)
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    @classmethod
+    def from_buffer(cls, buffer, offset=0):
+        """Read a filter written by `to_bytes`.
+
+        Args:
+            buffer (bytes): data holding the filter
+            offset (int): where the filter starts in `buffer`
+
+        Returns:
+            tuple: the filter, and the offset of the end of its data
+
+        Raises:
+            ValueError: if the data is truncated or not a filter
+
+        """
+        if len(buffer) < offset + _HEADER.size:
+            raise ValueError("truncated Bloom filter header at offset %d" % offset)
+        count, size, probes = _HEADER.unpack_from(buffer, offset)
+        start = offset + _HEADER.size
+        end = start + (size + 7) // 8
+        if not 0 < size <= MAX_SIZE or not probes or len(buffer) < end:
+            raise ValueError("invalid or truncated Bloom filter at offset %d" % offset)
+
+        bloom = cls.__new__(cls)
+        bloom.size = size
+        bloom.probes = probes
+        bloom.count = count
+        bloom._bits = bytearray(buffer[start:end])
+        return bloom, end
+
+    def to_bytes(self):
+        """The filter as bytes: its count, size and probes, then its bits."""
+        return _HEADER.pack(self.count, self.size, self.probes) + bytes(self._bits)
+
+    def __len__(self):
+        return self.count
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self._bits.__sizeof__()
+
+    def add(self, key):
+        """Add a string key."""
+        h1, h2 = _hashes(key)
+        bits, size = self._bits, self.size
+        # Enhanced double hashing: plain double hashing (h1 + i * h2) cycles
+        # over a few bits when h2 shares a factor with the size
+        position, step = h1 % size, h2 % size
+        for i in range(1, self.probes + 1):
+            bits[position >> 3] |= 1 << (position & 7)
+            position = (position + step) % size
+            step = (step + i) % size
+        self.count += 1
+
+    def __contains__(self, key):
+        h1, h2 = _hashes(key)
+        bits, size = self._bits, self.size
+        position, step = h1 % size, h2 % size
+        for i in range(1, self.probes + 1):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+            position = (position + step) % size
+            step = (step + i) % size
+        return True
+
+    def false_positive_rate(self):
+        """The expected false positive rate with the keys added so far."""
+        return (1 - math.exp(-self.probes * self.count / self.size)) ** self.probes
@@ -0,0 +1,317 @@
+"""Atomic, batched writes into a FileSystemStore directory.
+
+`FileSystemSink.add` writes one file after the other, so a crash in the
+middle of an import leaves half an incident in `db/`.  `BulkWriter` commits
+a batch in four steps:
+
+1. every object is serialized into a flat staging directory inside the
+   store (`<stix_dir>/.menpo-stage-*`, on the same filesystem);
+2. the staged files are fsynced;
+3. a commit record listing the staged files is written and fsynced, with
+   the staging directory and the store directory: this is the commit point;
+4. the files are renamed into place and their directories fsynced, then
+   the index, the manifest, the address registry and the search index
+   (when given) are updated and saved, and the staging directory is
+   removed.
+
+A batch interrupted before step 3 is discarded, one interrupted after it is
+completed by `recover`, which every `BulkWriter` runs when it is created.
+Writers hold an exclusive lock on `<stix_dir>/.menpo-lock` while they write
+a batch and while they recover, so that recovery never touches the staging
+directory of a batch another writer is still writing.
+The index and the manifest notice files they have not recorded yet (by their
+mtime), so a crash between the renames and their update is harmless.
+
+    from menpo.bulk import BulkWriter
+
+    writer = BulkWriter("../../db", allow_custom=True)
+    writer.write_batches(stix_objs, batch_size=10000)
+"""
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+from stix2.base import _STIXBase
+from stix2.datastore import DataSourceError
+from stix2.parsing import parse
+from stix2.serialization import fp_serialize
+
+from menpo.fastbuild import FastBuilder
+from menpo.index import version_filename
+
+STAGE_PREFIX = ".menpo-stage-"
+COMMIT_FILENAME = "COMMIT"
+LOCK_FILENAME = ".menpo-lock"
+
+
+def _fsync_dir(path):
+    if os.name == "nt":
+        # Directories cannot be opened, NTFS journals their entries
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def store_lock(stix_dir):
+    """Hold the exclusive write lock of a store, waiting for other writers to
+    release it."""
+    fd = os.open(os.path.join(stix_dir, LOCK_FILENAME), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    # Gives up after 10 seconds
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is None:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        # Closing the file releases the flock
+        os.close(fd)
+
+
+def relative_path(stix_obj):
+    """Path of an object version relative to the store, as written by
+    FileSystemSink."""
+    if "modified" in stix_obj:
+        return "/".join((stix_obj["type"], stix_obj["id"], version_filename(stix_obj["modified"]) + ".json"))
+    return "/".join((stix_obj["type"], stix_obj["id"] + ".json"))
+
+
+def _staged_name(i):
+    return "%d.json" % i
+
+
+def _apply(stix_dir, stage_dir, paths):
+    # Returns the directories whose entries changed
+    made = set()
+    for i, path in enumerate(paths):
+        staged = os.path.join(stage_dir, _staged_name(i))
+        if not os.path.exists(staged):
+            # Already moved by an interrupted run
+            continue
+        target = os.path.join(stix_dir, path)
+        target_dir = os.path.dirname(target)
+        if target_dir not in made:
+            os.makedirs(target_dir, exist_ok=True)
+            made.add(target_dir)
+        os.replace(staged, target)
+    return made
+
+
+def recover(stix_dir):
+    """Complete the committed batches left by an interrupted writer and
+    discard the uncommitted ones.  Waits for the batches other writers are
+    writing, under the lock of the store.
+
+    Returns:
+        int: The number of completed batches.
+
+    """
+    with store_lock(stix_dir):
+        completed = 0
+        for name in os.listdir(stix_dir):
+            if not name.startswith(STAGE_PREFIX):
+                continue
+
+            stage_dir = os.path.join(stix_dir, name)
+            try:
+                with io.open(os.path.join(stage_dir, COMMIT_FILENAME), "r", encoding="utf-8") as f:
+                    paths = json.load(f)
+            except (IOError, ValueError):
+                paths = None
+
+            if paths is not None:
+                _apply(stix_dir, stage_dir, paths)
+                completed += 1
+            shutil.rmtree(stage_dir, ignore_errors=True)
+        return completed
+
+
+class BulkWriter(object):
+    """Writes batches of STIX objects into a FileSystemStore directory, one
+    atomic commit per batch.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        allow_custom (bool): whether to allow custom STIX content to be
+            written. Default: False
+        index (FileSystemIndex): index updated with every batch, if any
+        manifest (Manifest): manifest updated with every batch, if any
+        registry (AddressRegistry): address registry updated with every
+            batch, if any
+        search (SearchIndex): full-text search index updated with every
+            batch, if any
+        encoding (str): The encoding to use when writing the files.
+        sync (bool): sync the batches to disk before committing them.
+            Without it the writes are still atomic, but not durable.
+        validate (bool): parse dicts with stix2 before writing them.
+            Without it dicts are written as they are, which is much faster
+            but only meant for producers which build valid STIX (see
+            `menpo.stream`).
+        fast (bool): validate dicts with `menpo.fastbuild.FastBuilder`,
+            which builds the same objects several times faster.  Dicts are
+            then parsed as STIX 2.1, whatever `version` is given.
+
+    """
+    def __init__(self, stix_dir, allow_custom=False, index=None, manifest=None, encoding="utf-8", sync=True, validate=True,
+                 fast=False, registry=None, search=None):
+        if not os.path.isdir(stix_dir):
+            raise ValueError("directory path for STIX data does not exist: %s" % stix_dir)
+
+        self._stix_dir = os.path.abspath(stix_dir)
+        self.allow_custom = allow_custom
+        self.index = index
+        self.manifest = manifest
+        self.registry = registry
+        self.search = search
+        self.encoding = encoding
+        self.sync = sync
+        self.validate = validate
+        self._builder = FastBuilder(allow_custom=allow_custom) if fast else None
+        recover(self._stix_dir)
+
+    @property
+    def stix_dir(self):
+        return self._stix_dir
+
+    def _prepare(self, stix_objs, version):
+        prepared = []
+        for stix_obj in stix_objs:
+            if self.validate and not isinstance(stix_obj, _STIXBase):
+                if self._builder is not None:
+                    stix_obj = self._builder.build(stix_obj)
+                else:
+                    stix_obj = parse(stix_obj, allow_custom=self.allow_custom, version=version)
+            prepared.append((relative_path(stix_obj), stix_obj))
+        return prepared
+
+    def write(self, stix_objs, overwrite=False, version=None, digests=None):
+        """Write one batch of objects, atomically.
+
+        Args:
+            stix_objs (list): STIX objects (stix2 objects or dicts)
+            overwrite (bool): replace version files which already exist,
+                instead of refusing the whole batch
+            version (str): passed to `parse` for dicts
+            digests (list): content hashes of `stix_objs`, in the same order,
+                when already known (e.g. from `Manifest.classify`)
+
+        Returns:
+            int: The number of written objects.
+
+        Raises:
+            DataSourceError: a version file already exists (and `overwrite`
+                is False), or the batch contains the same version twice.
+
+        """
+        prepared = self._prepare(stix_objs, version)
+        if not prepared:
+            return 0
+
+        with store_lock(self._stix_dir):
+            self._write(prepared, overwrite, digests)
+        return len(prepared)
+
+    def _write(self, prepared, overwrite, digests):
+        paths = set()
+        for path, _ in prepared:
+            if path in paths or (not overwrite and os.path.isfile(os.path.join(self._stix_dir, path))):
+                raise DataSourceError("Attempted to overwrite file (!) at: %s" % os.path.join(self._stix_dir, path))
+            paths.add(path)
+
+        stage_dir = tempfile.mkdtemp(dir=self._stix_dir, prefix=STAGE_PREFIX)
+        try:
+            for i, (_, stix_obj) in enumerate(prepared):
+                with io.open(os.path.join(stage_dir, _staged_name(i)), "w", encoding=self.encoding) as f:
+                    if isinstance(stix_obj, _STIXBase):
+                        fp_serialize(stix_obj, f, pretty=True, encoding=self.encoding, ensure_ascii=False)
+                    else:
+                        f.write(json.dumps(stix_obj, indent=4, ensure_ascii=False))
+                    if self.sync:
+                        f.flush()
+                        os.fsync(f.fileno())
+
+            # The commit record lists the targets in staging order
+            ordered = [path for path, _ in prepared]
+            commit_path = os.path.join(stage_dir, COMMIT_FILENAME)
+            with io.open(commit_path, "w", encoding="utf-8") as f:
+                json.dump(ordered, f)
+                if self.sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            if self.sync:
+                # The entries of the staged files and of the staging directory
+                _fsync_dir(stage_dir)
+                _fsync_dir(self._stix_dir)
+        except BaseException:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+            raise
+
+        made = _apply(self._stix_dir, stage_dir, ordered)
+        if self.sync:
+            # The renamed entries, and the object and type directories which
+            # may have been created for them
+            for directory in made | {os.path.dirname(directory) for directory in made}:
+                _fsync_dir(directory)
+
+        for i, (_, stix_obj) in enumerate(prepared):
+            if self.index is not None:
+                self.index.update(stix_obj)
+            if self.manifest is not None:
+                self.manifest.record(stix_obj, digests[i] if digests is not None else None)
+            if self.registry is not None:
+                self.registry.record(stix_obj)
+            if self.search is not None:
+                self.search.record(stix_obj)
+        if self.index is not None:
+            self.index.save()
+        if self.manifest is not None:
+            self.manifest.save()
+        if self.registry is not None:
+            self.registry.save()
+        if self.search is not None:
+            self.search.save()
+
+        shutil.rmtree(stage_dir, ignore_errors=True)
+
+    def write_batches(self, stix_objs, batch_size=10000, overwrite=False, version=None):
+        """Write any number of objects (e.g. a generator) in batches of
+        `batch_size`, each batch being committed on its own.
+
+        Returns:
+            int: The number of written objects.
+
+        """
+        written = 0
+        batch = []
+        for stix_obj in stix_objs:
+            batch.append(stix_obj)
+            if len(batch) >= batch_size:
+                written += self.write(batch, overwrite=overwrite, version=version)
+                batch = []
+        if batch:
+            written += self.write(batch, overwrite=overwrite, version=version)
+        return written
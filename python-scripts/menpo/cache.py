@@ -0,0 +1,154 @@
+"""Bounded LRU cache of `get` in front of any STIX DataSource.
+
+Cached objects are checked before being returned, in one of two ways:
+
+- for filesystem sources (anything with a `stix_dir`), against the mtime of
+  the object directory, which changes whenever a version is added, so a hit
+  costs one stat() instead of a directory listing and a JSON parse;
+- otherwise against a store generation counter, a callable supplied by the
+  caller: the whole cache is dropped whenever its value changes.
+
+A source with neither could serve stale objects forever, and is refused.
+"""
+import os
+
+from collections import OrderedDict
+
+from stix2.datastore import DataSource
+
+from menpo.extract import latest_by_id
+
+
+class CachedSource(DataSource):
+    """DataSource wrapper which caches the latest version of objects by id
+    and STIX version.
+
+    `query`, `all_versions`, `relationships` and `related_to` go to the
+    wrapped source, objects returned by `related_to` are added to the cache
+    so that a following `get` of the same id is a hit.  Any other attribute
+    (e.g. `stix_dir` or `index`) is read from the wrapped source.
+
+    Args:
+        source (DataSource): the source to wrap
+        maxsize (int): maximum number of cached objects
+        generation (callable): returns a value which changes whenever the
+            wrapped store is written to.  Used for sources without a
+            `stix_dir`, where it is the only invalidation.
+
+    Raises:
+        ValueError: the source has no `stix_dir` and no `generation` is
+            given, so nothing would invalidate the cache
+
+    """
+    def __init__(self, source, maxsize=1024, generation=None):
+        super(CachedSource, self).__init__()
+        self.source = source
+        self.maxsize = maxsize
+        self.generation = generation
+        self.hits = 0
+        self.misses = 0
+
+        self._stix_dir = getattr(source, "stix_dir", None)
+        if self._stix_dir is None and generation is None:
+            raise ValueError("a source without a stix_dir needs a generation to invalidate the cache")
+        self._generation_value = generation() if generation else None
+        self._cache = OrderedDict()
+
+    def __getattr__(self, name):
+        # Only called for attributes CachedSource does not define itself
+        if name == "source":
+            raise AttributeError(name)
+        return getattr(self.source, name)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _token(self, stix_id):
+        """Validity token of a cached object, None when nothing can be
+        checked for it."""
+        if self._stix_dir is None:
+            return None
+
+        type_dir = os.path.join(self._stix_dir, stix_id.split("--")[0])
+        for path in (os.path.join(type_dir, stix_id), os.path.join(type_dir, stix_id + ".json")):
+            try:
+                return os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+        return None
+
+    def _check_generation(self):
+        if self.generation is None:
+            return
+        value = self.generation()
+        if value != self._generation_value:
+            self._generation_value = value
+            self._cache.clear()
+
+    def _store(self, key, token, stix_obj):
+        self._cache[key] = (token, stix_obj)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def invalidate(self, stix_id=None):
+        """Drop one cached object (in every STIX version), or all of them."""
+        if stix_id is None:
+            self._cache.clear()
+        else:
+            for key in [key for key in self._cache if key[0] == stix_id]:
+                del self._cache[key]
+
+    def get(self, stix_id, version=None, _composite_filters=None):
+        """Retrieve the latest version of a STIX object, from the cache when
+        it is still valid.  See `DataSource.get`."""
+        if _composite_filters or self.filters:
+            return self.source.get(stix_id, _composite_filters=self._filters(_composite_filters), **self._version(version))
+
+        self._check_generation()
+        key = (stix_id, version)
+        token = self._token(stix_id)
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == token:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        stix_obj = self.source.get(stix_id, **self._version(version))
+        self._store(key, token, stix_obj)
+        return stix_obj
+
+    @staticmethod
+    def _version(version):
+        # Not every DataSource takes a version argument (e.g. MemorySource)
+        return {"version": version} if version is not None else {}
+
+    def _filters(self, _composite_filters):
+        filters = list(self.filters)
+        if _composite_filters:
+            filters.extend(_composite_filters)
+        return filters or None
+
+    def all_versions(self, stix_id, version=None, _composite_filters=None):
+        return self.source.all_versions(stix_id, _composite_filters=self._filters(_composite_filters), **self._version(version))
+
+    def query(self, query=None, version=None, _composite_filters=None):
+        return self.source.query(query, _composite_filters=self._filters(_composite_filters), **self._version(version))
+
+    def relationships(self, *args, **kwargs):
+        return self.source.relationships(*args, **kwargs)
+
+    def related_to(self, *args, **kwargs):
+        results = self.source.related_to(*args, **kwargs)
+        if self.filters or kwargs.get("filters") or len(args) > 4:
+            return results
+
+        # Without filters, all the versions of every related object are
+        # returned, so the latest one of each can be cached, as a `get`
+        # without a STIX version would return it
+        self._check_generation()
+        for stix_id, stix_obj in latest_by_id(results).items():
+            self._store((stix_id, None), self._token(stix_id), stix_obj)
+
+        return results
@@ -0,0 +1,178 @@
+"""Subgraph extraction for report closures.
+
+A report closure is the report itself, the objects in its `object_refs` and
+everything reachable from them through relationships (in both directions),
+together with the relationships that were followed.  It is computed with an
+iterative breadth-first search, so large incidents do not hit the recursion
+limit, and all objects are loaded with one batched query at the end.
+"""
+from collections import deque
+
+from stix2 import Bundle, Filter
+
+from menpo.index import normalize_timestamp
+
+
+def _modified(stix_obj):
+    # Timestamps with different precisions (or datetimes) compare correctly
+    # once normalized
+    return normalize_timestamp(stix_obj["modified"]) if "modified" in stix_obj else ""
+
+
+def latest_by_id(stix_objs):
+    """Map each STIX id to the most recent of the given versions."""
+    latest = {}
+    for stix_obj in stix_objs:
+        modified = _modified(stix_obj)
+        current = latest.get(stix_obj["id"])
+        if current is None or modified > current[0]:
+            latest[stix_obj["id"]] = (modified, stix_obj)
+    return {stix_id: stix_obj for stix_id, (_, stix_obj) in latest.items()}
+
+
+def load_objects(source, stix_ids):
+    """Load the latest version of several objects with one query.
+
+    Args:
+        source (DataSource): where to read the objects from
+        stix_ids (iterable): the STIX ids to load
+
+    Returns:
+        dict: STIX id to STIX object.  Ids which are not in `source` are
+            missing from the result.
+
+    """
+    stix_ids = tuple(stix_ids)
+    if not stix_ids:
+        return {}
+    return latest_by_id(source.query([Filter("id", "in", stix_ids)]))
+
+
+class _Edges(object):
+    """Yields `(relationship_id, other_id)` pairs for a node, from the
+    adjacency index when the source (or its index) has one, or from `source.relationships`
+    otherwise (keeping the relationship objects around, so that they are not
+    loaded twice)."""
+
+    def __init__(self, source, relationship_types):
+        self.source = source
+        self.relationship_types = set(relationship_types) if relationship_types else None
+        self.adjacency = getattr(source, "adjacency", None)
+        if self.adjacency is None:
+            self.adjacency = getattr(getattr(source, "index", None), "adjacency", None)
+        self.loaded = {}
+
+    def __call__(self, node_id):
+        edges = []
+        if self.adjacency is not None:
+            for relationship_id in self.adjacency.relationships(node_id):
+                source_ref, target_ref, relationship_type = self.adjacency.edge(relationship_id)
+                edges.append((relationship_id, relationship_type, source_ref, target_ref))
+        else:
+            for relationship in self.source.relationships(node_id):
+                self.loaded[relationship["id"]] = relationship
+                edges.append((
+                    relationship["id"], relationship["relationship_type"],
+                    relationship["source_ref"], relationship["target_ref"],
+                ))
+
+        edges.sort()
+        for relationship_id, relationship_type, source_ref, target_ref in edges:
+            if self.relationship_types is not None and relationship_type not in self.relationship_types:
+                continue
+            other_id = target_ref if source_ref == node_id else source_ref
+            yield relationship_id, other_id
+
+
+def extract_subgraph_ids(source, root_ids, max_depth=None, max_fanout=None, relationship_types=None):
+    """Breadth-first search from `root_ids` through relationships.
+
+    Args:
+        source (DataSource): where to look relationships up
+        root_ids (iterable): ids the search starts from, at depth 0
+        max_depth (int): nodes at this depth are not expanded any further.
+            None (the default) means no limit.
+        max_fanout (int): maximum number of relationships followed from a
+            single node. None (the default) means no limit.
+        relationship_types (iterable): only follow relationships of these
+            types. None (the default) follows all of them.
+
+    Returns:
+        list: every reached id, in BFS order, including the ids of the
+            followed relationships.
+
+    """
+    edges = _Edges(source, relationship_types)
+    return _search(edges, root_ids, max_depth, max_fanout)
+
+
+def _search(edges, root_ids, max_depth, max_fanout):
+    visited = set()
+    ordered = []
+    queue = deque()
+
+    for root_id in root_ids:
+        if root_id is not None and root_id not in visited:
+            visited.add(root_id)
+            ordered.append(root_id)
+            queue.append((root_id, 0))
+
+    while queue:
+        node_id, depth = queue.popleft()
+        if max_depth is not None and depth >= max_depth:
+            continue
+
+        for followed, (relationship_id, other_id) in enumerate(edges(node_id)):
+            if max_fanout is not None and followed >= max_fanout:
+                break
+
+            if relationship_id not in visited:
+                visited.add(relationship_id)
+                ordered.append(relationship_id)
+
+            if other_id not in visited:
+                visited.add(other_id)
+                ordered.append(other_id)
+                queue.append((other_id, depth + 1))
+
+    return ordered
+
+
+def extract_report(source, report, max_depth=None, max_fanout=None, relationship_types=None):
+    """Extract the closure of a report, in a single pass.
+
+    Args:
+        source (DataSource): where to read the objects from, an
+            `IndexedFileSystemSource` avoids reading any relationship file
+            during the search.
+        report (STIX object OR dict OR str): the report (or its ID)
+        max_depth (int): see `extract_subgraph_ids`, the objects in
+            `object_refs` are at depth 0.
+        max_fanout (int): see `extract_subgraph_ids`
+        relationship_types (iterable): see `extract_subgraph_ids`
+
+    Returns:
+        list: The report followed by the objects of its closure, in BFS
+            order.  Referenced ids missing from `source` are skipped.
+
+    """
+    if isinstance(report, str):
+        report = source.get(report)
+        if report is None:
+            return []
+
+    edges = _Edges(source, relationship_types)
+    stix_ids = _search(edges, report.get("object_refs", []), max_depth, max_fanout)
+
+    loaded = dict(edges.loaded)
+    loaded[report["id"]] = report
+    loaded.update(load_objects(source, (i for i in stix_ids if i not in loaded)))
+
+    objects = [report]
+    objects.extend(loaded[i] for i in stix_ids if i in loaded and i != report["id"])
+    return objects
+
+
+def extract_report_bundle(source, report, **kwargs):
+    """Like `extract_report`, wrapped in a STIX 2.1 Bundle."""
+    return Bundle(objects=extract_report(source, report, **kwargs), allow_custom=True)
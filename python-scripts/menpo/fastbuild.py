@@ -0,0 +1,406 @@
+"""Fast construction of stix2 objects from trusted bulk sources.
+
+Building a stix2 object from a dict goes through `_STIXBase.__init__`, which
+finds out the property order and the custom properties of every object,
+cleans every property through its generic `Property.clean`, parses
+timestamps with `strptime` and, for indicators, runs the STIX pattern
+grammar (ANTLR) over the pattern.  On bulk imports this is most of the time
+spent (see `menpo.bulk`).
+
+`FastBuilder` compiles, once per type, the properties of the Menpo types
+(`FAST_TYPES`) and of the registered toplevel extensions (`x_defi_*`) into
+specialized validators: type checks for strings, a regex for ids and plain
+UTC timestamps, cached type checks for references, and a regex for the
+`x-defi-address` / `x-defi-transaction` patterns written by `menpo.addresses`
+and the `data-input` scripts.  It then fills the stix2 instance directly,
+so the objects it returns are regular stix2 objects, equal to and serialized
+like the ones the regular constructors build.  Values the fast validators do
+not recognize go through the regular `Property.clean`, patterns of another
+shape through the pattern validator, and objects of other types or with
+custom properties through `stix2.parse`.
+
+Filling the instance relies on private attributes of stix2 3.0 (see
+`requirements.txt`).  With any other stix2 version, every object goes
+through `stix2.parse`:
+
+    from menpo.fastbuild import FastBuilder
+
+    builder = FastBuilder(allow_custom=True)
+    stix_objs = builder.build_batch(stix_dicts)
+"""
+import functools
+import re
+
+import pytz
+import stix2
+
+from stix2.exceptions import CustomContentError, InvalidValueError, MissingPropertiesError
+from stix2.parsing import parse
+from stix2.properties import (
+    BooleanProperty, EnumProperty, IDProperty, IntegerProperty, ListProperty,
+    OpenVocabProperty, PatternProperty, ReferenceProperty, StringProperty,
+    TimestampProperty,
+)
+from stix2.registry import class_for_type
+from stix2.utils import NOW, Precision, PrecisionConstraint, STIXdatetime, get_timestamp, to_enum
+from stix2patterns.validator import run_validator
+
+from menpo import schema  # noqa: F401 (registers the Menpo extensions and SCOs)
+
+# The stix2 versions whose private attributes `FastBuilder.build` sets
+FAST_STIX2_VERSIONS = ("3.0.",)
+FAST_PATH = stix2.__version__.startswith(FAST_STIX2_VERSIONS)
+
+FAST_TYPES = (
+    "attack-pattern", "identity", "indicator", "note", "relationship",
+    "report", "threat-actor", "x-defi-address", "x-defi-transaction",
+)
+
+_UUID = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[89ab][0-9a-f]{3}-[0-9a-f]{12}"
+_ID = re.compile(r"([a-z0-9][a-z0-9-]*[a-z0-9])--" + _UUID)
+
+_TIMESTAMP = re.compile(r"(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d{1,6}))?Z")
+
+# The pattern shapes Menpo writes: comparisons of x-defi-address and
+# x-defi-transaction properties with string literals, joined by AND and OR,
+# with parenthesized OR groups, in one observation
+_STRING = r"'(?:[^'\\]|\\['\\])*'"
+_COMPARISON = r"x-defi-(?:address|transaction):(?:value|blockchain) = " + _STRING
+_TERM = r"(?:%s|\(%s(?: OR %s)*\))" % (_COMPARISON, _COMPARISON, _COMPARISON)
+_MENPO_PATTERN = re.compile(r"\[%s(?: (?:AND|OR) %s)*\]" % (_TERM, _TERM))
+
+
+@functools.lru_cache(maxsize=4096)
+def _pattern_errors(pattern, pattern_version):
+    return run_validator(pattern, pattern_version)
+
+
+def check_pattern(pattern, pattern_version="2.1"):
+    """Raise ValueError when a STIX pattern is not valid, as the Indicator
+    constructor does, without running the pattern grammar over the Menpo
+    pattern shapes."""
+    if _MENPO_PATTERN.fullmatch(pattern):
+        return
+    errors = _pattern_errors(pattern, pattern_version)
+    if errors:
+        raise ValueError(str(errors[0]))
+
+
+def _fallback(prop):
+    def clean(value, allow_custom):
+        return prop.clean(value, allow_custom)
+    return clean
+
+
+def _timestamp_cleaner(prop):
+    precision = to_enum(prop.precision, Precision)
+    precision_constraint = to_enum(prop.precision_constraint, PrecisionConstraint)
+    exact = precision_constraint == PrecisionConstraint.EXACT
+    fallback = _fallback(prop)
+
+    def clean(value, allow_custom):
+        match = _TIMESTAMP.fullmatch(value) if type(value) is str else None
+        if match is None:
+            return fallback(value, allow_custom)
+
+        year, month, day, hour, minute, second, fraction = match.groups()
+        microsecond = int(fraction.ljust(6, "0")) if fraction else 0
+        if exact and precision == Precision.SECOND:
+            microsecond = 0
+        elif exact and precision == Precision.MILLISECOND:
+            microsecond = microsecond // 1000 * 1000
+        return STIXdatetime(
+            int(year), int(month), int(day), int(hour), int(minute), int(second), microsecond, pytz.utc,
+            precision=precision, precision_constraint=precision_constraint,
+        ), False
+    return clean
+
+
+def _id_cleaner(prop):
+    prefix = prop.required_prefix
+    fallback = _fallback(prop)
+
+    def clean(value, allow_custom):
+        if type(value) is str and value.startswith(prefix) and _ID.fullmatch(value):
+            return value, False
+        return fallback(value, allow_custom)
+    return clean
+
+
+def _reference_cleaner(prop):
+    fallback = _fallback(prop)
+    # The type checks of a reference only depend on the referenced type
+    checked = {}
+
+    def clean(value, allow_custom):
+        match = _ID.fullmatch(value) if type(value) is str else None
+        if match is None:
+            return fallback(value, allow_custom)
+
+        key = (match.group(1), allow_custom)
+        has_custom = checked.get(key)
+        if has_custom is None:
+            _, has_custom = fallback(value, allow_custom)
+            checked[key] = has_custom
+        return value, has_custom
+    return clean
+
+
+def _list_cleaner(prop):
+    fallback = _fallback(prop)
+    if not isinstance(prop.contained, (StringProperty, ReferenceProperty)):
+        return fallback
+    contained = _cleaner(prop.contained)
+
+    def clean(value, allow_custom):
+        if type(value) is not list or not value:
+            return fallback(value, allow_custom)
+        result = []
+        has_custom = False
+        for item in value:
+            item, item_custom = contained(item, allow_custom)
+            result.append(item)
+            has_custom = has_custom or item_custom
+        if has_custom and not allow_custom:
+            raise CustomContentError("custom content encountered")
+        return result, has_custom
+    return clean
+
+
+def _cleaner(prop):
+    """The compiled validator of a property: `clean(value, allow_custom)`
+    returning `(value, has_custom)`, like `Property.clean`."""
+    if hasattr(prop, "_fixed_value"):
+        return prop.clean
+    if isinstance(prop, TimestampProperty):
+        return _timestamp_cleaner(prop)
+    if isinstance(prop, IDProperty):
+        return _id_cleaner(prop)
+    if isinstance(prop, ReferenceProperty):
+        return _reference_cleaner(prop)
+    if isinstance(prop, ListProperty):
+        return _list_cleaner(prop)
+
+    fallback = _fallback(prop)
+    if isinstance(prop, EnumProperty):
+        allowed = frozenset(prop.allowed)
+
+        def clean(value, allow_custom):
+            if type(value) is str and value in allowed:
+                return value, False
+            return fallback(value, allow_custom)
+        return clean
+    if type(prop) in (StringProperty, OpenVocabProperty, PatternProperty):
+        def clean(value, allow_custom):
+            if type(value) is str:
+                return value, False
+            return fallback(value, allow_custom)
+        return clean
+    if isinstance(prop, IntegerProperty):
+        def clean(value, allow_custom):
+            if type(value) is int and (prop.min is None or value >= prop.min) and (prop.max is None or value <= prop.max):
+                return value, False
+            return fallback(value, allow_custom)
+        return clean
+    if isinstance(prop, BooleanProperty):
+        def clean(value, allow_custom):
+            if value is True or value is False:
+                return value, False
+            return fallback(value, allow_custom)
+        return clean
+    return fallback
+
+
+def _compile_properties(properties):
+    compiled = []
+    for name, prop in properties.items():
+        default = None
+        if hasattr(prop, "default"):
+            default = prop.default
+        compiled.append((name, prop, _cleaner(prop), default))
+    return compiled
+
+
+def _constant_defaults(properties):
+    # Optional properties whose default is a constant: objects which hold
+    # that value remember it, serialization leaves them out
+    constants = []
+    for name, prop in properties.items():
+        if prop.required or hasattr(prop, "_fixed_value") or not hasattr(prop, "default"):
+            continue
+        value = prop.default()
+        if value is not NOW and not isinstance(prop, IDProperty) and value == prop.default():
+            constants.append((name, value))
+    return constants
+
+
+class _CompiledType(object):
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.properties = _compile_properties(cls._properties)
+        self.names = frozenset(cls._properties)
+        self.required = frozenset(name for name, prop in cls._properties.items() if prop.required)
+        self.constant_defaults = _constant_defaults(cls._properties)
+        self.is_indicator = cls._type == "indicator"
+        self.is_observable = hasattr(cls, "_id_contributing_properties")
+        self._extensions = {}
+
+    def extension_properties(self, extensions):
+        """The toplevel properties of the extensions of an object, as a
+        dict (in the order stix2 merges them) and compiled, None when one of
+        them is not registered."""
+        key = tuple(
+            ext_id for ext_id, ext in extensions.items()
+            if isinstance(ext, dict) and ext.get("extension_type") == "toplevel-property-extension"
+        )
+        if key not in self._extensions:
+            properties = {}
+            for ext_id in key:
+                ext_class = class_for_type(ext_id, "2.1", "extensions")
+                if ext_class is None:
+                    self._extensions[key] = None
+                    break
+                properties.update(ext_class._toplevel_properties)
+            else:
+                self._extensions[key] = (
+                    properties,
+                    {name: compiled for name, compiled in zip(properties, _compile_properties(properties))},
+                    frozenset(name for name, prop in properties.items() if prop.required),
+                    _constant_defaults(properties),
+                )
+        return self._extensions[key]
+
+
+class FastBuilder(object):
+    """Builds stix2 objects from dicts with validators compiled once per
+    type.
+
+    Args:
+        allow_custom (bool): whether to allow custom STIX content, as for
+            `stix2.parse`
+        types (tuple): the types built on the fast path, other types are
+            parsed by stix2.  No type is when the stix2 version is not one
+            of `FAST_STIX2_VERSIONS`.
+
+    Attributes:
+        fallbacks (int): the number of dicts which were parsed by stix2
+
+    """
+    def __init__(self, allow_custom=False, types=FAST_TYPES):
+        self.allow_custom = allow_custom
+        self.fallbacks = 0
+        self._types = {}
+        for stix_type in types if FAST_PATH else ():
+            cls = class_for_type(stix_type, "2.1", "observables") or class_for_type(stix_type, "2.1", "objects")
+            if cls is not None:
+                self._types[stix_type] = _CompiledType(cls)
+
+    def _parse(self, stix_dict):
+        self.fallbacks += 1
+        return parse(stix_dict, allow_custom=self.allow_custom)
+
+    def build(self, stix_dict):
+        """Build one object, see `stix2.parse`.
+
+        Raises:
+            InvalidValueError, MissingPropertiesError: as the regular
+                constructors do
+
+        """
+        compiled = self._types.get(stix_dict.get("type")) if isinstance(stix_dict, dict) else None
+        if compiled is None or stix_dict.get("spec_version", "2.1") != "2.1":
+            return self._parse(stix_dict)
+        if compiled.is_observable and "id" not in stix_dict:
+            # stix2 derives the id from the ID contributing properties
+            return self._parse(stix_dict)
+
+        cls = compiled.cls
+        properties = compiled.properties
+        names = compiled.names
+        required = compiled.required
+        constant_defaults = compiled.constant_defaults
+        extensions = stix_dict.get("extensions")
+        if extensions:
+            extension = compiled.extension_properties(extensions)
+            if extension is None:
+                return self._parse(stix_dict)
+            registered, compiled_extension, extension_required, extension_defaults = extension
+            # stix2 orders the toplevel properties as this set does
+            order = registered.keys() | (stix_dict.keys() - cls._properties.keys() - set())
+            properties = properties + [compiled_extension[name] for name in order if name in compiled_extension]
+            names = names | registered.keys()
+            required = required | extension_required
+            constant_defaults = constant_defaults + extension_defaults
+
+        if not stix_dict.keys() <= names or "granular_markings" in stix_dict:
+            # Custom properties, or markings which need the full checks
+            return self._parse(stix_dict)
+
+        if compiled.is_indicator and stix_dict.get("pattern") and stix_dict.get("pattern_type") == "stix" \
+                and not stix_dict.get("pattern_version"):
+            stix_dict = dict(stix_dict, pattern_version="2.1")
+
+        allow_custom = self.allow_custom
+        inner = {}
+        has_custom = False
+        now = None
+        for name, prop, clean, default in properties:
+            value = stix_dict.get(name)
+            if value is None or (type(value) is list and not value):
+                if default is None:
+                    continue
+                value = default()
+                if value is NOW:
+                    if now is None:
+                        now = get_timestamp()
+                    value = now
+            try:
+                inner[name], custom = clean(value, allow_custom)
+            except InvalidValueError:
+                raise
+            except Exception as e:
+                raise InvalidValueError(cls, name, reason=str(e)) from e
+            has_custom = has_custom or custom
+
+        missing = required - inner.keys()
+        if missing:
+            raise MissingPropertiesError(cls, missing)
+
+        stix_obj = cls.__new__(cls)
+        stix_obj._defaulted_optional_properties = [
+            name for name, value in constant_defaults if name in inner and inner[name] == value
+        ]
+        stix_obj._inner = inner
+        stix_obj._STIXBase__has_custom = has_custom if allow_custom else False
+        if compiled.is_observable:
+            stix_obj._STIXBase__valid_refs = []
+
+        if compiled.is_indicator:
+            self._check_indicator(stix_obj)
+        else:
+            stix_obj._check_object_constraints()
+        return stix_obj
+
+    def _check_indicator(self, indicator):
+        # Indicator._check_object_constraints, with the fast pattern check
+        valid_from = indicator.get("valid_from")
+        valid_until = indicator.get("valid_until")
+        if valid_from and valid_until and valid_until <= valid_from:
+            raise ValueError("{0.id} 'valid_until' must be greater than 'valid_from'".format(indicator))
+
+        if indicator.get("pattern_type") == "stix":
+            try:
+                check_pattern(indicator["pattern"], indicator.get("pattern_version") or "2.1")
+            except ValueError as e:
+                raise InvalidValueError(indicator.__class__, "pattern", str(e)) from e
+
+    def build_batch(self, stix_dicts):
+        """Build a batch of objects, in order.
+
+        Returns:
+            list: the stix2 objects
+
+        """
+        build = self.build
+        return [build(stix_dict) for stix_dict in stix_dicts]
@@ -0,0 +1,153 @@
+"""Local "possibly flagged" check of wallet addresses, per blockchain.
+
+Wallet clients and edge services cannot load the STIX db.  They load a
+filter file written by `menpo.flagged_export` instead: one Bloom filter
+(see `menpo.bloom`) per blockchain over the flagged addresses, normalized
+as in `menpo.normalize`, and one for the `*` blockchain over the addresses
+flagged on any blockchain.  A negative answer is certain; a positive one is
+wrong at the false positive rate the file was exported with, and should be
+confirmed against Menpo (`menpo.lookup`).
+
+This module, `menpo.bloom` and `menpo.normalize` only use the standard
+library, and can be copied where stix2 is not installed.
+
+File format, little-endian:
+
+    magic       8 bytes   b"MENPOFLT"
+    version     u16       FORMAT_VERSION
+    blockchains u16
+    then for every blockchain
+        name    u8 length, then UTF-8
+        filter  see BloomFilter.to_bytes: count u64, size in bits u64,
+                probes u8, then the bits
+
+    cd python-scripts
+    python3 -m menpo.flagged flagged.bin 0x57A72cE4fd69eBEdEfC1a938b690fbf11A7Dff80 [--blockchain polygon]
+"""
+import argparse
+import io
+import struct
+import sys
+
+from menpo.bloom import BloomFilter
+from menpo.normalize import ANY_BLOCKCHAIN, normalize_address
+
+MAGIC = b"MENPOFLT"
+
+# Bump whenever the format changes, loaders refuse other versions.  2: the
+# `*` filter
+FORMAT_VERSION = 2
+
+_HEADER = struct.Struct("<8sHH")
+
+
+class FilterFormatError(ValueError):
+    """Raised when a filter file is not in the supported format."""
+    pass
+
+
+class FlaggedFilters(object):
+    """Bloom filters of flagged addresses by blockchain.
+
+    Args:
+        filters (dict): `BloomFilter` by lowercased blockchain, `*` for
+            the addresses flagged on any blockchain
+
+    """
+    def __init__(self, filters=None):
+        self.filters = dict(filters or {})
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Read filters written by `to_bytes`.
+
+        Raises:
+            FilterFormatError: if the data is not a filter file of this
+                version
+
+        """
+        if len(data) < _HEADER.size:
+            raise FilterFormatError("truncated filter file")
+        magic, version, count = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise FilterFormatError("not a Menpo filter file")
+        if version != FORMAT_VERSION:
+            raise FilterFormatError("filter file version %d, version %d is supported" % (version, FORMAT_VERSION))
+
+        filters = {}
+        offset = _HEADER.size
+        try:
+            for _ in range(count):
+                length = data[offset]
+                blockchain = bytes(data[offset + 1:offset + 1 + length]).decode("utf-8")
+                filters[blockchain], offset = BloomFilter.from_buffer(data, offset + 1 + length)
+        except (IndexError, UnicodeDecodeError, ValueError) as e:
+            raise FilterFormatError("corrupt filter file: %s" % e)
+        return cls(filters)
+
+    @classmethod
+    def load(cls, path):
+        """Read a filter file."""
+        with io.open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    def to_bytes(self):
+        """The filters in the file format of the module docstring."""
+        chunks = [_HEADER.pack(MAGIC, FORMAT_VERSION, len(self.filters))]
+        for blockchain, bloom in sorted(self.filters.items()):
+            name = blockchain.encode("utf-8")
+            chunks.append(struct.pack("<B", len(name)) + name)
+            chunks.append(bloom.to_bytes())
+        return b"".join(chunks)
+
+    def __len__(self):
+        return sum(len(bloom) for bloom in self.filters.values())
+
+    def blockchains(self):
+        """Return the blockchains with a filter, sorted."""
+        return sorted(self.filters)
+
+    def maybe_flagged(self, blockchain, value):
+        """Whether an address may be flagged on a blockchain, or on any
+        blockchain.  False is certain, True is wrong at the false positive
+        rate of the filters."""
+        value = normalize_address(value)
+        for key in (blockchain.strip().lower(), ANY_BLOCKCHAIN):
+            bloom = self.filters.get(key)
+            if bloom is not None and value in bloom:
+                return True
+        return False
+
+    def flagged_blockchains(self, value):
+        """Return the blockchains on which an address may be flagged, `*`
+        when it may be flagged on any blockchain."""
+        value = normalize_address(value)
+        return [blockchain for blockchain, bloom in sorted(self.filters.items()) if value in bloom]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m menpo.flagged", description="Check addresses against a Menpo filter file")
+    parser.add_argument("path", help="filter file written by menpo.flagged_export")
+    parser.add_argument("addresses", nargs="+", help="address values to check")
+    parser.add_argument("--blockchain", help="only on this blockchain, every blockchain by default")
+    args = parser.parse_args(argv)
+
+    try:
+        filters = FlaggedFilters.load(args.path)
+    except (IOError, FilterFormatError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    flagged = True
+    for value in args.addresses:
+        if args.blockchain:
+            blockchains = [args.blockchain.strip().lower()] if filters.maybe_flagged(args.blockchain, value) else []
+        else:
+            blockchains = filters.flagged_blockchains(value)
+        flagged = flagged and bool(blockchains)
+        print(f"{value}: {'possibly flagged on ' + ', '.join(blockchains) if blockchains else 'not flagged'}")
+    return 0 if flagged else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""Export of the flagged addresses of a FileSystemStore directory as filters.
+
+Every address an indicator compares `x-defi-address:value` with on a given
+blockchain (see `menpo.matcher`), and every `x-defi-address` SCO (see
+`menpo.registry`), is added to the Bloom filter of its blockchain.  The
+values indicators compare on any blockchain go to the filter of the `*`
+blockchain, which `menpo.flagged` checks whatever the blockchain.  The
+filters are written in the format of `menpo.flagged`, which loads and
+queries them.
+
+Patterns which are evaluated (see `menpo.matcher`) have no finite set of
+addresses: the export refuses stores with such indicators rather than
+leave them out of the filters.
+
+    cd python-scripts
+    python3 -m menpo.flagged_export flagged.bin [--error-rate 0.001]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+
+from menpo.bloom import DEFAULT_ERROR_RATE, BloomFilter
+from menpo.flagged import FlaggedFilters
+from menpo.index import FileSystemIndex
+from menpo.matcher import IndicatorMatcher
+from menpo.normalize import ANY_BLOCKCHAIN
+from menpo.registry import ADDRESS_TYPE, AddressRegistry
+
+
+class EvaluatedPatternError(ValueError):
+    """Raised when indicators have patterns whose addresses cannot be
+    exported.
+
+    Attributes:
+        indicator_ids (list): ids of these indicators
+
+    """
+    def __init__(self, indicator_ids):
+        super().__init__("%d indicators have evaluated patterns, which cannot be exported: %s" % (
+            len(indicator_ids), ", ".join(indicator_ids),
+        ))
+        self.indicator_ids = indicator_ids
+
+
+def flagged_addresses(stix_dir, index=None):
+    """Return the normalized flagged addresses of a FileSystemStore
+    directory.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        index (FileSystemIndex): an up to date index of the store, one is
+            refreshed here by default
+
+    Returns:
+        dict: sets of normalized address values, by lowercased blockchain,
+        `*` for the values flagged on any blockchain
+
+    Raises:
+        EvaluatedPatternError: some indicators have evaluated patterns
+
+    """
+    if index is None:
+        index = FileSystemIndex(stix_dir)
+        index.refresh()
+
+    matcher = IndicatorMatcher.from_store(stix_dir, index)
+    if matcher.evaluated:
+        raise EvaluatedPatternError(matcher.evaluated)
+    addresses = {}
+    for stix_type, blockchain, value, _ in matcher.lookups(any_blockchain=True):
+        if stix_type == ADDRESS_TYPE:
+            addresses.setdefault(blockchain or ANY_BLOCKCHAIN, set()).add(value)
+
+    registry = AddressRegistry(stix_dir)
+    registry.refresh(index)
+    for _, keys in registry.items():
+        for key in keys:
+            blockchain, value = key.split(":", 1)
+            addresses.setdefault(blockchain, set()).add(value)
+    return addresses
+
+
+def build_filters(addresses, error_rate=DEFAULT_ERROR_RATE):
+    """Return the filters of `flagged_addresses`, each one sized for the
+    addresses of its blockchain."""
+    return FlaggedFilters({
+        blockchain: BloomFilter.from_keys(values, error_rate)
+        for blockchain, values in addresses.items() if values
+    })
+
+
+def write_filters(filters, path):
+    """Atomically write filters to a file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".menpo-tmp-")
+    try:
+        with io.open(fd, "wb") as f:
+            f.write(filters.to_bytes())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m menpo.flagged_export", description="Export flagged addresses as Bloom filters")
+    parser.add_argument("path", help="filter file to write")
+    parser.add_argument("--stix-dir", default=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "db"))
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_ERROR_RATE, help="false positive rate of the filters")
+    args = parser.parse_args(argv)
+
+    if not 0 < args.error_rate < 1:
+        print("Error: --error-rate must be between 0 and 1", file=sys.stderr)
+        return 1
+
+    try:
+        addresses = flagged_addresses(args.stix_dir)
+    except EvaluatedPatternError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    filters = build_filters(addresses, args.error_rate)
+    write_filters(filters, args.path)
+
+    print(f"{'blockchain':<14}{'addresses':>10}{'bytes':>10}{'probes':>8}")
+    for blockchain in filters.blockchains():
+        bloom = filters.filters[blockchain]
+        print(f"{blockchain:<14}{len(bloom):>10}{(bloom.size + 7) // 8:>10}{bloom.probes:>8}")
+    print(f"\n{len(filters)} addresses written to {args.path} ({os.path.getsize(args.path)} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
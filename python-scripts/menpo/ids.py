@@ -0,0 +1,250 @@
+"""Deterministic STIX ids, derived from the identifying properties of objects.
+
+The `data-input` scripts build their objects with random (uuid4) ids, so
+every run of a script used to write a new copy of its incident.
+`assign_ids` replaces them with uuid5 ids computed from properties which
+identify an object (and not from the ones which change between versions),
+rewriting the references between the objects of the batch accordingly:
+building the same incident twice gives the same ids, and objects which are
+already in `db/` can be recognized before anything is written.
+
+- SCOs follow the STIX 2.1 rules: uuid5 in the STIX namespace over their ID
+  contributing properties (`value` and `blockchain` for the Menpo SCOs, see
+  `menpo.schema`).
+- SDOs and SROs use a Menpo namespace over the properties listed in
+  `ID_CONTRIBUTING_PROPERTIES`, references included, which is why the
+  objects of a batch are identified in reference order.  Text which is
+  edited between versions (descriptions) never contributes: editing it
+  gives a new version of the object, not a new object.
+- Notes are the exception: the notes of a report are created together, so
+  they are told apart by the timestamp their content starts with (see
+  `menpo.timeindex.note_timeline`), which can then be reworded, or else by
+  their content.
+
+Objects of a batch which still share their contributing properties (an
+indicator written twice) are told apart by their occurrence among them, in
+batch order: the first one keeps the plain id.
+"""
+import json
+import uuid
+
+from stix2.base import SCO_DET_ID_NAMESPACE
+from stix2.canonicalization.Canonicalize import canonicalize
+from stix2.parsing import parse
+from stix2.registry import class_for_type
+
+from menpo import schema  # noqa: F401 (registers the Menpo SCOs, for _sco_properties)
+from menpo.index import normalize_timestamp
+from menpo.timeindex import note_timeline
+
+# uuid5(NAMESPACE_URL, "https://github.com/MetaMask/menpo")
+MENPO_NAMESPACE = uuid.UUID("b7a0b2db-8109-54bf-83e8-98beae4d0add")
+
+ID_CONTRIBUTING_PROPERTIES = {
+    "attack-pattern": ("name", "created"),
+    "identity": ("name", "identity_class", "created"),
+    "indicator": ("pattern", "created"),
+    "note": ("object_refs", "content", "created"),
+    "relationship": ("relationship_type", "source_ref", "target_ref"),
+    "report": ("name", "published", "created"),
+    "threat-actor": ("name", "created"),
+}
+
+# For other SDO types, every property except these ones
+VERSIONING_PROPERTIES = ("id", "modified", "spec_version", "revoked", "confidence", "labels")
+
+TIMESTAMP_PROPERTIES = ("created", "published", "first_seen", "last_seen", "valid_from")
+
+
+def _sco_properties(stix_type):
+    sco_class = class_for_type(stix_type, "2.1", "observables")
+    if sco_class is None:
+        return None
+    return getattr(sco_class, "_id_contributing_properties", None) or ()
+
+
+def deterministic_id(stix_obj, occurrence=0):
+    """The deterministic id of a STIX object (dict or stix2 object).
+
+    References must already be deterministic for the result to be.
+
+    Args:
+        stix_obj: the object
+        occurrence (int): how many objects with the same contributing
+            properties precede it in its batch
+
+    Returns:
+        str: the id
+
+    """
+    stix_type = stix_obj["type"]
+
+    sco_properties = _sco_properties(stix_type)
+    if sco_properties is not None:
+        namespace = SCO_DET_ID_NAMESPACE
+        properties = sco_properties
+    else:
+        namespace = MENPO_NAMESPACE
+        properties = ID_CONTRIBUTING_PROPERTIES.get(stix_type)
+        if properties is None:
+            properties = sorted(k for k in stix_obj if k not in VERSIONING_PROPERTIES)
+
+    contributing = {}
+    for key in properties:
+        if key not in stix_obj:
+            continue
+        value = stix_obj[key]
+        if key in TIMESTAMP_PROPERTIES:
+            value = normalize_timestamp(value)
+        contributing[key] = value
+
+    if stix_type == "note":
+        timeline = note_timeline(stix_obj)
+        if timeline is not None:
+            # Timeline notes are identified by their timestamp, not by
+            # their wording
+            contributing.pop("content", None)
+            contributing["x_menpo_timeline"] = normalize_timestamp(timeline)
+
+    if not contributing:
+        raise ValueError("%s has no id contributing property" % stix_obj["id"])
+    if occurrence:
+        contributing["x_menpo_occurrence"] = occurrence
+
+    data = canonicalize(json.loads(json.dumps(contributing, default=str)), utf8=False)
+    return "%s--%s" % (stix_type, uuid.uuid5(namespace, data))
+
+
+def _refs(stix_obj):
+    for key, value in stix_obj.items():
+        if key.endswith("_ref"):
+            yield value
+        elif key.endswith("_refs"):
+            for ref in value:
+                yield ref
+
+
+def _remap(stix_obj, id_map):
+    remapped = {}
+    for key, value in stix_obj.items():
+        if key.endswith("_ref"):
+            value = id_map.get(value, value)
+        elif key.endswith("_refs"):
+            value = [id_map.get(ref, ref) for ref in value]
+        remapped[key] = value
+    return remapped
+
+
+def assign_ids(stix_objs, allow_custom=True):
+    """Replace the ids of a batch of objects by deterministic ids.
+
+    References between objects of the batch are rewritten, references to
+    other objects are kept as they are.
+
+    Args:
+        stix_objs (list): STIX objects (stix2 objects or dicts)
+        allow_custom (bool): passed to `parse` to build the new objects
+
+    Returns:
+        list: the objects with their new ids, as stix2 objects, in the same
+        order
+
+    Raises:
+        ValueError: the references of the batch form a cycle
+
+    """
+    stix_dicts = [
+        json.loads(stix_obj.serialize()) if hasattr(stix_obj, "serialize") else dict(stix_obj)
+        for stix_obj in stix_objs
+    ]
+    batch_ids = {stix_dict["id"] for stix_dict in stix_dicts}
+
+    id_map = {}
+    occurrences = {}
+    results = [None] * len(stix_dicts)
+    pending = list(range(len(stix_dicts)))
+    while pending:
+        waiting = []
+        for i in pending:
+            stix_dict = stix_dicts[i]
+            if any(ref in batch_ids and ref not in id_map for ref in _refs(stix_dict)):
+                waiting.append(i)
+                continue
+
+            stix_dict = _remap(stix_dict, id_map)
+            new_id = deterministic_id(stix_dict)
+            occurrence = occurrences.get(new_id, 0)
+            occurrences[new_id] = occurrence + 1
+            if occurrence:
+                new_id = deterministic_id(stix_dict, occurrence)
+            id_map[stix_dict["id"]] = new_id
+            stix_dict["id"] = new_id
+            results[i] = stix_dict
+
+        if len(waiting) == len(pending):
+            raise ValueError("reference cycle between %s" % ", ".join(stix_dicts[i]["id"] for i in waiting))
+        pending = waiting
+
+    return [parse(stix_dict, allow_custom=allow_custom) for stix_dict in results]
+
+
+def _occurrences(stix_dicts):
+    # The occurrence each deterministic id was derived with, counted in batch
+    # order as `assign_ids` does (objects sharing their contributing
+    # properties share their references, so they are identified in the same
+    # pass); None for ids which are not deterministic
+    counts = {}
+    occurrences = []
+    for stix_dict in stix_dicts:
+        try:
+            base_id = deterministic_id(stix_dict)
+        except ValueError:
+            occurrences.append(None)
+            continue
+        occurrence = counts.get(base_id, 0)
+        counts[base_id] = occurrence + 1
+        if (deterministic_id(stix_dict, occurrence) if occurrence else base_id) != stix_dict["id"]:
+            occurrence = None
+        occurrences.append(occurrence)
+    return occurrences
+
+
+def remap_ids(stix_objs, id_map):
+    """Point the references of a batch of objects at other ids, as
+    `assign_ids` would have if the references had been these ids from the
+    start: the deterministic ids of the objects whose references change
+    are derived again (with the occurrence they were derived with), and so
+    are the ones of the objects which reference them, and so on.  Objects
+    whose id is not deterministic keep it.
+
+    Args:
+        stix_objs (list): STIX objects (stix2 objects or dicts)
+        id_map (dict): the new id of every id to replace
+
+    Returns:
+        list: the objects, in the same order.  Those which changed are
+        returned as dicts.
+
+    """
+    id_map = dict(id_map)
+    results = list(stix_objs)
+    remapped = True
+    while remapped:
+        # Ids only depend on references, a change settles in as many passes
+        # as there are levels of references
+        remapped = False
+        positions = [i for i, stix_obj in enumerate(results) if any(ref in id_map for ref in _refs(stix_obj))]
+        stix_dicts = [
+            json.loads(results[i].serialize()) if hasattr(results[i], "serialize") else results[i]
+            for i in positions
+        ]
+        for i, stix_dict, occurrence in zip(positions, stix_dicts, _occurrences(stix_dicts)):
+            stix_dict = _remap(stix_dict, id_map)
+            if occurrence is not None:
+                new_id = deterministic_id(stix_dict, occurrence)
+                if new_id != stix_dict["id"]:
+                    id_map[stix_dict["id"]] = new_id
+                    stix_dict["id"] = new_id
+            results[i] = stix_dict
+            remapped = True
+    return results
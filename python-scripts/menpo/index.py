@@ -0,0 +1,700 @@
+"""Persistent sidecar index for a FileSystemStore directory.
+
+The index lives next to the type directories, in `<stix_dir>/.menpo-index.json`,
+and keeps one entry per STIX id with the properties we list and filter on:
+type, latest modified, created, name, published and the path of the latest
+version file.  Relationships also keep their relationship_type, source_ref and
+target_ref, from which an in-memory adjacency index is derived, so that
+`relationships` and `related_to` cost O(degree).  It is built once and then
+refreshed incrementally by comparing object directory mtimes, so only new or
+changed objects are read again.
+
+The path works as a latest-version pointer: `IndexedFileSystemSource.get`
+opens that one file, the version directory is only listed when all versions
+are requested.
+
+FileSystemSource ignores regular files at the top of the store, so the index
+does not show up as a STIX type.
+"""
+import io
+import json
+import os
+import re
+import tempfile
+
+from collections import defaultdict
+
+from stix2 import FileSystemSink, FileSystemSource, Filter
+from stix2.datastore import DataStoreMixin
+from stix2.datastore.filesystem import (
+    _check_object_from_file, _timestamp2filename,
+)
+from stix2.datastore.filters import FilterSet, apply_common_filters
+from stix2.utils import parse_into_datetime
+
+INDEX_FILENAME = ".menpo-index.json"
+
+# Bump whenever the entry layout changes, older index files are then rebuilt
+INDEX_VERSION = 2
+
+# Properties copied from the latest version of every object
+INDEXED_PROPERTIES = (
+    "id", "type", "modified", "created", "name", "published",
+    "relationship_type", "source_ref", "target_ref",
+)
+
+TIMESTAMP_PROPERTIES = ("modified", "created", "published")
+
+# Properties shared by every version of an object: the only ones sources
+# narrow queries with, the index only knows the latest version
+NARROWING_PROPERTIES = ("id", "type")
+
+# UTC timestamps as serialized by stix2, normalized without parsing them
+_PLAIN_TIMESTAMP = re.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d{1,6})?Z")
+
+
+def normalize_timestamp(value):
+    """Format a timestamp (string or datetime) with a fixed microsecond
+    precision, so that index timestamps compare correctly as strings."""
+    if isinstance(value, str):
+        match = _PLAIN_TIMESTAMP.fullmatch(value)
+        if match is not None:
+            return value[:19] + ((match.group(1) or ".") + "000000")[:7] + "Z"
+    return parse_into_datetime(value).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def version_filename(modified):
+    """Name of the version file of an object, without extension, the same
+    way FileSystemSink names it.  Strings keep their own precision."""
+    if isinstance(modified, str):
+        return re.sub(r"[-T:\.Z ]", "", modified)
+    return _timestamp2filename(modified)
+
+
+def _version_key(filename):
+    # Version files are named after "modified" with a variable precision,
+    # e.g. 20230419000000.json or 20230419000000000.json
+    return filename[:-len(".json")].ljust(20, "0")
+
+
+def version_paths(stix_dir):
+    """Return the relative paths of every version file, sorted by STIX id and
+    then by version, oldest first."""
+    files = []
+    with os.scandir(stix_dir) as type_entries:
+        for type_entry in type_entries:
+            if type_entry.name.startswith(".") or not type_entry.is_dir():
+                continue
+
+            type_name = type_entry.name
+            with os.scandir(type_entry.path) as obj_entries:
+                for obj_entry in obj_entries:
+                    if obj_entry.is_dir():
+                        with os.scandir(obj_entry.path) as version_entries:
+                            for version_entry in version_entries:
+                                filename = version_entry.name
+                                if filename.endswith(".json"):
+                                    files.append((obj_entry.name, _version_key(filename), "/".join((type_name, obj_entry.name, filename))))
+                    elif obj_entry.name.endswith(".json"):
+                        files.append((obj_entry.name[:-len(".json")], "", "/".join((type_name, obj_entry.name))))
+
+    files.sort()
+    return [path for _, _, path in files]
+
+
+def _read_json(filepath, encoding="utf-8"):
+    with io.open(filepath, "r", encoding=encoding) as f:
+        stix_json = json.load(f)
+
+    if stix_json.get("type") == "bundle":
+        stix_json = stix_json["objects"][0]
+
+    return stix_json
+
+
+def _make_entry(stix_obj, path, mtime):
+    entry = {}
+    for prop in INDEXED_PROPERTIES:
+        if prop in stix_obj:
+            value = stix_obj[prop]
+            if prop in TIMESTAMP_PROPERTIES:
+                value = normalize_timestamp(value)
+            entry[prop] = value
+    entry["path"] = path
+    entry["mtime"] = mtime
+    return entry
+
+
+class RelationshipIndex(object):
+    """Adjacency lists of relationship ids by source_ref and target_ref.
+
+    Args:
+        entries (iterable): index entries, those which are not relationships
+            are ignored.
+
+    """
+    def __init__(self, entries=()):
+        self._edges = {}
+        self._by_source = defaultdict(set)
+        self._by_target = defaultdict(set)
+
+        for entry in entries:
+            self.add(entry)
+
+    def __len__(self):
+        return len(self._edges)
+
+    def add(self, entry):
+        """Add (or replace) the edge for a relationship index entry."""
+        if entry["type"] != "relationship":
+            return
+
+        self.remove(entry["id"])
+        self._edges[entry["id"]] = (
+            entry["source_ref"], entry["target_ref"], entry["relationship_type"],
+        )
+        self._by_source[entry["source_ref"]].add(entry["id"])
+        self._by_target[entry["target_ref"]].add(entry["id"])
+
+    def remove(self, relationship_id):
+        """Remove the edge of a relationship, if it is known."""
+        edge = self._edges.pop(relationship_id, None)
+        if edge is None:
+            return
+
+        source_ref, target_ref, _ = edge
+        self._by_source[source_ref].discard(relationship_id)
+        if not self._by_source[source_ref]:
+            del self._by_source[source_ref]
+        self._by_target[target_ref].discard(relationship_id)
+        if not self._by_target[target_ref]:
+            del self._by_target[target_ref]
+
+    def edge(self, relationship_id):
+        """Return `(source_ref, target_ref, relationship_type)`, or None."""
+        return self._edges.get(relationship_id)
+
+    def relationships(self, stix_id, relationship_type=None, source_only=False, target_only=False):
+        """Return the ids of the relationships involving `stix_id`.
+
+        Only one of `source_only` and `target_only` may be `True`.
+
+        Args:
+            stix_id (str): The STIX ID whose relationships will be looked up.
+            relationship_type (str): Only return Relationships of this type.
+            source_only (bool): Only return Relationships for which this
+                object is the source_ref. Default: False.
+            target_only (bool): Only return Relationships for which this
+                object is the target_ref. Default: False.
+
+        Returns:
+            list: relationship ids
+
+        """
+        if source_only and target_only:
+            raise ValueError("Search either source only or target only, but not both")
+
+        relationship_ids = set()
+        if not target_only:
+            relationship_ids.update(self._by_source.get(stix_id, ()))
+        if not source_only:
+            relationship_ids.update(self._by_target.get(stix_id, ()))
+
+        if relationship_type:
+            relationship_ids = [
+                relationship_id for relationship_id in relationship_ids
+                if self._edges[relationship_id][2] == relationship_type
+            ]
+
+        return list(relationship_ids)
+
+    def related(self, stix_id, relationship_type=None, source_only=False, target_only=False):
+        """Return the ids of the objects on the other end of the
+        relationships involving `stix_id`.  See `relationships`."""
+        related_ids = set()
+        for relationship_id in self.relationships(stix_id, relationship_type, source_only, target_only):
+            source_ref, target_ref, _ = self._edges[relationship_id]
+            related_ids.update((source_ref, target_ref))
+        related_ids.discard(stix_id)
+        return related_ids
+
+
+class FileSystemIndex(object):
+    """Sidecar index of the objects stored in a FileSystemStore directory.
+
+    Entries are plain dicts holding the `INDEXED_PROPERTIES` of the latest
+    version of each object, plus its `path` relative to the store directory.
+    Timestamps are kept as normalized strings (see `normalize_timestamp`).
+    Entries are shared with the index and must be treated as read-only.
+
+    The `adjacency` of relationships is built from the entries on first use
+    and kept in sync by `refresh` and `update`.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        filename (str): name of the index file inside `stix_dir`
+        encoding (str): The encoding to use when reading object files.
+
+    """
+    def __init__(self, stix_dir, filename=INDEX_FILENAME, encoding="utf-8"):
+        self._stix_dir = os.path.abspath(stix_dir)
+        self._path = os.path.join(self._stix_dir, filename)
+        self.encoding = encoding
+        self._objects = {}
+        self._adjacency = None
+        self._dirty = False
+
+        if not os.path.exists(self._stix_dir):
+            raise ValueError("directory path for STIX data does not exist: %s" % self._stix_dir)
+
+        self.load()
+
+    @property
+    def stix_dir(self):
+        return self._stix_dir
+
+    @property
+    def path(self):
+        return self._path
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __contains__(self, stix_id):
+        return stix_id in self._objects
+
+    @property
+    def adjacency(self):
+        """The `RelationshipIndex` of every indexed relationship."""
+        if self._adjacency is None:
+            self._adjacency = RelationshipIndex(self._objects.values())
+        return self._adjacency
+
+    def load(self):
+        """Load the index file, if there is one with the current layout."""
+        self._objects = {}
+        self._adjacency = None
+        try:
+            with io.open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+
+        if data.get("version") == INDEX_VERSION:
+            self._objects = data["objects"]
+
+    def save(self):
+        """Atomically write the index file, if anything changed."""
+        if not self._dirty:
+            return
+
+        data = {"version": INDEX_VERSION, "objects": self._objects}
+        fd, tmp_path = tempfile.mkstemp(dir=self._stix_dir, prefix=".menpo-tmp-")
+        try:
+            with io.open(fd, "w", encoding="utf-8") as f:
+                # dumps, unlike dump, uses the C encoder
+                f.write(json.dumps(data, separators=(",", ":")))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self._path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self._dirty = False
+
+    def refresh(self, save=True):
+        """Bring the index up to date with the directory tree.
+
+        Only objects whose directory (or unversioned file) mtime changed since
+        the last refresh are read again.  The index file is saved when
+        anything changed.
+
+        Args:
+            save (bool): save the index file, False keeps the changes in
+                memory (until the next `save`)
+
+        Returns:
+            int: The number of entries added, updated or removed.
+
+        """
+        changed = 0
+        seen = set()
+
+        with os.scandir(self._stix_dir) as type_entries:
+            for type_entry in type_entries:
+                if type_entry.name.startswith(".") or not type_entry.is_dir():
+                    continue
+
+                with os.scandir(type_entry.path) as obj_entries:
+                    for obj_entry in obj_entries:
+                        if obj_entry.is_dir():
+                            stix_id = obj_entry.name
+                        elif obj_entry.name.endswith(".json"):
+                            stix_id = obj_entry.name[:-len(".json")]
+                        else:
+                            continue
+
+                        mtime = obj_entry.stat().st_mtime_ns
+                        entry = self._objects.get(stix_id)
+                        if entry is not None and entry["mtime"] == mtime:
+                            seen.add(stix_id)
+                            continue
+
+                        entry = self._read_entry(type_entry.name, obj_entry, mtime)
+                        if entry is None:
+                            continue
+
+                        seen.add(stix_id)
+                        self._set_entry(entry)
+                        changed += 1
+
+        for stix_id in set(self._objects) - seen:
+            del self._objects[stix_id]
+            if self._adjacency is not None:
+                self._adjacency.remove(stix_id)
+            changed += 1
+
+        if changed:
+            self._dirty = True
+            if save:
+                self.save()
+
+        return changed
+
+    def _read_entry(self, type_name, obj_entry, mtime):
+        if obj_entry.is_dir():
+            version_files = [
+                name for name in os.listdir(obj_entry.path)
+                if name.endswith(".json")
+            ]
+            if not version_files:
+                return None
+            latest = max(version_files, key=_version_key)
+            path = "/".join((type_name, obj_entry.name, latest))
+        else:
+            path = "/".join((type_name, obj_entry.name))
+
+        stix_obj = _read_json(os.path.join(self._stix_dir, path), self.encoding)
+        return _make_entry(stix_obj, path, mtime)
+
+    def _set_entry(self, entry):
+        self._objects[entry["id"]] = entry
+        if self._adjacency is not None:
+            self._adjacency.add(entry)
+
+    def update(self, stix_obj):
+        """Record an object that has just been written to the store.
+
+        The entry is only replaced when `stix_obj` is at least as recent as
+        the indexed version.  Call `save` to persist the change.
+
+        Args:
+            stix_obj (STIX object OR dict): the object that was written
+
+        """
+        if "modified" in stix_obj:
+            filename = version_filename(stix_obj["modified"]) + ".json"
+            obj_path = "/".join((stix_obj["type"], stix_obj["id"]))
+            path = obj_path + "/" + filename
+        else:
+            obj_path = path = "/".join((stix_obj["type"], stix_obj["id"] + ".json"))
+
+        mtime = os.stat(os.path.join(self._stix_dir, obj_path)).st_mtime_ns
+        entry = _make_entry(stix_obj, path, mtime)
+
+        current = self._objects.get(entry["id"])
+        if current is not None and current.get("modified", "") > entry.get("modified", ""):
+            current["mtime"] = mtime
+        else:
+            self._set_entry(entry)
+        self._dirty = True
+
+    def lookup(self, stix_id):
+        """Return the index entry for `stix_id`, or None."""
+        return self._objects.get(stix_id)
+
+    def entries(self, type=None):
+        """Return the index entries, optionally only those of one STIX type."""
+        if type is None:
+            return list(self._objects.values())
+        return [entry for entry in self._objects.values() if entry["type"] == type]
+
+    def query(self, query=None):
+        """Return the index entries matching the given filters.
+
+        Only filters on `INDEXED_PROPERTIES` can be answered by the index;
+        entries lack every other property and never match them.
+
+        Args:
+            query (list): list of filters to search on
+
+        Returns:
+            (list): list of matching index entries
+
+        """
+        filters = []
+        for filter_ in FilterSet(query):
+            if filter_.property in TIMESTAMP_PROPERTIES and not isinstance(filter_.value, (list, tuple)):
+                filter_ = filter_._replace(value=normalize_timestamp(filter_.value))
+            filters.append(filter_)
+
+        candidates = self._objects.values()
+        for filter_ in filters:
+            if filter_.property == "id" and filter_.op == "=":
+                entry = self._objects.get(filter_.value)
+                candidates = [entry] if entry is not None else []
+                break
+            if filter_.property == "type" and filter_.op == "=":
+                candidates = self.entries(filter_.value)
+
+        return list(apply_common_filters(candidates, filters))
+
+
+class IndexedFileSystemSource(FileSystemSource):
+    """FileSystemSource which narrows every query with a `FileSystemIndex`.
+
+    Filters on ids and types are evaluated against the index first, and only
+    the directories of the matching ids are read; every version read is then
+    checked against the whole query.  The index is refreshed before queries
+    when a type directory changed, i.e. objects were added or removed since
+    the last refresh.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        allow_custom (bool): Whether to allow custom STIX content to be
+            added to the FileSystemSink. Default: True
+        encoding (str): The encoding to use when reading a file from the
+            filesystem.
+        index (FileSystemIndex): index to use, a new one is opened (and
+            refreshed) by default.
+
+    """
+    def __init__(self, stix_dir, allow_custom=True, encoding='utf-8', index=None):
+        super(IndexedFileSystemSource, self).__init__(stix_dir, allow_custom=allow_custom, encoding=encoding)
+
+        if index is None:
+            index = FileSystemIndex(stix_dir, encoding=encoding)
+            index.refresh()
+        self.index = index
+        self._type_mtimes = self._read_type_mtimes()
+
+    def _read_type_mtimes(self):
+        # Adding or removing an object changes the mtime of its type directory
+        with os.scandir(self._stix_dir) as entries:
+            return {
+                entry.name: entry.stat().st_mtime_ns
+                for entry in entries if not entry.name.startswith(".") and entry.is_dir()
+            }
+
+    def refresh(self):
+        """Refresh the index with the objects written since the last refresh.
+
+        Returns:
+            int: The number of entries added, updated or removed.
+
+        """
+        type_mtimes = self._read_type_mtimes()
+        changed = self.index.refresh()
+        self._type_mtimes = type_mtimes
+        return changed
+
+    def _refresh_if_changed(self):
+        if self._read_type_mtimes() != self._type_mtimes:
+            self.refresh()
+
+    def get(self, stix_id, version=None, _composite_filters=None):
+        """Retrieve the latest version of a STIX object via STIX ID.
+
+        The latest version file comes from the index, it is the only file
+        opened.  Ids missing from the index (e.g. written by another process
+        since it was refreshed), or whose indexed file is gone, are looked up
+        in their directory as `FileSystemSource.get` does.
+
+        """
+        entry = self.index.lookup(stix_id)
+        if entry is None:
+            return self._get_from_directory(stix_id, version, _composite_filters)
+
+        query = FilterSet()
+        if self.filters:
+            query.add(self.filters)
+        if _composite_filters:
+            query.add(_composite_filters)
+        if query:
+            # The latest version may not pass the filters while an older one
+            # does, so every version has to be checked
+            return super(IndexedFileSystemSource, self).get(stix_id, version, _composite_filters)
+
+        try:
+            return _check_object_from_file(
+                query, os.path.join(self._stix_dir, entry["path"]),
+                self.allow_custom, version, self.encoding,
+            )
+        except FileNotFoundError:
+            return self._get_from_directory(stix_id, version, _composite_filters)
+
+    def _get_from_directory(self, stix_id, version, _composite_filters):
+        # FileSystemSource.get, without the index narrowing of `query`
+        all_data = super(IndexedFileSystemSource, self).query(
+            [Filter("id", "=", stix_id)], version, _composite_filters,
+        )
+        if not all_data:
+            return None
+        if "modified" in all_data[0]:
+            return max(all_data, key=lambda k: k["modified"])
+        return all_data[0]
+
+    def query(self, query=None, version=None, _composite_filters=None):
+        """Search and retrieve STIX objects based on the complete query.
+
+        See `FileSystemSource.query`.
+
+        """
+        complete_query = FilterSet(query)
+        if self.filters:
+            complete_query.add(self.filters)
+        if _composite_filters:
+            complete_query.add(_composite_filters)
+
+        indexed = [f for f in complete_query if f.property in NARROWING_PROPERTIES]
+        if not indexed:
+            return super(IndexedFileSystemSource, self).query(query, version, _composite_filters)
+
+        self._refresh_if_changed()
+        ids = tuple(entry["id"] for entry in self.index.query(indexed))
+        if not ids:
+            return []
+
+        query = list(FilterSet(query)) + [Filter("id", "in", ids)]
+        return super(IndexedFileSystemSource, self).query(query, version, _composite_filters)
+
+    def relationships(self, obj, relationship_type=None, source_only=False, target_only=False):
+        """Retrieve Relationships involving the given STIX object.
+
+        The relationship ids come from the adjacency index, only their files
+        are read.  See `DataSource.relationships`.
+
+        """
+        try:
+            obj_id = obj['id']
+        except KeyError:
+            raise ValueError("STIX object has no 'id' property")
+        except TypeError:
+            # Assume `obj` is an ID string
+            obj_id = obj
+
+        self._refresh_if_changed()
+        relationship_ids = self.index.adjacency.relationships(
+            obj_id, relationship_type, source_only, target_only,
+        )
+        if not relationship_ids:
+            return []
+
+        return self.query([Filter("id", "in", tuple(relationship_ids))])
+
+    def related_to(self, obj, relationship_type=None, source_only=False, target_only=False, filters=None):
+        """Retrieve STIX Objects that have a Relationship involving the given
+        STIX object.
+
+        The related ids come from the adjacency index, so no relationship
+        file is read at all.  See `DataSource.related_to`.
+
+        """
+        try:
+            obj_id = obj['id']
+        except TypeError:
+            # Assume `obj` is an ID string
+            obj_id = obj
+
+        self._refresh_if_changed()
+        related_ids = self.index.adjacency.related(
+            obj_id, relationship_type, source_only, target_only,
+        )
+        if not related_ids:
+            return []
+
+        return self.query(list(FilterSet(filters)) + [Filter("id", "in", tuple(related_ids))])
+
+
+class IndexedFileSystemSink(FileSystemSink):
+    """FileSystemSink which keeps a `FileSystemIndex` in sync on writes.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects.
+        allow_custom (bool): Whether to allow custom STIX content to be
+            added to the FileSystemSource. Default: False
+        bundlify (bool): Whether to wrap objects in bundles when saving them.
+            Default: False.
+        index (FileSystemIndex): index to update, a new one is opened (and
+            refreshed) by default.
+
+    """
+    def __init__(self, stix_dir, allow_custom=False, bundlify=False, index=None):
+        super(IndexedFileSystemSink, self).__init__(stix_dir, allow_custom=allow_custom, bundlify=bundlify)
+
+        if index is None:
+            index = FileSystemIndex(stix_dir)
+            index.refresh()
+        self.index = index
+        self._adding = False
+
+    def _check_path_and_write(self, stix_obj, encoding='utf-8', pretty=True):
+        super(IndexedFileSystemSink, self)._check_path_and_write(stix_obj, encoding=encoding, pretty=pretty)
+        self.index.update(stix_obj)
+
+    def add(self, stix_data=None, version=None, pretty=True):
+        """Add STIX objects to file directory and update the index.
+
+        See `FileSystemSink.add`.  The index file is saved once, after all
+        objects have been written.
+
+        """
+        nested = self._adding
+        self._adding = True
+        try:
+            super(IndexedFileSystemSink, self).add(stix_data, version=version, pretty=pretty)
+        finally:
+            self._adding = nested
+            if not nested:
+                self.index.save()
+
+
+class IndexedFileSystemStore(DataStoreMixin):
+    """FileSystemStore whose source and sink share one `FileSystemIndex`.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        allow_custom (bool): whether to allow custom STIX content to be
+            pushed/retrieved. Defaults to True for the source side
+            (retrieving data) and False for the sink side (pushing data).
+        bundlify (bool): whether to wrap objects in bundles when saving
+            them. Default: False.
+        encoding (str): The encoding to use when reading a file from the
+            filesystem.
+
+    Attributes:
+        index (FileSystemIndex): the shared index
+        source (IndexedFileSystemSource): IndexedFileSystemSource
+        sink (IndexedFileSystemSink): IndexedFileSystemSink
+
+    """
+    def __init__(self, stix_dir, allow_custom=None, bundlify=False, encoding='utf-8'):
+        if allow_custom is None:
+            allow_custom_source = True
+            allow_custom_sink = False
+        else:
+            allow_custom_sink = allow_custom_source = allow_custom
+
+        self.index = FileSystemIndex(stix_dir, encoding=encoding)
+        self.index.refresh()
+
+        super(IndexedFileSystemStore, self).__init__(
+            source=IndexedFileSystemSource(
+                stix_dir, allow_custom=allow_custom_source,
+                encoding=encoding, index=self.index,
+            ),
+            sink=IndexedFileSystemSink(
+                stix_dir, allow_custom=allow_custom_sink,
+                bundlify=bundlify, index=self.index,
+            ),
+        )
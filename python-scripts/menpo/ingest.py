@@ -0,0 +1,224 @@
+"""Batch ingestion of every incident script in one process.
+
+Each `data-input` script builds its STIX objects at import time and lists
+them in a module-level `objects` list; it only writes them to `db/` when run
+as `__main__`.  This driver imports every script (or farms them out to a
+process pool), collects the objects and writes all of them in a single
+atomic batch (see `menpo.bulk`), so the index is saved once.  Object ids are
+deterministic (see `menpo.ids`) and every stored version is hashed in a
+manifest (see `menpo.manifest`): only added versions are written,
+ingesting an unchanged corpus again writes nothing, and versions edited
+without a new `modified` are refused.  Addresses
+which are already stored under another SCO are pointed at it (see
+`menpo.registry`), and the full-text search index (see `menpo.search`) is
+updated with the written objects:
+
+    cd python-scripts
+    python3 -m menpo.ingest                  # data-input/*.py into ../db
+    python3 -m menpo.ingest --workers 4 --stix-dir /tmp/db
+    python3 -m menpo.ingest --dry-run        # build and time, write nothing
+"""
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from menpo.bulk import BulkWriter, recover
+from menpo.index import FileSystemIndex
+from menpo.manifest import ChangedVersionError, Manifest, refuse_changed, version_key
+from menpo.registry import ADDRESS_TYPE, AddressRegistry
+from menpo.search import SearchIndex
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data-input")
+
+
+class IncidentScriptError(Exception):
+    """Raised when an incident script cannot be built."""
+    pass
+
+
+def discover(input_dir=SCRIPTS_DIR):
+    """Paths of the incident scripts of a directory, in name (date) order."""
+    return sorted(glob.glob(os.path.join(os.path.abspath(input_dir), "*.py")))
+
+
+def build_incident(script_path):
+    """Import an incident script and return its objects.
+
+    Returns:
+        list: the `objects` of the script, in order
+
+    """
+    module_name = "menpo_incident_" + os.path.splitext(os.path.basename(script_path))[0].replace(".", "_")
+    spec = importlib.util.spec_from_file_location(module_name, script_path)
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except Exception as e:
+        raise IncidentScriptError("%s: %s" % (os.path.basename(script_path), e)) from e
+
+    stix_objs = getattr(module, "objects", None)
+    if stix_objs is None:
+        raise IncidentScriptError("%s has no 'objects' list" % os.path.basename(script_path))
+    return list(stix_objs)
+
+
+def _timed_build(script_path, serialize):
+    start = time.perf_counter()
+    stix_objs = build_incident(script_path)
+    if serialize:
+        # Serialized in the worker, custom stix2 classes do not pickle
+        stix_objs = [json.loads(stix_obj.serialize()) for stix_obj in stix_objs]
+    return script_path, stix_objs, time.perf_counter() - start
+
+
+def build_all(script_paths, workers=1):
+    """Build every incident script.
+
+    Args:
+        script_paths (list): paths of the scripts
+        workers (int): size of the process pool, with 1 worker the scripts
+            are imported in the calling process.  Objects built by workers
+            come back as dicts.
+
+    Returns:
+        list: `(script_path, objects, seconds)` tuples, in the order of
+        `script_paths`
+
+    """
+    if workers == 1:
+        return [_timed_build(script_path, False) for script_path in script_paths]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_timed_build, script_path, True) for script_path in script_paths]
+        return [future.result() for future in futures]
+
+
+def write_objects(stix_dir, stix_objs, dry_run=False):
+    """Write the added object versions in one atomic batch (see
+    `menpo.bulk`), and record them in the index, the manifest, the address
+    registry and the search index.  Nothing is written when all of them are
+    unchanged, or when any stored version changed.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        stix_objs (list): STIX objects (stix2 objects or dicts)
+        dry_run (bool): only classify the objects
+
+    Returns:
+        dict: the "added", "changed" and "unchanged" objects, and the
+        "original_ids" of the objects whose id changed when they were
+        pointed at the canonical address SCOs (see
+        `AddressRegistry.canonicalize`), by their new id
+
+    Raises:
+        ChangedVersionError: stored versions changed (unless `dry_run`)
+
+    """
+    if not dry_run:
+        # Complete (or discard) an interrupted batch before comparing
+        recover(stix_dir)
+
+    # A dry run leaves the sidecar files as they are
+    index = FileSystemIndex(stix_dir)
+    index.refresh(save=not dry_run)
+    registry = AddressRegistry(stix_dir)
+    registry.refresh(index, save=not dry_run)
+    canonical = registry.canonicalize(stix_objs)
+
+    # The SCOs dropped in favour of a registered one are the only missing
+    # objects, the others keep their order
+    canonical_ids = {stix_obj["id"] for stix_obj in canonical}
+    kept = [
+        stix_obj for stix_obj in stix_objs
+        if stix_obj["type"] != ADDRESS_TYPE or stix_obj["id"] in canonical_ids
+    ]
+    original_ids = {
+        new_obj["id"]: stix_obj["id"] for stix_obj, new_obj in zip(kept, canonical) if new_obj["id"] != stix_obj["id"]
+    }
+    stix_objs = canonical
+
+    manifest = Manifest(stix_dir)
+    added, changed, unchanged = manifest.classify(stix_objs)
+    if not dry_run:
+        refuse_changed(changed)
+
+    if not dry_run and added:
+        search = SearchIndex(stix_dir)
+        search.refresh(index)
+        writer = BulkWriter(stix_dir, allow_custom=True, index=index, manifest=manifest, registry=registry,
+                            search=search)
+        writer.write([stix_obj for stix_obj, _ in added], digests=[digest for _, digest in added])
+    elif not dry_run:
+        manifest.save()
+
+    return {
+        "added": [stix_obj for stix_obj, _ in added],
+        "changed": [stix_obj for stix_obj, _ in changed],
+        "unchanged": [stix_obj for stix_obj, _ in unchanged],
+        "original_ids": original_ids,
+    }
+
+
+def ingest(stix_dir, script_paths, workers=1, dry_run=False):
+    """Build every incident script and write all their added objects at
+    once.
+
+    Returns:
+        tuple: the `build_all` results, the `write_objects` result and the
+        seconds spent writing
+
+    """
+    results = build_all(script_paths, workers=workers)
+    stix_objs = [stix_obj for _, incident_objs, _ in results for stix_obj in incident_objs]
+
+    start = time.perf_counter()
+    written = write_objects(stix_dir, stix_objs, dry_run=dry_run)
+    return results, written, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m menpo.ingest", description="Ingest every incident script at once")
+    parser.add_argument("--input-dir", default=SCRIPTS_DIR, help="directory of the incident scripts")
+    parser.add_argument("--stix-dir", default=os.path.join(os.path.dirname(SCRIPTS_DIR), "..", "db"))
+    parser.add_argument("--workers", type=int, default=1, help="build the scripts in a process pool")
+    parser.add_argument("--dry-run", action="store_true", help="build the objects, write nothing")
+    parser.add_argument("scripts", nargs="*", help="scripts to ingest, every script of --input-dir by default")
+    args = parser.parse_args(argv)
+
+    script_paths = [os.path.abspath(p) for p in args.scripts] or discover(args.input_dir)
+    if not args.dry_run:
+        os.makedirs(args.stix_dir, exist_ok=True)
+    start = time.perf_counter()
+    try:
+        results, written, write_seconds = ingest(args.stix_dir, script_paths, workers=args.workers, dry_run=args.dry_run)
+    except (IncidentScriptError, ChangedVersionError) as e:
+        print("Error:", e, file=sys.stderr)
+        return 1
+
+    # Keyed by the ids the scripts built, before canonicalization
+    original_ids = written["original_ids"]
+    status = {}
+    for name in ("added", "changed", "unchanged"):
+        for stix_obj in written[name]:
+            status[(original_ids.get(stix_obj["id"], stix_obj["id"]), version_key(stix_obj))] = name
+
+    print(f"{'incident':<36}{'objects':>8}{'added':>8}{'changed':>8}{'seconds':>10}")
+    for script_path, stix_objs, seconds in results:
+        names = [status.get((stix_obj["id"], version_key(stix_obj))) for stix_obj in stix_objs]
+        print(f"{os.path.basename(script_path):<36}{len(stix_objs):>8}{names.count('added'):>8}"
+              f"{names.count('changed'):>8}{seconds:>10.3f}")
+
+    print(f"\n{len(results)} incidents, {len(written['added'])} added, {len(written['changed'])} changed, "
+          f"{len(written['unchanged'])} unchanged{' (dry run)' if args.dry_run else ''}, "
+          f"written in {write_seconds:.3f}s, {time.perf_counter() - start:.3f}s in total")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
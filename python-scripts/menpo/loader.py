@@ -0,0 +1,207 @@
+"""Parallel bulk loader which materializes a whole `db/` tree in memory.
+
+The tree is listed with `os.scandir`, the version files are split in chunks
+and parsed as plain JSON in a process (or thread) pool, and the results are
+indexed by `GraphSource`: latest version by id, ids by type and relationship
+adjacency.  Objects are kept as the plain dicts read from the files.
+
+    from menpo.loader import load_graph
+
+    graph = load_graph("../../db", workers=8)
+    graph.related_to("threat-actor--60f3f7fc-5ac3-5386-9719-e621b8d04104")
+"""
+import io
+import json
+import os
+
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from stix2.datastore import DataSource
+from stix2.datastore.filters import Filter, FilterSet, apply_common_filters
+
+from menpo.index import RelationshipIndex, normalize_timestamp, version_paths
+
+CHUNK_SIZE = 256
+
+
+def _read_chunk(stix_dir, paths, encoding):
+    stix_objs = []
+    for path in paths:
+        with io.open(os.path.join(stix_dir, path), "r", encoding=encoding) as f:
+            stix_obj = json.load(f)
+        if stix_obj.get("type") == "bundle":
+            stix_obj = stix_obj["objects"][0]
+        stix_objs.append(stix_obj)
+    return stix_objs
+
+
+def read_objects(stix_dir, workers=None, use_threads=False, chunk_size=CHUNK_SIZE, encoding="utf-8"):
+    """Read every version file of a FileSystemStore directory.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        workers (int): size of the pool, `os.cpu_count()` by default.  With
+            1 worker the files are read in the calling thread.
+        use_threads (bool): use a thread pool instead of a process pool.
+        chunk_size (int): number of files handed to a worker at once
+        encoding (str): The encoding to use when reading the files.
+
+    Returns:
+        list: every object version, as dicts
+
+    """
+    stix_dir = os.path.abspath(stix_dir)
+    paths = version_paths(stix_dir)
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        return _read_chunk(stix_dir, paths, encoding)
+
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    executor_class = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+    stix_objs = []
+    with executor_class(max_workers=workers) as executor:
+        futures = [executor.submit(_read_chunk, stix_dir, chunk, encoding) for chunk in chunks]
+        for future in futures:
+            stix_objs.extend(future.result())
+    return stix_objs
+
+
+def load_graph(stix_dir, workers=None, use_threads=False, chunk_size=CHUNK_SIZE, encoding="utf-8"):
+    """Load a whole FileSystemStore directory into a `GraphSource`.
+
+    See `read_objects` for the arguments.
+
+    """
+    return GraphSource(read_objects(
+        stix_dir, workers=workers, use_threads=use_threads,
+        chunk_size=chunk_size, encoding=encoding,
+    ))
+
+
+def _modified(stix_obj):
+    return normalize_timestamp(stix_obj["modified"]) if "modified" in stix_obj else ""
+
+
+class GraphSource(DataSource):
+    """In-memory DataSource over plain STIX dicts, indexed by id, by type and
+    by relationship adjacency.
+
+    Timestamps are the strings read from the files, filters on them compare
+    strings.  Versions are ordered by their normalized `modified` timestamps
+    (see `menpo.index.normalize_timestamp`), whatever their precision.
+
+    Args:
+        stix_objs (iterable): STIX objects (dicts), any number of versions
+
+    Attributes:
+        adjacency (RelationshipIndex): the edges of the latest version of
+            every relationship
+
+    """
+    def __init__(self, stix_objs=()):
+        super(GraphSource, self).__init__()
+        self._versions = defaultdict(list)
+        self._latest = {}
+        # id -> normalized modified of the latest version
+        self._latest_modified = {}
+        self._by_type = defaultdict(set)
+        self.adjacency = RelationshipIndex()
+        self.add_objects(stix_objs)
+
+    def __len__(self):
+        return len(self._latest)
+
+    def add_objects(self, stix_objs):
+        """Add object versions to the graph."""
+        for stix_obj in stix_objs:
+            stix_id = stix_obj["id"]
+            self._versions[stix_id].append(stix_obj)
+            self._by_type[stix_obj["type"]].add(stix_id)
+
+            modified = _modified(stix_obj)
+            current = self._latest_modified.get(stix_id)
+            if current is None or modified >= current:
+                self._latest[stix_id] = stix_obj
+                self._latest_modified[stix_id] = modified
+                self.adjacency.add(stix_obj)
+
+    def _complete_query(self, query, _composite_filters):
+        query = FilterSet(query)
+        if self.filters:
+            query.add(self.filters)
+        if _composite_filters:
+            query.add(_composite_filters)
+        return query
+
+    def get(self, stix_id, _composite_filters=None):
+        """Retrieve the latest version of a STIX object via STIX ID."""
+        query = self._complete_query(None, _composite_filters)
+        if not query:
+            return self._latest.get(stix_id)
+
+        versions = sorted(self._versions.get(stix_id, ()), key=_modified)
+        return next(apply_common_filters(reversed(versions), query), None)
+
+    def all_versions(self, stix_id, _composite_filters=None):
+        """Retrieve every version of a STIX object via STIX ID."""
+        query = self._complete_query(None, _composite_filters)
+        return list(apply_common_filters(self._versions.get(stix_id, ()), query))
+
+    def query(self, query=None, _composite_filters=None):
+        """Search and retrieve STIX objects (all versions) based on the
+        complete query.  Filters on `id` and `type` use the indexes."""
+        query = self._complete_query(query, _composite_filters)
+
+        stix_ids = None
+        for filter_ in query:
+            if filter_.property == "id" and filter_.op in ("=", "in"):
+                values = {filter_.value} if filter_.op == "=" else set(filter_.value)
+            elif filter_.property == "type" and filter_.op in ("=", "in"):
+                values = set()
+                for type_ in ([filter_.value] if filter_.op == "=" else filter_.value):
+                    values.update(self._by_type.get(type_, ()))
+            else:
+                continue
+            stix_ids = values if stix_ids is None else stix_ids & values
+
+        if stix_ids is None:
+            stix_ids = self._versions.keys()
+
+        candidates = (
+            stix_obj
+            for stix_id in stix_ids
+            for stix_obj in self._versions.get(stix_id, ())
+        )
+        return list(apply_common_filters(candidates, query))
+
+    def relationships(self, obj, relationship_type=None, source_only=False, target_only=False):
+        """Retrieve Relationships involving the given STIX object, from the
+        adjacency index.  See `DataSource.relationships`."""
+        try:
+            obj_id = obj['id']
+        except KeyError:
+            raise ValueError("STIX object has no 'id' property")
+        except TypeError:
+            # Assume `obj` is an ID string
+            obj_id = obj
+
+        relationship_ids = self.adjacency.relationships(obj_id, relationship_type, source_only, target_only)
+        if not relationship_ids:
+            return []
+        return self.query([Filter("id", "in", tuple(relationship_ids))])
+
+    def related_to(self, obj, relationship_type=None, source_only=False, target_only=False, filters=None):
+        """Retrieve STIX Objects that have a Relationship involving the given
+        STIX object, from the adjacency index.  See `DataSource.related_to`."""
+        try:
+            obj_id = obj['id']
+        except TypeError:
+            # Assume `obj` is an ID string
+            obj_id = obj
+
+        related_ids = self.adjacency.related(obj_id, relationship_type, source_only, target_only)
+        if not related_ids:
+            return []
+        return self.query(list(FilterSet(filters)) + [Filter("id", "in", tuple(related_ids))])
@@ -0,0 +1,284 @@
+"""Reverse index from wallet addresses to indicators, threat actors and reports.
+
+"Is this address in Menpo, and which incident is it tied to?" used to take a
+scan of every indicator pattern and walks over the relationships.  The
+lookup index answers it with one dict access: for every blockchain and
+normalized address (see `menpo.registry`) it keeps
+
+- the indicators whose pattern compares `x-defi-address:value` with the
+  address (and `x-defi-address:blockchain` with the blockchain, indicators
+  on any blockchain are kept under the `*` blockchain),
+- the `x-defi-address` SCOs of the address,
+- the threat actors related to any of them (`indicates`, `uses`...),
+- the reports which reference any of them or of the objects directly
+  related to them (the threat actor, the victim identity...).
+
+It lives in `<stix_dir>/.menpo-lookup.json` and is refreshed through the
+index and the address registry: only the indicators and reports whose
+directory changed are read again.
+
+    cd python-scripts
+    python3 -m menpo.lookup 0x57A72cE4fd69eBEdEfC1a938b690fbf11A7Dff80
+    python3 -m menpo.lookup 0x57a72ce4fd69ebedefc1a938b690fbf11a7dff80 --blockchain polygon --no-refresh
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+
+from collections import defaultdict
+
+from menpo.index import FileSystemIndex, _read_json
+from menpo.matcher import pattern_lookups
+from menpo.normalize import ANY_BLOCKCHAIN
+from menpo.registry import ADDRESS_TYPE, AddressRegistry, address_key, normalize_address
+
+LOOKUP_FILENAME = ".menpo-lookup.json"
+
+# Bump whenever the layout, or the keys a pattern gives, change: older
+# lookup indexes are then rebuilt.  3: multi-chain blockchain literals
+LOOKUP_VERSION = 3
+
+RESULT_KEYS = ("indicators", "addresses", "threat_actors", "reports")
+
+
+def pattern_addresses(pattern):
+    """The `(blockchain, value)` pairs of the addresses a STIX pattern
+    compares with, each value with the blockchain of its own comparison (see
+    `menpo.matcher`).  The blockchain is None for a value compared on any
+    blockchain.
+
+    Patterns which `IndicatorMatcher` evaluates instead of lowering them to
+    lookups, and invalid ones, compare with no address.
+
+    Returns:
+        list: `(blockchain, value)` pairs, as they appear in the pattern
+
+    """
+    try:
+        entries = pattern_lookups(pattern)
+    except Exception:
+        # Not a valid pattern, it compares with no address
+        return []
+    return [(blockchain, value) for stix_type, blockchain, value in entries or () if stix_type == ADDRESS_TYPE]
+
+
+class AddressLookup(object):
+    """Indicators, SCOs, threat actors and reports by address.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        filename (str): name of the lookup file inside `stix_dir`
+        encoding (str): The encoding to use when reading object files.
+
+    """
+    def __init__(self, stix_dir, filename=LOOKUP_FILENAME, encoding="utf-8"):
+        self._stix_dir = os.path.abspath(stix_dir)
+        self._path = os.path.join(self._stix_dir, filename)
+        self.encoding = encoding
+        # key -> {"indicators": [...], "addresses": [...], ...}
+        self._addresses = {}
+        # normalized value -> keys
+        self._values = {}
+        # id -> [directory mtime, address keys]
+        self._indicators = {}
+        # id -> [directory mtime, object_refs]
+        self._reports = {}
+        self._dirty = False
+        self.load()
+
+    @property
+    def path(self):
+        return self._path
+
+    def __len__(self):
+        return len(self._addresses)
+
+    def load(self):
+        """Load the lookup file, if there is one with the current layout."""
+        self._addresses = {}
+        self._indicators = {}
+        self._reports = {}
+        try:
+            with io.open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            data = {}
+
+        if data.get("version") == LOOKUP_VERSION:
+            self._addresses = data["addresses"]
+            self._indicators = data["indicators"]
+            self._reports = data["reports"]
+        self._index_values()
+
+    def save(self):
+        """Atomically write the lookup file, if anything changed."""
+        if not self._dirty:
+            return
+
+        data = {
+            "version": LOOKUP_VERSION,
+            "addresses": self._addresses,
+            "indicators": self._indicators,
+            "reports": self._reports,
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self._stix_dir, prefix=".menpo-tmp-")
+        try:
+            with io.open(fd, "w", encoding="utf-8") as f:
+                # dumps, unlike dump, uses the C encoder
+                f.write(json.dumps(data, separators=(",", ":")))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self._path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self._dirty = False
+
+    def _index_values(self):
+        self._values = defaultdict(list)
+        for key in self._addresses:
+            self._values[key.split(":", 1)[1]].append(key)
+
+    def _read(self, objects, entries, read):
+        # Bring `objects` (id -> [mtime, data]) up to date with index entries
+        stored = {entry["id"] for entry in entries}
+        changed = [stix_id for stix_id in objects if stix_id not in stored]
+        for stix_id in changed:
+            del objects[stix_id]
+        for entry in entries:
+            if objects.get(entry["id"], (None,))[0] != entry["mtime"]:
+                stix_obj = _read_json(os.path.join(self._stix_dir, entry["path"]), self.encoding)
+                objects[entry["id"]] = [entry["mtime"], read(stix_obj)]
+                changed.append(entry["id"])
+        return len(changed)
+
+    def refresh(self, index=None, registry=None):
+        """Bring the lookup index up to date with the store.  The lookup file
+        is saved when anything changed.
+
+        Args:
+            index (FileSystemIndex): an up to date index of the store, one is
+                refreshed here by default
+            registry (AddressRegistry): an up to date address registry, one
+                is refreshed here by default
+
+        Returns:
+            int: The number of indicators and reports read or removed.
+
+        """
+        if index is None:
+            index = FileSystemIndex(self._stix_dir)
+            index.refresh()
+        if registry is None:
+            registry = AddressRegistry(self._stix_dir)
+            registry.refresh(index)
+
+        changed = self._read(self._indicators, index.entries("indicator"), lambda indicator: sorted({
+            address_key(blockchain or ANY_BLOCKCHAIN, value)
+            for blockchain, value in pattern_addresses(indicator.get("pattern", ""))
+        }))
+        changed += self._read(self._reports, index.entries("report"), lambda report: report.get("object_refs", []))
+
+        # Relationships and SCOs come from the index and the registry, the
+        # address records are derived again from scratch
+        by_key = defaultdict(lambda: {name: set() for name in RESULT_KEYS})
+        for stix_id, (_, keys) in self._indicators.items():
+            for key in keys:
+                by_key[key]["indicators"].add(stix_id)
+        for stix_id, keys in registry.items():
+            for key in keys:
+                by_key[key]["addresses"].add(stix_id)
+
+        reports_by_ref = defaultdict(set)
+        for report_id, (_, object_refs) in self._reports.items():
+            for ref in object_refs:
+                reports_by_ref[ref].add(report_id)
+
+        adjacency = index.adjacency
+        addresses = {}
+        for key, record in by_key.items():
+            refs = record["indicators"] | record["addresses"]
+            for stix_id in list(refs):
+                refs.update(adjacency.related(stix_id))
+            record["threat_actors"] = {ref for ref in refs if ref.startswith("threat-actor--")}
+            for ref in refs:
+                record["reports"].update(reports_by_ref.get(ref, ()))
+            addresses[key] = {name: sorted(record[name]) for name in RESULT_KEYS}
+
+        if changed or addresses != self._addresses:
+            self._addresses = addresses
+            self._index_values()
+            self._dirty = True
+            self.save()
+        return changed
+
+    def lookup(self, blockchain, value):
+        """Return what Menpo knows about an address on a blockchain, None
+        when it does not know it.
+
+        Returns:
+            dict: sorted lists of the ids of the "indicators", "addresses"
+            (SCOs), "threat_actors" and "reports" of the address, with the
+            ones of indicators on any blockchain
+
+        """
+        result = self._addresses.get(address_key(blockchain, value))
+        any_chain = self._addresses.get(address_key(ANY_BLOCKCHAIN, value))
+        if result is None or any_chain is None:
+            return result or any_chain
+        return {name: sorted(set(result[name]) | set(any_chain[name])) for name in RESULT_KEYS}
+
+    def lookup_value(self, value):
+        """Return what Menpo knows about an address on every blockchain.
+
+        Returns:
+            dict: the `lookup` results by blockchain, empty when the address
+            is unknown
+
+        """
+        return {
+            key.split(":", 1)[0]: self._addresses[key]
+            for key in self._values.get(normalize_address(value), ())
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m menpo.lookup", description="Look up wallet addresses in Menpo")
+    parser.add_argument("addresses", nargs="+", help="address values to look up")
+    parser.add_argument("--blockchain", help="only on this blockchain, every blockchain by default")
+    parser.add_argument("--stix-dir", default=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "db"))
+    parser.add_argument("--no-refresh", action="store_true", help="answer from the lookup file as it is")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    lookup = AddressLookup(args.stix_dir)
+    if not args.no_refresh:
+        lookup.refresh()
+
+    results = {}
+    for value in args.addresses:
+        if args.blockchain:
+            result = lookup.lookup(args.blockchain, value)
+            results[value] = {args.blockchain.strip().lower(): result} if result is not None else {}
+        else:
+            results[value] = lookup.lookup_value(value)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        for value, by_blockchain in results.items():
+            if not by_blockchain:
+                print(f"{value}: not found")
+            for blockchain, result in sorted(by_blockchain.items()):
+                print(f"{value} ({blockchain})")
+                for name in RESULT_KEYS:
+                    for stix_id in result[name]:
+                        print(f"    {name:<14}{stix_id}")
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""Content-hash manifest of the object versions of a FileSystemStore directory.
+
+The manifest lives in `<stix_dir>/.menpo-manifest.json`, next to the index,
+and maps every object id and version to the SHA-256 of the canonical JSON
+(RFC 8785, as implemented by stix2) of that version, along with the mtime of
+its file.  Ingestion compares the objects it is about to write with it:
+
+- added: the version is not stored yet, it is written;
+- changed: the version is stored with a different content (the script was
+  edited without a new `modified`), it is refused with a
+  `ChangedVersionError`: a stored version never changes, its `modified`
+  has to be bumped to write the edit as a new version;
+- unchanged: nothing is written.
+
+Files whose mtime no longer matches the manifest (or which are missing from
+it) are hashed again, so the manifest never has to be rebuilt by hand.
+"""
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+from stix2.canonicalization.Canonicalize import canonicalize
+
+from menpo.index import version_filename
+
+MANIFEST_FILENAME = ".menpo-manifest.json"
+
+# Bump whenever the layout changes, older manifests are then rebuilt
+MANIFEST_VERSION = 1
+
+
+class ChangedVersionError(ValueError):
+    """Raised when stored versions would be rewritten with another content.
+
+    Attributes:
+        stix_objs (list): the changed objects
+
+    """
+    def __init__(self, stix_objs):
+        self.stix_objs = stix_objs
+        versions = ", ".join("%s (%s)" % (stix_obj["id"], stix_obj.get("modified", "")) for stix_obj in stix_objs[:5])
+        super(ChangedVersionError, self).__init__(
+            "%d stored version(s) edited without a new modified timestamp, bump their modified to write the edit "
+            "as a new version: %s%s" % (len(stix_objs), versions, ", ..." if len(stix_objs) > 5 else ""),
+        )
+
+
+def refuse_changed(changed):
+    """Raise a ChangedVersionError for the changed versions of `classify`,
+    if there are any."""
+    if changed:
+        raise ChangedVersionError([stix_obj for stix_obj, _ in changed])
+
+
+def _as_dict(stix_obj):
+    if hasattr(stix_obj, "serialize"):
+        return json.loads(stix_obj.serialize())
+    return stix_obj
+
+
+def content_hash(stix_obj):
+    """SHA-256 of the canonical JSON of a STIX object (dict or stix2 object)."""
+    return hashlib.sha256(canonicalize(_as_dict(stix_obj))).hexdigest()
+
+
+def version_key(stix_obj):
+    """Key of an object version in the manifest, its version filename."""
+    if "modified" in stix_obj:
+        return version_filename(stix_obj["modified"])
+    return ""
+
+
+class Manifest(object):
+    """Content hashes of the object versions of a FileSystemStore directory.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        filename (str): name of the manifest file inside `stix_dir`
+        encoding (str): The encoding to use when reading object files.
+
+    """
+    def __init__(self, stix_dir, filename=MANIFEST_FILENAME, encoding="utf-8"):
+        self._stix_dir = os.path.abspath(stix_dir)
+        self._path = os.path.join(self._stix_dir, filename)
+        self.encoding = encoding
+        self._objects = {}
+        self._dirty = False
+        self.load()
+
+    @property
+    def path(self):
+        return self._path
+
+    def __len__(self):
+        return sum(len(versions) for versions in self._objects.values())
+
+    def load(self):
+        """Load the manifest file, if there is one with the current layout."""
+        self._objects = {}
+        try:
+            with io.open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+
+        if data.get("version") == MANIFEST_VERSION:
+            self._objects = data["objects"]
+
+    def save(self):
+        """Atomically write the manifest file, if anything changed."""
+        if not self._dirty:
+            return
+
+        data = {"version": MANIFEST_VERSION, "objects": self._objects}
+        fd, tmp_path = tempfile.mkstemp(dir=self._stix_dir, prefix=".menpo-tmp-")
+        try:
+            with io.open(fd, "w", encoding="utf-8") as f:
+                # dumps, unlike dump, uses the C encoder
+                f.write(json.dumps(data, separators=(",", ":")))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self._path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self._dirty = False
+
+    def file_path(self, stix_obj):
+        """Path of the file of an object version, as written by FileSystemSink."""
+        type_dir = os.path.join(self._stix_dir, stix_obj["type"])
+        key = version_key(stix_obj)
+        if key:
+            return os.path.join(type_dir, stix_obj["id"], key + ".json")
+        return os.path.join(type_dir, stix_obj["id"] + ".json")
+
+    def stored_hash(self, stix_obj):
+        """Content hash of the stored version of `stix_obj`, None when that
+        version is not stored.  Files which changed since they were hashed are
+        read and hashed again."""
+        stix_id, key = stix_obj["id"], version_key(stix_obj)
+        path = self.file_path(stix_obj)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            if self._objects.get(stix_id, {}).pop(key, None) is not None:
+                self._dirty = True
+            return None
+
+        entry = self._objects.get(stix_id, {}).get(key)
+        if entry is not None and entry[1] == mtime:
+            return entry[0]
+
+        with io.open(path, "r", encoding=self.encoding) as f:
+            stored = json.load(f)
+        if stored.get("type") == "bundle":
+            stored = stored["objects"][0]
+
+        digest = content_hash(stored)
+        self._objects.setdefault(stix_id, {})[key] = [digest, mtime]
+        self._dirty = True
+        return digest
+
+    def record(self, stix_obj, digest=None):
+        """Record a version that has just been written to the store.  Call
+        `save` to persist the change."""
+        if digest is None:
+            digest = content_hash(stix_obj)
+        mtime = os.stat(self.file_path(stix_obj)).st_mtime_ns
+        self._objects.setdefault(stix_obj["id"], {})[version_key(stix_obj)] = [digest, mtime]
+        self._dirty = True
+
+    def classify(self, stix_objs):
+        """Split objects into added, changed and unchanged versions.
+
+        A version repeated in `stix_objs` only counts once, the first
+        occurrence is kept.
+
+        Returns:
+            tuple: three lists of `(stix_obj, digest)` pairs
+
+        """
+        added, changed, unchanged = [], [], []
+        seen = set()
+        for stix_obj in stix_objs:
+            version = (stix_obj["id"], version_key(stix_obj))
+            if version in seen:
+                continue
+            seen.add(version)
+
+            digest = content_hash(stix_obj)
+            stored = self.stored_hash(stix_obj)
+            if stored is None:
+                added.append((stix_obj, digest))
+            elif stored != digest:
+                changed.append((stix_obj, digest))
+            else:
+                unchanged.append((stix_obj, digest))
+        return added, changed, unchanged
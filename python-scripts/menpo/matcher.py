@@ -0,0 +1,539 @@
+"""Batch matching of observed addresses against every indicator pattern.
+
+Evaluating STIX patterns one by one against each observed address does not
+scale to wallet screening.  `IndicatorMatcher` parses every pattern once and
+lowers it, whenever it is a disjunction of
+
+    x-defi-address:value = '...' [AND x-defi-address:blockchain = '...']
+
+(equalities, IN lists, AND, OR, parentheses and OR between observations,
+which covers the patterns Menpo writes), into hash table entries keyed by
+blockchain and normalized value (see `menpo.registry`).  The same goes for
+`x-defi-transaction:value` comparisons, whose blockchain Menpo compares
+through `x-defi-address:blockchain`.  Matching an
+observed address is then one or two dict lookups, whatever the number of
+indicators.
+
+Other patterns are compiled into a predicate over the observed object,
+from the stix2 pattern AST, and evaluated for every address (with its
+blockchain lowercased, and blockchain and value constants normalized the
+same way): `!=`, `<`, `>`, `LIKE`, `MATCHES`, `NOT` and
+comparisons of other properties are supported.  Patterns which need several observations (observation AND,
+FOLLOWEDBY, qualifiers) or set operators can never match a single address
+and are only listed in `unsupported`:
+
+    from menpo.matcher import IndicatorMatcher
+
+    matcher = IndicatorMatcher.from_store("../db")
+    matcher.match("ethereum", "0x57A72cE4fd69eBEdEfC1a938b690fbf11A7Dff80")
+    hits = matcher.match_batch(observed)  # [(position, indicator ids)]
+"""
+import io
+import json
+import operator
+import os
+import re
+
+from stix2.pattern_visitor import STIXPatternVisitorForSTIX21
+from stix2.patterns import (
+    AndBooleanExpression, BasicObjectPathComponent, EqualityComparisonExpression,
+    InComparisonExpression, ListConstant, ObservationExpression, OrBooleanExpression,
+    OrObservationExpression, ParentheticalExpression, StringConstant, _ComparisonExpression,
+)
+from stix2patterns.v21.grammars.STIXPatternParser import STIXPatternParser
+from stix2patterns.v21.pattern import Pattern
+
+from menpo.index import FileSystemIndex
+from menpo.registry import ADDRESS_TYPE, normalize_address, split_blockchains
+
+# Beyond this number of conjunctions, a pattern is evaluated instead
+MAX_CONJUNCTIONS = 256
+
+_TOKEN = re.compile(r"\s*(?:([\[\]()])|(AND|OR)(?![\w-])|([a-z0-9-]+):([a-z0-9_]+)\s*=\s*'((?:[^'\\]|\\['\\])*)')")
+
+
+class UnsupportedPatternError(ValueError):
+    """Raised when a pattern cannot match a single observed object."""
+    pass
+
+
+def _unquote(value):
+    return value.replace("\\'", "'").replace("\\\\", "\\")
+
+
+def _and(left, right):
+    conjunctions = []
+    for left_terms in left:
+        for right_terms in right:
+            if any(right_terms.get(path, value) != value for path, value in left_terms.items()):
+                # The same property equal to two values
+                continue
+            terms = dict(left_terms)
+            terms.update(right_terms)
+            conjunctions.append(terms)
+    if len(conjunctions) > MAX_CONJUNCTIONS:
+        return None
+    return conjunctions
+
+
+def _or(left, right):
+    if len(left) + len(right) > MAX_CONJUNCTIONS:
+        return None
+    return left + right
+
+
+class _Parser(object):
+    # The usual Menpo patterns, straight into disjunctive normal form: a list
+    # of {(object type, property): value} conjunctions.  parse() returns None
+    # for anything else.
+
+    def __init__(self, pattern):
+        self.tokens = []
+        position = 0
+        while position < len(pattern):
+            match = _TOKEN.match(pattern, position)
+            if match is None:
+                if pattern[position:].strip():
+                    self.tokens = None
+                break
+            self.tokens.append(match.groups())
+            position = match.end()
+        self.position = 0
+
+    def _peek(self, *values):
+        if self.position < len(self.tokens):
+            token = self.tokens[self.position]
+            if token[0] in values or token[1] in values:
+                self.position += 1
+                return True
+        return False
+
+    def _expression(self):
+        # or-expression := and-expression (OR and-expression)*
+        result = self._term()
+        while result is not None and self._peek("OR"):
+            right = self._term()
+            result = _or(result, right) if right is not None else None
+        return result
+
+    def _term(self):
+        result = self._factor()
+        while result is not None and self._peek("AND"):
+            right = self._factor()
+            result = _and(result, right) if right is not None else None
+        return result
+
+    def _factor(self):
+        if self._peek("("):
+            result = self._expression()
+            return result if self._peek(")") else None
+        if self.position < len(self.tokens) and self.tokens[self.position][2] is not None:
+            _, _, stix_type, prop, literal = self.tokens[self.position]
+            self.position += 1
+            return [{(stix_type, prop): _unquote(literal)}]
+        return None
+
+    def _observation(self):
+        if not self._peek("["):
+            return None
+        result = self._expression()
+        return result if self._peek("]") else None
+
+    def parse(self):
+        if not self.tokens:
+            return None
+        result = self._observation()
+        while result is not None and self._peek("OR"):
+            right = self._observation()
+            result = _or(result, right) if right is not None else None
+        if self.position != len(self.tokens):
+            return None
+        return result
+
+
+class _Visitor(STIXPatternVisitorForSTIX21):
+    # stix2 drops the NOT of IN, LIKE and MATCHES comparisons, and turns
+    # NOT != into !=
+
+    def _negated(self, ctx, name):
+        children = self.visitChildren(ctx)
+        negated = len(children) > 3
+        return self.instantiate(name, children[0], children[-1], negated)
+
+    def visitPropTestEqual(self, ctx):
+        children = self.visitChildren(ctx)
+        negated = len(children) > 3
+        if children[-2].symbol.type == self.parser_class.NEQ:
+            negated = not negated
+        return self.instantiate("EqualityComparisonExpression", children[0], children[-1], negated)
+
+    def visitPropTestSet(self, ctx):
+        return self._negated(ctx, "InComparisonExpression")
+
+    def visitPropTestLike(self, ctx):
+        return self._negated(ctx, "LikeComparisonExpression")
+
+    def visitPropTestRegex(self, ctx):
+        return self._negated(ctx, "MatchesComparisonExpression")
+
+
+def parse_pattern(pattern):
+    """The stix2 AST of a STIX 2.1 pattern."""
+    return Pattern(pattern).visit(_Visitor(STIXPatternParser, "", ""))
+
+
+def _constant(rhs):
+    if isinstance(rhs, ListConstant):
+        return [_constant(constant) for constant in rhs.value]
+    if isinstance(rhs, StringConstant):
+        # The AST keeps the escapes of the literal
+        return _unquote(rhs.value)
+    return rhs.value
+
+
+def _lower(node):
+    # The disjunctive normal form of an AST, None when it has other parts
+    if isinstance(node, (ObservationExpression, ParentheticalExpression)):
+        return _lower(node.operand if isinstance(node, ObservationExpression) else node.expression)
+    if isinstance(node, (OrObservationExpression, OrBooleanExpression, AndBooleanExpression)):
+        result = _lower(node.operands[0])
+        for operand in node.operands[1:]:
+            if result is None:
+                return None
+            right = _lower(operand)
+            if right is None:
+                return None
+            result = _and(result, right) if isinstance(node, AndBooleanExpression) else _or(result, right)
+        return result
+    if isinstance(node, (EqualityComparisonExpression, InComparisonExpression)) and not node.negated \
+            and len(node.lhs.property_path) == 1 and isinstance(node.lhs.property_path[0], BasicObjectPathComponent):
+        path = (node.lhs.object_type_name, node.lhs.property_path[0].property_name)
+        values = _constant(node.rhs)
+        if not isinstance(values, list):
+            values = [values]
+        if all(isinstance(value, str) for value in values):
+            return [{path: value} for value in values]
+    return None
+
+
+def _like(pattern):
+    regex = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in pattern)
+    return re.compile(regex, re.DOTALL).fullmatch
+
+
+_ORDER = {"<": operator.lt, ">": operator.gt, "<=": operator.le, ">=": operator.ge}
+
+
+def _lowercase(value):
+    return value.strip().lower()
+
+
+# Properties compared in their normalized form, as in the hash tables
+_NORMALIZED = {"blockchain": _lowercase, "value": normalize_address}
+
+
+def _normalizer(prop):
+    # The normalization of a property, which leaves other values alone
+    normalize = _NORMALIZED.get(prop)
+    if normalize is None:
+        return lambda value: value
+    return lambda value: normalize(value) if isinstance(value, str) else value
+
+
+def _equal_constants(prop, constants):
+    # A blockchain literal may list several blockchains, as SCOs do
+    if prop == "blockchain":
+        return frozenset(
+            blockchain for constant in constants
+            for blockchain in (split_blockchains(constant) if isinstance(constant, str) else (constant,))
+        )
+    normalize = _normalizer(prop)
+    return frozenset(normalize(constant) for constant in constants)
+
+
+def _comparison(node):
+    path = []
+    for component in node.lhs.property_path:
+        if not isinstance(component, BasicObjectPathComponent):
+            raise UnsupportedPatternError("object path %s" % node.lhs)
+        path.append(component.property_name)
+    stix_type, negated, constant = node.lhs.object_type_name, node.negated, _constant(node.rhs)
+    prop = path[0] if len(path) == 1 else None
+    normalize = _normalizer(prop)
+
+    if node.operator in ("=", "IN"):
+        constants = _equal_constants(prop, constant if node.operator == "IN" else [constant])
+
+        def test(value):
+            return normalize(value) in constants
+    elif node.operator in _ORDER:
+        order, constant = _ORDER[node.operator], normalize(constant)
+
+        def test(value):
+            return order(normalize(value), constant)
+    elif node.operator == "LIKE":
+        # Observed blockchains are lowercased; address values are compared
+        # as they are, a pattern cannot be normalized
+        test = _like(constant.lower() if prop == "blockchain" else constant)
+    elif node.operator == "MATCHES":
+        test = re.compile(constant, re.IGNORECASE if prop == "blockchain" else 0).search
+    else:
+        raise UnsupportedPatternError("operator %s" % node.operator)
+
+    def compare(stix_obj):
+        if stix_obj.get("type") != stix_type:
+            return False
+        value = stix_obj
+        for name in path:
+            value = value.get(name) if isinstance(value, dict) else None
+        if value is None:
+            # Missing properties never match, negated or not
+            return False
+        try:
+            return bool(test(value)) != negated
+        except TypeError:
+            return False
+    return compare
+
+
+def compile_predicate(node):
+    """A function telling whether a single observed object (a dict) matches
+    a pattern AST.
+
+    Raises:
+        UnsupportedPatternError: the pattern needs several observations, or
+            uses an operator which is not supported
+
+    """
+    if isinstance(node, ObservationExpression):
+        return compile_predicate(node.operand)
+    if isinstance(node, ParentheticalExpression):
+        return compile_predicate(node.expression)
+    if isinstance(node, (OrObservationExpression, OrBooleanExpression)):
+        predicates = [compile_predicate(operand) for operand in node.operands]
+        return lambda stix_obj: any(predicate(stix_obj) for predicate in predicates)
+    if isinstance(node, AndBooleanExpression):
+        predicates = [compile_predicate(operand) for operand in node.operands]
+        return lambda stix_obj: all(predicate(stix_obj) for predicate in predicates)
+    if isinstance(node, _ComparisonExpression):
+        return _comparison(node)
+    raise UnsupportedPatternError("%s cannot match a single observation" % type(node).__name__)
+
+
+def _entries(conjunctions):
+    # The (stix type, blockchain or None, value) lookups of a pattern,
+    # None when they do not say it all
+    entries = []
+    for terms in conjunctions:
+        if any(prop not in ("value", "blockchain") for _, prop in terms):
+            return None
+        values = [(stix_type, value) for (stix_type, prop), value in terms.items() if prop == "value"]
+        blockchains = {value for (_, prop), value in terms.items() if prop == "blockchain"}
+        if len(values) != 1:
+            if len({stix_type for stix_type, _ in terms}) > 1:
+                # Properties of several objects: no single address matches
+                continue
+            return None
+        if len(blockchains) > 1:
+            continue
+        # Menpo's transaction indicators compare the blockchain through
+        # x-defi-address:blockchain: it is the one of the compared value
+        stix_type, value = values[0]
+        if not blockchains:
+            entries.append((stix_type, None, value))
+        else:
+            # A blockchain literal may list several blockchains, as SCOs do
+            entries.extend((stix_type, blockchain, value) for blockchain in split_blockchains(blockchains.pop()))
+    return entries
+
+
+def pattern_lookups(pattern):
+    """The hash table entries a pattern is lowered to, see the module
+    docstring.
+
+    Returns:
+        list: `(stix type, blockchain, value)` triples, the blockchain is
+        None for comparisons of a value on any blockchain; None when the
+        pattern is evaluated instead
+
+    Raises:
+        Exception: the pattern is not valid
+
+    """
+    conjunctions = _Parser(pattern).parse()
+    if conjunctions is None:
+        conjunctions = _lower(parse_pattern(pattern))
+    return _entries(conjunctions) if conjunctions is not None else None
+
+
+class IndicatorMatcher(object):
+    """Observed addresses to the indicators whose pattern they match.
+
+    Attributes:
+        lowered (int): the number of patterns answered by hash lookups
+        evaluated (list): ids of the indicators whose patterns are evaluated
+        unsupported (list): `(indicator id, reason)` of the patterns which
+            are never matched
+
+    """
+    def __init__(self):
+        # stix type -> blockchain -> normalized value -> indicator ids
+        self._keys = {}
+        # stix type -> value -> indicator ids, patterns on any blockchain
+        self._values = {}
+        self._predicates = []
+        self.lowered = 0
+        self.evaluated = []
+        self.unsupported = []
+
+    def __len__(self):
+        return self.lowered + len(self.evaluated)
+
+    @classmethod
+    def from_store(cls, stix_dir, index=None):
+        """Compile the indicators of a FileSystemStore directory.
+
+        Args:
+            stix_dir (str): path to directory of STIX objects
+            index (FileSystemIndex): an up to date index of the store, one is
+                refreshed here by default
+
+        """
+        if index is None:
+            index = FileSystemIndex(stix_dir)
+            index.refresh()
+        matcher = cls()
+        for entry in index.entries("indicator"):
+            with io.open(os.path.join(index.stix_dir, entry["path"]), "r", encoding=index.encoding) as f:
+                matcher.add_indicator(json.load(f))
+        return matcher
+
+    def add(self, indicator_id, pattern):
+        """Compile the pattern of an indicator.
+
+        Returns:
+            bool: whether the pattern can match an address at all
+
+        """
+        conjunctions = _Parser(pattern).parse()
+        ast = None
+        if conjunctions is None:
+            try:
+                ast = parse_pattern(pattern)
+            except Exception as e:
+                self.unsupported.append((indicator_id, str(e)))
+                return False
+            conjunctions = _lower(ast)
+
+        entries = _entries(conjunctions) if conjunctions is not None else None
+        if entries is not None:
+            for stix_type, blockchain, value in entries:
+                if blockchain is None:
+                    table = self._values.setdefault(stix_type, {})
+                else:
+                    table = self._keys.setdefault(stix_type, {}).setdefault(blockchain.strip().lower(), {})
+                key = normalize_address(value)
+                ids = table.get(key, ())
+                if indicator_id not in ids:
+                    table[key] = ids + (indicator_id,)
+            self.lowered += 1
+            return True
+
+        try:
+            predicate = compile_predicate(ast if ast is not None else parse_pattern(pattern))
+        except Exception as e:
+            # UnsupportedPatternError, or a pattern stix2 cannot build
+            self.unsupported.append((indicator_id, str(e)))
+            return False
+        self._predicates.append((indicator_id, predicate))
+        self.evaluated.append(indicator_id)
+        return True
+
+    def add_indicator(self, indicator):
+        """Compile an indicator (dict or stix2 object), unless it is revoked
+        or its pattern is not a STIX one.
+
+        Returns:
+            bool: whether the pattern can match an address at all
+
+        """
+        if indicator.get("revoked") or indicator.get("pattern_type") != "stix":
+            return False
+        return self.add(indicator["id"], indicator["pattern"])
+
+    @property
+    def lookups_only(self):
+        """Whether every pattern is answered by the (blockchain, value)
+        lookups of `lookups()`."""
+        return not self._values and not self._predicates
+
+    def lookups(self, any_blockchain=False):
+        """Yield `(stix type, blockchain, normalized value, indicator ids)`
+        for every hash table entry on a given blockchain.
+
+        Args:
+            any_blockchain (bool): also yield the entries of the patterns
+                which compare a value on any blockchain, with a None
+                blockchain
+
+        """
+        for stix_type, blockchains in self._keys.items():
+            for blockchain, table in blockchains.items():
+                for value, ids in table.items():
+                    yield stix_type, blockchain, value, ids
+        if any_blockchain:
+            for stix_type, table in self._values.items():
+                for value, ids in table.items():
+                    yield stix_type, None, value, ids
+
+    def match(self, blockchain, value, stix_type=ADDRESS_TYPE):
+        """Return the ids of the indicators an observed address matches.
+
+        Returns:
+            list: indicator ids, without duplicates
+
+        """
+        table = self._keys.get(stix_type, {}).get(blockchain.strip().lower())
+        ids = table.get(normalize_address(value), ()) if table else ()
+        any_chain = self._values.get(stix_type)
+        if any_chain:
+            ids = ids + any_chain.get(normalize_address(value), ())
+        if self._predicates:
+            observed = {"type": stix_type, "blockchain": blockchain.strip().lower(), "value": value.strip()}
+            ids = ids + tuple(indicator_id for indicator_id, predicate in self._predicates if predicate(observed))
+        return list(dict.fromkeys(ids))
+
+    def match_batch(self, observations, stix_type=ADDRESS_TYPE):
+        """Match a batch of observed addresses.
+
+        Args:
+            observations (iterable): `(blockchain, value)` pairs
+
+        Returns:
+            list: `(position, indicator ids)` of the observations which match
+            any indicator, in order
+
+        """
+        keys = self._keys.get(stix_type, {})
+        if self._values.get(stix_type) or self._predicates:
+            match = self.match
+            return [
+                (position, ids) for position, ids in (
+                    (position, match(blockchain, value, stix_type))
+                    for position, (blockchain, value) in enumerate(observations)
+                ) if ids
+            ]
+
+        # Only exact entries: match() inlined, with the tables of the
+        # blockchains cached as they are written
+        hits = []
+        tables = {}
+        for position, (blockchain, value) in enumerate(observations):
+            table = tables.get(blockchain)
+            if table is None:
+                table = tables[blockchain] = keys.get(blockchain.strip().lower(), {})
+            if table:
+                ids = table.get(normalize_address(value))
+                if ids:
+                    hits.append((position, list(ids)))
+        return hits
@@ -0,0 +1,40 @@
+"""Normalized forms of blockchains and address values.
+
+Only the standard library is used here, so that the filter loader
+(`menpo.flagged`) can run where stix2 is not installed:
+
+- blockchains are lowercased, and a `blockchain` property may list several
+  of them (`"ethereum, bsc"`);
+- hex (EVM) and bech32 addresses, which are case-insensitive, are
+  lowercased; other encodings (base58) are kept as they are.
+"""
+import re
+
+BLOCKCHAIN_SEPARATORS = re.compile(r"[,|]")
+
+# Blockchain under which the values compared on any blockchain are kept
+ANY_BLOCKCHAIN = "*"
+
+# Hex and bech32 (bc1..., tb1..., ltc1...) addresses do not depend on case
+_HEX_DIGITS = "0123456789abcdefABCDEF"
+_BECH32 = re.compile(r"(bc|tb|bcrt|ltc|tltc)1[02-9ac-hj-np-z]+", re.IGNORECASE)
+_BECH32_STARTS = ("bc", "tb", "lt", "tl")
+
+
+def split_blockchains(blockchain):
+    """The lowercased blockchains of a `blockchain` property, which may list
+    several of them separated by commas or `|`."""
+    return [b.strip().lower() for b in BLOCKCHAIN_SEPARATORS.split(blockchain) if b.strip()]
+
+
+def normalize_address(value):
+    """The form of an address value which is compared, see the module
+    docstring."""
+    value = value.strip()
+    # Screening normalizes every observed address: no regex for hex ones
+    if value[:2] in ("0x", "0X"):
+        if len(value) > 2 and not value[2:].strip(_HEX_DIGITS):
+            return value.lower()
+    elif value[:2].lower() in _BECH32_STARTS and _BECH32.fullmatch(value):
+        return value.lower()
+    return value
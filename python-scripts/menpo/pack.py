@@ -0,0 +1,285 @@
+"""Packed single-file snapshots of a FileSystemStore directory.
+
+The `db/` tree stays the source of truth, a pack is a read-only snapshot of
+it made of two files:
+
+- `<name>.pack`: every version file of the tree, byte for byte, one after
+  the other, after an 8 byte magic.  A full scan is one sequential read.
+- `<name>.pack.idx`: a header, a table of fixed-size entries sorted by STIX
+  id (and version, oldest first) and a string table with the relative path of
+  each version file.  Each entry holds the offset and length of the object in
+  the pack, so both files can be memory-mapped and any object is reached with
+  a binary search and no copy.
+
+Usage:
+
+    python3 -m menpo.pack build ../db db.pack
+    python3 -m menpo.pack unpack db.pack ../db
+    python3 -m menpo.pack get db.pack report--64711080-3ce3-57df-9923-7e35db256427
+"""
+import argparse
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from menpo.index import version_paths
+
+PACK_MAGIC = b"MENPOPK1"
+INDEX_MAGIC = b"MENPOIX1"
+INDEX_SUFFIX = ".idx"
+
+# magic, entry count, string table offset
+_HEADER = struct.Struct("<8sIQ")
+# object offset, object length, path offset, path length
+_ENTRY = struct.Struct("<QIIH")
+
+
+def _id_from_path(path):
+    parts = path.split("/")
+    if len(parts) == 3:
+        return parts[1]
+    return parts[1][:-len(".json")]
+
+
+def _atomic_writer(path):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".menpo-tmp-")
+    os.chmod(tmp_path, 0o644)
+    return io.open(fd, "wb"), tmp_path
+
+
+def build_pack(stix_dir, pack_path):
+    """Pack every version file of `stix_dir` into `pack_path`.
+
+    The pack and its index (`pack_path + ".idx"`) are replaced atomically.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        pack_path (str): path of the pack file to write
+
+    Returns:
+        int: The number of packed version files.
+
+    """
+    stix_dir = os.path.abspath(stix_dir)
+    paths = version_paths(stix_dir)
+
+    entries = []
+    strings = io.BytesIO()
+    pack_file, pack_tmp = _atomic_writer(pack_path)
+    try:
+        with pack_file:
+            pack_file.write(PACK_MAGIC)
+            offset = len(PACK_MAGIC)
+            for path in paths:
+                with io.open(os.path.join(stix_dir, path), "rb") as f:
+                    data = f.read()
+                pack_file.write(data)
+
+                encoded_path = path.encode("utf-8")
+                entries.append(_ENTRY.pack(offset, len(data), strings.tell(), len(encoded_path)))
+                strings.write(encoded_path)
+                offset += len(data)
+
+        index_file, index_tmp = _atomic_writer(pack_path + INDEX_SUFFIX)
+        try:
+            with index_file:
+                index_file.write(_HEADER.pack(INDEX_MAGIC, len(entries), _HEADER.size + _ENTRY.size * len(entries)))
+                index_file.write(b"".join(entries))
+                index_file.write(strings.getvalue())
+            os.replace(pack_tmp, pack_path)
+            os.replace(index_tmp, pack_path + INDEX_SUFFIX)
+        except BaseException:
+            if os.path.exists(index_tmp):
+                os.unlink(index_tmp)
+            raise
+    except BaseException:
+        if os.path.exists(pack_tmp):
+            os.unlink(pack_tmp)
+        raise
+
+    return len(entries)
+
+
+class PackReader(object):
+    """Memory-mapped, read-only access to a pack.
+
+    Args:
+        pack_path (str): path of the pack file, its index is expected at
+            `pack_path + ".idx"`
+
+    """
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+
+        with io.open(pack_path, "rb") as f:
+            self._pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with io.open(pack_path + INDEX_SUFFIX, "rb") as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._pack[:len(PACK_MAGIC)] != PACK_MAGIC:
+            raise ValueError("not a menpo pack: %s" % pack_path)
+        magic, self._count, self._strings = _HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError("not a menpo pack index: %s" % (pack_path + INDEX_SUFFIX))
+
+    def close(self):
+        self._pack.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def _entry(self, i):
+        return _ENTRY.unpack_from(self._index, _HEADER.size + _ENTRY.size * i)
+
+    def path(self, i):
+        """Relative path of the i-th version file."""
+        _, _, path_offset, path_length = self._entry(i)
+        start = self._strings + path_offset
+        return self._index[start:start + path_length].decode("utf-8")
+
+    def _range(self, stix_id):
+        # Entries are sorted by id, find the first one which is >= stix_id
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _id_from_path(self.path(mid)) < stix_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        end = lo
+        while end < self._count and _id_from_path(self.path(end)) == stix_id:
+            end += 1
+        return lo, end
+
+    def _raw(self, i):
+        offset, length, _, _ = self._entry(i)
+        return memoryview(self._pack)[offset:offset + length]
+
+    def get_raw(self, stix_id):
+        """Zero-copy view of the JSON bytes of the latest version, or None.
+
+        The view must be released (or dropped) before the reader is closed.
+
+        """
+        start, end = self._range(stix_id)
+        if start == end:
+            return None
+        return self._raw(end - 1)
+
+    def get(self, stix_id):
+        """Latest version of `stix_id` as a dict, or None."""
+        raw = self.get_raw(stix_id)
+        if raw is None:
+            return None
+        with raw:
+            return json.loads(bytes(raw))
+
+    def all_versions(self, stix_id):
+        """Every version of `stix_id` as dicts, oldest first."""
+        versions = []
+        for i in range(*self._range(stix_id)):
+            with self._raw(i) as raw:
+                versions.append(json.loads(bytes(raw)))
+        return versions
+
+    def ids(self):
+        """Every packed STIX id, sorted."""
+        seen = None
+        for i in range(self._count):
+            stix_id = _id_from_path(self.path(i))
+            if stix_id != seen:
+                seen = stix_id
+                yield stix_id
+
+    def __iter__(self):
+        """Yield `(path, raw bytes)` for every version file, in pack order,
+        which is a single sequential pass over the pack.  See `get_raw`
+        about releasing the views."""
+        for i in range(self._count):
+            yield self.path(i), self._raw(i)
+
+
+def unpack(pack_path, stix_dir, overwrite=False):
+    """Write every version file of a pack back into a directory tree.
+
+    Files which already exist with the same content are left alone.
+
+    Args:
+        pack_path (str): path of the pack file
+        stix_dir (str): path to directory of STIX objects
+        overwrite (bool): replace existing files whose content differs,
+            instead of raising ValueError.
+
+    Returns:
+        int: The number of written files.
+
+    """
+    written = 0
+    with PackReader(pack_path) as reader:
+        for path, raw in reader:
+            with raw:
+                file_path = os.path.join(stix_dir, *path.split("/"))
+                if os.path.exists(file_path):
+                    with io.open(file_path, "rb") as f:
+                        if f.read() == raw:
+                            continue
+                    if not overwrite:
+                        raise ValueError("Attempted to overwrite file (!) at: {}".format(file_path))
+
+                obj_dir = os.path.dirname(file_path)
+                if not os.path.exists(obj_dir):
+                    os.makedirs(obj_dir)
+                with io.open(file_path, "wb") as f:
+                    f.write(raw)
+                written += 1
+
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m menpo.pack", description="Build, unpack and read db/ packs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="pack a STIX directory")
+    build.add_argument("stix_dir")
+    build.add_argument("pack_path")
+
+    unpack_ = commands.add_parser("unpack", help="write a pack back into a STIX directory")
+    unpack_.add_argument("pack_path")
+    unpack_.add_argument("stix_dir")
+    unpack_.add_argument("--overwrite", action="store_true", help="replace files whose content differs")
+
+    get = commands.add_parser("get", help="print the latest version of an object")
+    get.add_argument("pack_path")
+    get.add_argument("stix_id")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        print("Packed", build_pack(args.stix_dir, args.pack_path), "files")
+    elif args.command == "unpack":
+        print("Wrote", unpack(args.pack_path, args.stix_dir, overwrite=args.overwrite), "files")
+    else:
+        with PackReader(args.pack_path) as reader:
+            stix_obj = reader.get(args.stix_id)
+            if stix_obj is None:
+                print("Not found:", args.stix_id, file=sys.stderr)
+                return 1
+            print(json.dumps(stix_obj, indent=4, ensure_ascii=False))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""Canonical registry of the `x-defi-address` SCOs of a FileSystemStore directory.
+
+The same wallet can be stored as several `x-defi-address` SCOs: older
+scripts gave them random ids, and deterministic ids (see `menpo.ids`) still
+differ when the value is written in another case (checksummed and lowercase
+hex addresses are the same address) or the blockchain is capitalized.  The
+registry maps every (blockchain, normalized value) pair to one SCO id:
+
+- blockchains are lowercased, and an SCO listing several of them
+  (`"ethereum, bsc"`) is registered under each one;
+- hex (EVM) and bech32 addresses, which are case-insensitive, are
+  lowercased; other encodings (base58) are kept as they are (see
+  `menpo.normalize`).
+
+The oldest SCO of an address is its canonical one.  Ingestion
+(`menpo.ingest`, `menpo.addresses` and `menpo.stream`) resolves the
+addresses it writes through the registry, so an address seen again in
+another incident reuses the stored SCO instead of adding one, and joining
+incidents on an address is a dict lookup instead of a scan of every address
+file.
+
+The registry lives in `<stix_dir>/.menpo-addresses.json`, next to the index,
+and is refreshed through it: only the SCOs whose directory changed are read
+again.
+
+    cd python-scripts
+    python3 -m menpo.registry 0x57A72cE4fd69eBEdEfC1a938b690fbf11A7Dff80 --blockchain ethereum
+    python3 -m menpo.registry --duplicates
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+
+from menpo.ids import remap_ids
+from menpo.index import FileSystemIndex, _read_json, normalize_timestamp
+from menpo.normalize import normalize_address, split_blockchains  # noqa: F401 (re-exported)
+
+ADDRESS_TYPE = "x-defi-address"
+
+REGISTRY_FILENAME = ".menpo-addresses.json"
+
+# Bump whenever the layout (or the normalization) changes, older registries
+# are then rebuilt
+REGISTRY_VERSION = 1
+
+
+def address_key(blockchain, value):
+    """Registry key of an address on one blockchain."""
+    return "%s:%s" % (blockchain.strip().lower(), normalize_address(value))
+
+
+def address_keys(stix_obj):
+    """Registry keys of an `x-defi-address` SCO, one per blockchain."""
+    return [address_key(blockchain, stix_obj["value"]) for blockchain in split_blockchains(stix_obj["blockchain"])]
+
+
+class AddressRegistry(object):
+    """Canonical `x-defi-address` SCO ids by blockchain and normalized value.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        filename (str): name of the registry file inside `stix_dir`
+        encoding (str): The encoding to use when reading object files.
+
+    """
+    def __init__(self, stix_dir, filename=REGISTRY_FILENAME, encoding="utf-8"):
+        self._stix_dir = os.path.abspath(stix_dir)
+        self._path = os.path.join(self._stix_dir, filename)
+        self.encoding = encoding
+        # key -> canonical id
+        self._addresses = {}
+        # id -> [directory mtime, created, keys]
+        self._objects = {}
+        # key -> id of the SCO resolved as canonical, not written yet
+        self._pending = {}
+        self._dirty = False
+        self.load()
+
+    @property
+    def path(self):
+        return self._path
+
+    def __len__(self):
+        return len(self._addresses)
+
+    def load(self):
+        """Load the registry file, if there is one with the current layout."""
+        self._addresses = {}
+        self._objects = {}
+        self._pending = {}
+        try:
+            with io.open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+
+        if data.get("version") == REGISTRY_VERSION:
+            self._addresses = data["addresses"]
+            self._objects = data["objects"]
+
+    def save(self):
+        """Atomically write the registry file, if anything changed."""
+        if not self._dirty:
+            return
+
+        data = {"version": REGISTRY_VERSION, "addresses": self._addresses, "objects": self._objects}
+        fd, tmp_path = tempfile.mkstemp(dir=self._stix_dir, prefix=".menpo-tmp-")
+        try:
+            with io.open(fd, "w", encoding="utf-8") as f:
+                # dumps, unlike dump, uses the C encoder
+                f.write(json.dumps(data, separators=(",", ":")))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self._path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self._dirty = False
+
+    def _rebuild(self):
+        self._addresses = {}
+        for stix_id, (_, created, keys) in sorted(self._objects.items(), key=lambda item: (item[1][1], item[0])):
+            for key in keys:
+                self._addresses.setdefault(key, stix_id)
+
+    def refresh(self, index=None, save=True):
+        """Bring the registry up to date with the store.  The registry file
+        is saved when anything changed.
+
+        Args:
+            index (FileSystemIndex): an up to date index of the store, one is
+                refreshed here by default
+            save (bool): save the registry file (and the index file it
+                refreshes), False keeps the changes in memory
+
+        Returns:
+            int: The number of SCOs read or removed.
+
+        """
+        if index is None:
+            index = FileSystemIndex(self._stix_dir)
+            index.refresh(save=save)
+
+        entries = index.entries(ADDRESS_TYPE)
+        stored = {entry["id"] for entry in entries}
+        removed = [stix_id for stix_id in self._objects if stix_id not in stored]
+        stale = [entry for entry in entries if self._objects.get(entry["id"], (None,))[0] != entry["mtime"]]
+        if not removed and not stale:
+            return 0
+
+        for stix_id in removed:
+            del self._objects[stix_id]
+        for entry in stale:
+            stix_obj = _read_json(os.path.join(self._stix_dir, entry["path"]), self.encoding)
+            self._objects[entry["id"]] = [entry["mtime"], entry.get("created", ""), address_keys(stix_obj)]
+
+        self._rebuild()
+        self._dirty = True
+        if save:
+            self.save()
+        return len(removed) + len(stale)
+
+    def _register(self, stix_obj, mtime):
+        stix_id = stix_obj["id"]
+        created = normalize_timestamp(stix_obj["created"]) if "created" in stix_obj else ""
+        keys = address_keys(stix_obj)
+        self._objects[stix_id] = [mtime, created, keys]
+        for key in keys:
+            if self._pending.get(key) == stix_id:
+                del self._pending[key]
+            current = self._addresses.get(key)
+            if current is None or (current != stix_id and (created, stix_id) < (self._objects[current][1], current)):
+                self._addresses[key] = stix_id
+        self._dirty = True
+
+    def record(self, stix_obj):
+        """Record an object that has just been written to the store, objects
+        which are not address SCOs are ignored.  Call `save` to persist the
+        change."""
+        if stix_obj["type"] != ADDRESS_TYPE:
+            return
+        if "modified" in stix_obj:
+            obj_path = os.path.join(self._stix_dir, stix_obj["type"], stix_obj["id"])
+        else:
+            obj_path = os.path.join(self._stix_dir, stix_obj["type"], stix_obj["id"] + ".json")
+        self._register(stix_obj, os.stat(obj_path).st_mtime_ns)
+
+    def lookup(self, blockchain, value):
+        """Return the id of the canonical SCO of an address, or None."""
+        return self._addresses.get(address_key(blockchain, value))
+
+    def resolve(self, stix_obj):
+        """Return the id of the canonical SCO of the address of `stix_obj`,
+        an `x-defi-address` SCO about to be written.  When the address is
+        new, its own id is returned, and the addresses resolved afterwards
+        resolve to it until it is written (see `record`) or the registry is
+        loaded again.  Nothing is registered before the SCO is written."""
+        keys = address_keys(stix_obj)
+        for key in keys:
+            canonical = self._addresses.get(key) or self._pending.get(key)
+            if canonical is not None:
+                return canonical
+        for key in keys:
+            self._pending[key] = stix_obj["id"]
+        return stix_obj["id"]
+
+    def canonicalize(self, stix_objs):
+        """Drop the address SCOs of a batch which are already registered under
+        another id, and point the references to them at the canonical SCOs.
+        The deterministic ids of the objects whose references change are
+        derived again from the canonical references (see
+        `menpo.ids.remap_ids`), so that relationship ids match their refs.
+
+        Args:
+            stix_objs (list): STIX objects (stix2 objects or dicts)
+
+        Returns:
+            list: the remaining objects, in order.  Those whose references
+            changed are returned as dicts.
+
+        """
+        id_map = {}
+        for stix_obj in stix_objs:
+            if stix_obj["type"] == ADDRESS_TYPE:
+                canonical = self.resolve(stix_obj)
+                if canonical != stix_obj["id"]:
+                    id_map[stix_obj["id"]] = canonical
+        if not id_map:
+            return list(stix_objs)
+        return remap_ids([stix_obj for stix_obj in stix_objs if stix_obj["id"] not in id_map], id_map)
+
+    def items(self):
+        """Yield `(stix_id, keys)` for every registered SCO."""
+        for stix_id, (_, _, keys) in self._objects.items():
+            yield stix_id, keys
+
+    def duplicates(self):
+        """Return the SCOs which are not canonical, by canonical SCO id.
+
+        Returns:
+            dict: sets of SCO ids of the same addresses, by canonical SCO id
+
+        """
+        duplicates = {}
+        for stix_id, (_, _, keys) in self._objects.items():
+            for key in keys:
+                canonical = self._addresses[key]
+                if canonical != stix_id:
+                    duplicates.setdefault(canonical, set()).add(stix_id)
+        return duplicates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m menpo.registry", description="Look up canonical x-defi-address SCOs")
+    parser.add_argument("addresses", nargs="*", help="address values to look up")
+    parser.add_argument("--blockchain", help="blockchain of the addresses, several separated by commas or |")
+    parser.add_argument("--stix-dir", default=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "db"))
+    parser.add_argument("--duplicates", action="store_true", help="list the addresses stored as several SCOs")
+    args = parser.parse_args(argv)
+
+    if args.addresses and not args.blockchain:
+        print("Error: --blockchain is required to look up addresses", file=sys.stderr)
+        return 1
+
+    registry = AddressRegistry(args.stix_dir)
+    registry.refresh()
+
+    found = True
+    for value in args.addresses:
+        for blockchain in split_blockchains(args.blockchain):
+            stix_id = registry.lookup(blockchain, value)
+            found = found and stix_id is not None
+            print(f"{blockchain:<12}{value:<46}{stix_id or '-'}")
+
+    if args.duplicates:
+        for canonical, stix_ids in sorted(registry.duplicates().items()):
+            print(f"{canonical}: {', '.join(sorted(stix_ids))}")
+
+    if not args.addresses and not args.duplicates:
+        print(f"{len(registry)} addresses in {registry.path}")
+    return 0 if found else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""Menpo STIX extension definitions, registered with stix2 once per process.
+
+- x_defi_estimated_loss_usd for the report SDO
+- x_defi_taxonomy_* for the attack-pattern SDO
+- x-defi-address and x-defi-transaction SCOs, whose ids are derived from
+  their `blockchain` and `value` (see `menpo.ids`)
+
+stix2 keeps the registered types in a process-wide registry and refuses to
+register the same type twice, so the `data-input` scripts import them from
+here instead of declaring their own copies:
+
+    from menpo.schema import XDefiAddress
+"""
+from stix2.properties import EnumProperty, IntegerProperty, StringProperty, TimestampProperty
+from stix2.v21 import CustomExtension, CustomObservable
+
+# We can get the UUID with
+#   python3 -c "import uuid; print(str(uuid.uuid4()))"
+REPORT_EXTENSION_DEFINITION_ID = "extension-definition--393acb6c-fe64-42b5-92d5-a8ec243c4876"
+ATTACK_PATTERN_EXTENSION_DEFINITION_ID = "extension-definition--59cde1e5-2ce1-4732-a09d-596f401ba65b"
+
+# Layers of the DeFi incident taxonomy: network, consensus, smart contract,
+# protocol and auxiliary
+TAXONOMY_LAYERS = ("NET", "CON", "SC", "PRO", "AUX")
+
+
+@CustomExtension(
+    REPORT_EXTENSION_DEFINITION_ID, [
+        ("x_defi_estimated_loss_usd", IntegerProperty(required=True)),
+    ],
+)
+class ReportExtension:
+    extension_type = "toplevel-property-extension"
+
+
+@CustomExtension(
+    ATTACK_PATTERN_EXTENSION_DEFINITION_ID, [
+        ("x_defi_taxonomy_layer", EnumProperty(list(TAXONOMY_LAYERS), required=True)),
+        ("x_defi_taxonomy_incident_cause", StringProperty(required=True)),
+        ("x_defi_taxonomy_incident_type", StringProperty(required=True)),
+    ],
+)
+class AttackPatternExtension:
+    extension_type = "toplevel-property-extension"
+
+
+@CustomObservable('x-defi-address', [
+    ('name', StringProperty(required=True)),
+    ('description', StringProperty(required=True)),
+    ('created', TimestampProperty(required=True)),
+    ('modified', TimestampProperty(required=True)),
+    ('blockchain', StringProperty(required=True)),
+    ('value', StringProperty(required=True)),
+], id_contrib_props=['blockchain', 'value'])
+class XDefiAddress():
+    pass
+
+
+@CustomObservable('x-defi-transaction', [
+    ('name', StringProperty(required=True)),
+    ('description', StringProperty(required=True)),
+    ('created', TimestampProperty(required=True)),
+    ('modified', TimestampProperty(required=True)),
+    ('blockchain', StringProperty(required=True)),
+    ('value', StringProperty(required=True)),
+], id_contrib_props=['blockchain', 'value'])
+class XDefiTransaction():
+    pass
+
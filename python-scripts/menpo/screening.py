@@ -0,0 +1,251 @@
+"""Screening of outgoing transactions against Menpo before signing.
+
+A transaction is screened on its sender and recipient addresses and on its
+hash.  `TransactionScreener` keeps one in-memory table, by stix type,
+blockchain and normalized value (see `menpo.registry`), built from
+
+- the indicators compiled by `menpo.matcher` (`x-defi-address:value` and
+  `x-defi-transaction:value` patterns),
+- the `x-defi-address` and `x-defi-transaction` SCOs of the store,
+
+where every entry is the finished hit: its indicators, SCOs, the threat
+actors related to any of them and the reports which reference them or the
+objects directly related to them, as in `menpo.lookup`.  Screening a
+transaction which hits nothing, the common case, costs one normalization
+and one dict probe per field.
+
+With `prefilter=True`, a `menpo.bloom.BloomFilter` of the table keys is
+probed first.  Its probes are pure Python and cost more than the dict probe
+they would save, so it only pays off when the table is replaced by a filter
+which is much smaller than it, and it is off by default.
+
+Patterns which are not hash lookups (see `IndicatorMatcher.lookups_only`)
+are matched for every field through the matcher.
+
+    from menpo.screening import TransactionScreener
+
+    screener = TransactionScreener.from_store("../db")
+    hits = screener.screen_batch([
+        {"blockchain": "ethereum", "hash": "0x...", "from": "0x...", "to": "0x..."},
+    ])
+    # [{"position": 0, "field": "to", "value": "0x...", "indicators": [...],
+    #   "observables": [...], "threat_actors": [...], "reports": [...]}]
+"""
+import os
+
+from menpo.bloom import DEFAULT_ERROR_RATE, BloomFilter
+from menpo.index import FileSystemIndex, _read_json
+from menpo.matcher import IndicatorMatcher
+from menpo.registry import ADDRESS_TYPE, AddressRegistry, normalize_address, split_blockchains
+
+TRANSACTION_TYPE = "x-defi-transaction"
+
+# Fields of a transaction which are screened, with the type of their value
+FIELDS = (("from", ADDRESS_TYPE), ("to", ADDRESS_TYPE), ("hash", TRANSACTION_TYPE))
+
+HIT_KEYS = ("indicators", "observables", "threat_actors", "reports")
+
+
+def _bloom_key(stix_type, blockchain, value):
+    return "%s:%s:%s" % (stix_type, blockchain, value)
+
+
+def store_context(stix_dir, index=None):
+    """Return a function giving the threat actors and reports of an object of
+    a FileSystemStore directory: the threat actors related to it, and the
+    reports which reference it or the objects directly related to it.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        index (FileSystemIndex): an up to date index of the store, one is
+            refreshed here by default
+
+    Returns:
+        callable: `stix_id -> (threat actor ids, report ids)`, as sets
+
+    """
+    if index is None:
+        index = FileSystemIndex(stix_dir)
+        index.refresh()
+
+    reports_by_ref = {}
+    for entry in index.entries("report"):
+        report = _read_json(os.path.join(index.stix_dir, entry["path"]), index.encoding)
+        for ref in report.get("object_refs", []):
+            reports_by_ref.setdefault(ref, set()).add(entry["id"])
+
+    adjacency = index.adjacency
+
+    def context(stix_id):
+        refs = set(adjacency.related(stix_id))
+        refs.add(stix_id)
+        reports = set()
+        for ref in refs:
+            reports.update(reports_by_ref.get(ref, ()))
+        return {ref for ref in refs if ref.startswith("threat-actor--")}, reports
+
+    return context
+
+
+class TransactionScreener(object):
+    """Indicator, SCO, threat actor and report hits of transactions.
+
+    Args:
+        matcher (IndicatorMatcher): the compiled indicators
+        observables (iterable): `(stix type, blockchain, value, SCO id)` of
+            the SCOs to screen against
+        context (callable): `stix_id -> (threat actor ids, report ids)` of
+            the indicators and SCOs, see `store_context`; hits only list
+            indicators and SCOs without it
+        prefilter (bool): probe a Bloom filter before the table
+        error_rate (float): false positive rate of the Bloom filter
+
+    Attributes:
+        bloom (BloomFilter): the prefilter, or None
+
+    """
+    def __init__(self, matcher, observables=(), context=None, prefilter=False, error_rate=DEFAULT_ERROR_RATE):
+        self.matcher = matcher
+        self._context = context or (lambda stix_id: ((), ()))
+        self._contexts = {}
+
+        found = {}
+        for stix_type, blockchain, value, indicator_ids in matcher.lookups():
+            found.setdefault((stix_type, blockchain, value), (set(), set()))[0].update(indicator_ids)
+        for stix_type, blockchain, value, stix_id in observables:
+            key = (stix_type, blockchain.strip().lower(), normalize_address(value))
+            found.setdefault(key, (set(), set()))[1].add(stix_id)
+
+        # stix type -> blockchain -> normalized value -> hit record
+        self._records = {}
+        for (stix_type, blockchain, value), (indicator_ids, observable_ids) in found.items():
+            self._records.setdefault(stix_type, {}).setdefault(blockchain, {})[value] = (
+                self._record(indicator_ids, observable_ids)
+            )
+
+        self.bloom = None
+        if prefilter:
+            self.bloom = BloomFilter.from_keys((
+                _bloom_key(stix_type, blockchain, value)
+                for stix_type, blockchain, value in found
+            ), error_rate)
+
+    @classmethod
+    def from_store(cls, stix_dir, index=None, prefilter=False, error_rate=DEFAULT_ERROR_RATE):
+        """Build a screener over the indicators and `x-defi-*` SCOs of a
+        FileSystemStore directory.
+
+        Args:
+            stix_dir (str): path to directory of STIX objects
+            index (FileSystemIndex): an up to date index of the store, one is
+                refreshed here by default
+
+        """
+        if index is None:
+            index = FileSystemIndex(stix_dir)
+            index.refresh()
+        registry = AddressRegistry(stix_dir)
+        registry.refresh(index)
+
+        observables = []
+        for stix_id, keys in registry.items():
+            for key in keys:
+                blockchain, value = key.split(":", 1)
+                observables.append((ADDRESS_TYPE, blockchain, value, stix_id))
+        for entry in index.entries(TRANSACTION_TYPE):
+            transaction = _read_json(os.path.join(index.stix_dir, entry["path"]), index.encoding)
+            for blockchain in split_blockchains(transaction.get("blockchain", "")):
+                observables.append((TRANSACTION_TYPE, blockchain, transaction["value"], entry["id"]))
+
+        return cls(
+            IndicatorMatcher.from_store(stix_dir, index), observables, store_context(stix_dir, index),
+            prefilter=prefilter, error_rate=error_rate,
+        )
+
+    def __len__(self):
+        return sum(len(table) for tables in self._records.values() for table in tables.values())
+
+    def _record(self, indicator_ids, observable_ids):
+        threat_actors, reports = set(), set()
+        for stix_id in list(indicator_ids) + list(observable_ids):
+            context = self._contexts.get(stix_id)
+            if context is None:
+                context = self._contexts[stix_id] = self._context(stix_id)
+            threat_actors.update(context[0])
+            reports.update(context[1])
+        return {
+            "indicators": sorted(indicator_ids),
+            "observables": sorted(observable_ids),
+            "threat_actors": sorted(threat_actors),
+            "reports": sorted(reports),
+        }
+
+    def _scan(self, stix_type, blockchain, value, record):
+        # The record of a field, with the patterns which are not lookups
+        indicator_ids = self.matcher.match(blockchain, value, stix_type)
+        if record is None:
+            return self._record(indicator_ids, ()) if indicator_ids else None
+        if set(indicator_ids) <= set(record["indicators"]):
+            return record
+        return self._record(set(indicator_ids) | set(record["indicators"]), record["observables"])
+
+    def screen(self, transaction):
+        """Screen one transaction, see `screen_batch`.
+
+        Returns:
+            list: the hits of the transaction, without their "position"
+
+        """
+        hits = self.screen_batch([transaction])
+        for hit in hits:
+            del hit["position"]
+        return hits
+
+    def screen_batch(self, transactions):
+        """Screen a batch of transactions.
+
+        Args:
+            transactions (iterable): dicts with a "blockchain" (or "chain")
+                and any of "from", "to" and "hash" (or "tx_hash"), as
+                `menpo.stream` reads them
+
+        Returns:
+            list: a dict per field which hits, in order: the "position" of
+            the transaction in the batch, the "field" and its "value", and
+            sorted lists of the ids of the "indicators", "observables"
+            (SCOs), "threat_actors" and "reports" it hits
+
+        """
+        hits = []
+        records = self._records
+        bloom = self.bloom
+        scan = not self.matcher.lookups_only
+        # Tables of the blockchains, cached as they are written
+        tables = {}
+        for position, transaction in enumerate(transactions):
+            chain = transaction.get("blockchain") or transaction.get("chain") or ""
+            chain_tables = tables.get(chain)
+            if chain_tables is None:
+                blockchain = chain.strip().lower()
+                chain_tables = tables[chain] = (blockchain, [
+                    (field, stix_type, records.get(stix_type, {}).get(blockchain, {})) for field, stix_type in FIELDS
+                ])
+            blockchain, field_tables = chain_tables
+            for field, stix_type, table in field_tables:
+                value = transaction.get(field)
+                if value is None and field == "hash":
+                    value = transaction.get("tx_hash")
+                if not value:
+                    continue
+                key = normalize_address(value)
+                if bloom is not None and _bloom_key(stix_type, blockchain, key) not in bloom:
+                    record = None
+                else:
+                    record = table.get(key)
+                if scan:
+                    record = self._scan(stix_type, blockchain, value, record)
+                if record is not None:
+                    hit = {"position": position, "field": field, "value": value}
+                    hit.update((name, list(record[name])) for name in HIT_KEYS)
+                    hits.append(hit)
+        return hits
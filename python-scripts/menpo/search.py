@@ -0,0 +1,368 @@
+"""Full-text search over the text of reports, notes, identities and attack
+patterns.
+
+The search index is an inverted index with positional postings: for every
+token (lowercased runs of letters and digits), the ids of the objects whose
+text contains it and the positions where it does.  The text of an object is
+made of the properties of `TEXT_PROPERTIES`, in order.  Results are ranked
+by BM25 (Okapi, with `k1` = 1.2 and `b` = 0.75), and quoted phrases in a
+query must appear as such:
+
+    oracle manipulation          ranked by both terms, any of them matches
+    "private key" exploit        must contain the phrase "private key"
+
+A query only reads the postings of its own tokens, so its cost depends on
+how many objects contain them, not on the size of the corpus.
+
+The index lives in the SQLite database `<stix_dir>/.menpo-search.sqlite`,
+with the postings in a table keyed by token: opening it reads nothing, a
+query reads the rows of its tokens, and an object is updated by replacing
+its own rows.  It is refreshed through the index: only the objects whose
+directory changed are read again.  Batch ingestion (`menpo.ingest`) updates
+it with every written batch.
+
+    cd python-scripts
+    python3 -m menpo.search "oracle manipulation"
+    python3 -m menpo.search '"private key"' --type report --limit 5
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import sys
+
+from menpo.index import FileSystemIndex, _read_json, normalize_timestamp
+
+SEARCH_FILENAME = ".menpo-search.sqlite"
+
+# Bump whenever the layout (or the tokenization) changes, older search
+# indexes are then rebuilt
+SEARCH_VERSION = 2
+
+# One row per token and object, read token by token.  Objects are numbered,
+# and list their tokens so that their rows can be deleted by key.
+_SCHEMA = """
+CREATE TABLE documents (
+    doc INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    mtime INTEGER NOT NULL,
+    modified TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    tokens TEXT NOT NULL
+);
+CREATE TABLE postings (
+    token TEXT NOT NULL,
+    doc INTEGER NOT NULL,
+    frequency INTEGER NOT NULL,
+    positions TEXT NOT NULL,
+    PRIMARY KEY (token, doc)
+) WITHOUT ROWID;
+"""
+_DROP = """
+DROP TABLE IF EXISTS postings;
+DROP TABLE IF EXISTS documents;
+"""
+
+# Properties searched, by STIX type
+TEXT_PROPERTIES = {
+    "report": ("name", "description"),
+    "note": ("abstract", "content"),
+    "identity": ("name", "description"),
+    "attack-pattern": (
+        "name", "description", "x_defi_taxonomy_incident_type", "x_defi_taxonomy_incident_cause",
+    ),
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_TOKEN = re.compile(r"[^\W_]+")
+_PHRASE = re.compile(r'"([^"]*)"')
+
+
+class SearchQueryError(ValueError):
+    """Raised when a query has no token to search."""
+    pass
+
+
+def tokenize(text):
+    """The lowercased tokens of a text, runs of letters and digits."""
+    return _TOKEN.findall(text.lower())
+
+
+def object_tokens(stix_obj):
+    """The tokens of the text properties of an object, in order.  A position
+    is skipped between properties, so that no phrase spans two of them.
+
+    Returns:
+        list: `(position, token)` pairs
+
+    """
+    tokens = []
+    position = 0
+    for prop in TEXT_PROPERTIES.get(stix_obj["type"], ()):
+        value = stix_obj.get(prop)
+        if not isinstance(value, str):
+            continue
+        for token in tokenize(value):
+            tokens.append((position, token))
+            position += 1
+        position += 1
+    return tokens
+
+
+def _phrase_in(token_postings):
+    # Whether the tokens of a phrase follow each other, from the postings of
+    # each of them in one object
+    if any(posting is None for posting in token_postings):
+        return False
+    first = [int(position) for position in token_postings[0][2].split(",")]
+    rest = [{int(position) for position in posting[2].split(",")} for posting in token_postings[1:]]
+    return any(all(start + i in positions for i, positions in enumerate(rest, 1)) for start in first)
+
+
+def parse_query(query):
+    """Split a query into its tokens and its quoted phrases.
+
+    Returns:
+        tuple: the tokens of the whole query, without duplicates, and the
+        token lists of its phrases of more than one token
+
+    """
+    phrases = [tokens for tokens in (tokenize(phrase) for phrase in _PHRASE.findall(query)) if len(tokens) > 1]
+    return list(dict.fromkeys(tokenize(query))), phrases
+
+
+class SearchIndex(object):
+    """BM25 full-text search over the objects of `TEXT_PROPERTIES`.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        filename (str): name of the search database inside `stix_dir`
+        encoding (str): The encoding to use when reading object files.
+
+    """
+    def __init__(self, stix_dir, filename=SEARCH_FILENAME, encoding="utf-8"):
+        self._stix_dir = os.path.abspath(stix_dir)
+        self._path = os.path.join(self._stix_dir, filename)
+        self.encoding = encoding
+        self._connection = None
+        self._count = 0
+        self._total_length = 0
+        self._dirty = False
+        self.load()
+
+    @property
+    def path(self):
+        return self._path
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, stix_id):
+        return self._connection.execute("SELECT 1 FROM documents WHERE id = ?", (stix_id,)).fetchone() is not None
+
+    def load(self):
+        """Open the search database, emptied when its layout is not the
+        current one.  Changes which were not saved are dropped."""
+        if self._connection is not None:
+            self._connection.close()
+        self._connection = sqlite3.connect(self._path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        if self._connection.execute("PRAGMA user_version").fetchone()[0] != SEARCH_VERSION:
+            self._connection.executescript(_DROP + _SCHEMA + "PRAGMA user_version = %d;" % SEARCH_VERSION)
+        self._count, self._total_length = self._connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM documents",
+        ).fetchone()
+        self._dirty = False
+
+    def save(self):
+        """Commit the changes to the search database, if anything changed."""
+        if not self._dirty:
+            return
+        self._connection.commit()
+        # The write-ahead log grows to the size of the largest batch
+        self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._dirty = False
+
+    def close(self):
+        """Save the changes and close the search database."""
+        self.save()
+        self._connection.close()
+
+    def _remove(self, doc, length, tokens):
+        self._connection.executemany(
+            "DELETE FROM postings WHERE token = ? AND doc = ?", [(token, doc) for token in tokens.split()],
+        )
+        self._connection.execute("DELETE FROM documents WHERE doc = ?", (doc,))
+        self._count -= 1
+        self._total_length -= length
+        self._dirty = True
+
+    def _add(self, stix_obj, mtime, modified):
+        stix_id = stix_obj["id"]
+        document = self._connection.execute("SELECT doc, length, tokens FROM documents WHERE id = ?", (stix_id,)).fetchone()
+        if document is not None:
+            self._remove(*document)
+
+        tokens = object_tokens(stix_obj)
+        positions = {}
+        for position, token in tokens:
+            positions.setdefault(token, []).append(position)
+        doc = self._connection.execute(
+            "INSERT INTO documents (id, mtime, modified, length, tokens) VALUES (?, ?, ?, ?, ?)",
+            (stix_id, mtime, modified, len(tokens), " ".join(positions)),
+        ).lastrowid
+        self._connection.executemany(
+            "INSERT INTO postings (token, doc, frequency, positions) VALUES (?, ?, ?, ?)",
+            [(token, doc, len(token_positions), ",".join(map(str, token_positions)))
+             for token, token_positions in positions.items()],
+        )
+        self._count += 1
+        self._total_length += len(tokens)
+        self._dirty = True
+
+    def refresh(self, index=None):
+        """Bring the search index up to date with the store.  The changes are
+        saved when anything changed.
+
+        Args:
+            index (FileSystemIndex): an up to date index of the store, one is
+                refreshed here by default
+
+        Returns:
+            int: The number of objects read or removed.
+
+        """
+        if index is None:
+            index = FileSystemIndex(self._stix_dir)
+            index.refresh()
+
+        documents = {row[0]: row[1:] for row in self._connection.execute(
+            "SELECT id, mtime, doc, length, tokens FROM documents",
+        )}
+        entries = [entry for stix_type in TEXT_PROPERTIES for entry in index.entries(stix_type)]
+        stored = {entry["id"] for entry in entries}
+        removed = [stix_id for stix_id in documents if stix_id not in stored]
+        stale = [entry for entry in entries if documents.get(entry["id"], (None,))[0] != entry["mtime"]]
+
+        for stix_id in removed:
+            self._remove(*documents[stix_id][1:])
+        for entry in stale:
+            stix_obj = _read_json(os.path.join(self._stix_dir, entry["path"]), self.encoding)
+            self._add(stix_obj, entry["mtime"], entry.get("modified", ""))
+
+        self.save()
+        return len(removed) + len(stale)
+
+    def record(self, stix_obj):
+        """Record an object that has just been written to the store, unless
+        a later version of it is indexed.  Objects without searched text are
+        ignored.  Call `save` to persist the change."""
+        if stix_obj["type"] not in TEXT_PROPERTIES:
+            return
+        modified = normalize_timestamp(stix_obj["modified"]) if "modified" in stix_obj else ""
+        document = self._connection.execute("SELECT modified FROM documents WHERE id = ?", (stix_obj["id"],)).fetchone()
+        obj_dir = os.path.join(self._stix_dir, stix_obj["type"], stix_obj["id"])
+        if document is not None and document[0] > modified:
+            # An older version: the latest one is still the indexed one
+            self._connection.execute(
+                "UPDATE documents SET mtime = ? WHERE id = ?", (os.stat(obj_dir).st_mtime_ns, stix_obj["id"]),
+            )
+            self._dirty = True
+            return
+        self._add(stix_obj, os.stat(obj_dir).st_mtime_ns, modified)
+
+    def _postings(self, token):
+        # id -> (frequency, object length, positions)
+        return {
+            row[0]: row[1:] for row in self._connection.execute(
+                "SELECT documents.id, frequency, length, positions FROM postings"
+                " JOIN documents ON documents.doc = postings.doc WHERE token = ?", (token,),
+            )
+        }
+
+    def search(self, query, types=None, limit=10):
+        """Return the objects which best match a query, see the module
+        docstring.
+
+        Args:
+            query (str): tokens and quoted phrases
+            types (iterable): only objects of these STIX types
+            limit (int): the maximum number of results, all of them if None
+
+        Returns:
+            list: `(stix_id, score)` pairs, best first
+
+        Raises:
+            SearchQueryError: if the query has no token
+
+        """
+        tokens, phrases = parse_query(query)
+        if not tokens:
+            raise SearchQueryError("no token to search in %r" % (query,))
+        if not self._count:
+            return []
+
+        count = self._count
+        average_length = self._total_length / count
+        postings = {token: self._postings(token) for token in tokens}
+        scores = {}
+        for token in tokens:
+            token_postings = postings[token]
+            if not token_postings:
+                continue
+            idf = math.log(1 + (count - len(token_postings) + 0.5) / (len(token_postings) + 0.5))
+            for stix_id, (frequency, length, _) in token_postings.items():
+                norm = K1 * (1 - B + B * length / average_length)
+                scores[stix_id] = scores.get(stix_id, 0.0) + idf * frequency * (K1 + 1) / (frequency + norm)
+
+        if phrases:
+            scores = {
+                stix_id: score for stix_id, score in scores.items()
+                if all(_phrase_in([postings[token].get(stix_id) for token in phrase]) for phrase in phrases)
+            }
+        if types is not None:
+            prefixes = tuple(stix_type + "--" for stix_type in types)
+            scores = {stix_id: score for stix_id, score in scores.items() if stix_id.startswith(prefixes)}
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked if limit is None else ranked[:limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m menpo.search", description="Search the text of Menpo objects")
+    parser.add_argument("query", help='tokens and "quoted phrases"')
+    parser.add_argument("--type", action="append", choices=sorted(TEXT_PROPERTIES), help="only objects of this type, may be repeated")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--stix-dir", default=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "db"))
+    parser.add_argument("--no-refresh", action="store_true", help="answer from the search database as it is")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    index = FileSystemIndex(args.stix_dir)
+    search = SearchIndex(args.stix_dir)
+    if not args.no_refresh:
+        index.refresh()
+        search.refresh(index)
+
+    try:
+        results = search.search(args.query, types=args.type, limit=args.limit)
+    except SearchQueryError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(json.dumps([{"id": stix_id, "score": round(score, 4)} for stix_id, score in results], indent=4))
+    else:
+        for stix_id, score in results:
+            entry = index.lookup(stix_id) or {}
+            print(f"{score:>8.3f}  {stix_id}  {entry.get('name') or ''}")
+    return 0 if results else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,414 @@
+"""SQLite-backed STIX DataStore.
+
+A drop-in for FileSystemStore: every object version is one row of the
+`objects` table, with indexed columns for the properties we search on (type,
+id, modified, source_ref, target_ref) and the JSON document in a blob.
+Filters on those columns are pushed down into SQL, every filter is then
+checked again on the parsed objects, so results match FileSystemSource.
+
+`import_directory` and `export_directory` convert to and from the `db/`
+layout:
+
+    python3 -m menpo.sqlite_store import ../db menpo.sqlite
+    python3 -m menpo.sqlite_store export menpo.sqlite ../db
+"""
+import argparse
+import io
+import json
+import os
+import sqlite3
+import sys
+
+from stix2 import v20, v21
+from stix2.base import _STIXBase
+from stix2.datastore import (
+    DataSink, DataSource, DataSourceError, DataStoreMixin,
+)
+from stix2.datastore.filters import Filter, FilterSet, apply_common_filters
+from stix2.parsing import parse
+
+from menpo.index import normalize_timestamp, version_filename, version_paths
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    modified TEXT NOT NULL,
+    created TEXT,
+    relationship_type TEXT,
+    source_ref TEXT,
+    target_ref TEXT,
+    json BLOB NOT NULL,
+    PRIMARY KEY (id, modified)
+);
+CREATE INDEX IF NOT EXISTS objects_type ON objects (type, modified);
+CREATE INDEX IF NOT EXISTS objects_source_ref ON objects (source_ref);
+CREATE INDEX IF NOT EXISTS objects_target_ref ON objects (target_ref);
+"""
+
+# Filter properties which map onto a column
+_COLUMNS = ("id", "type", "modified", "created", "relationship_type", "source_ref", "target_ref")
+_TIMESTAMP_COLUMNS = ("modified", "created")
+_SQL_OPS = {"=": "=", "!=": "!=", ">": ">", "<": "<", ">=": ">=", "<=": "<="}
+
+
+def _row(stix_obj, data):
+    """Column values for a STIX object (or dict) and its JSON bytes."""
+    return (
+        stix_obj["id"],
+        stix_obj["type"],
+        normalize_timestamp(stix_obj["modified"]) if "modified" in stix_obj else "",
+        normalize_timestamp(stix_obj["created"]) if "created" in stix_obj else None,
+        stix_obj.get("relationship_type"),
+        stix_obj.get("source_ref"),
+        stix_obj.get("target_ref"),
+        data,
+    )
+
+
+def _push_down(filters):
+    """Translate the filters which map onto columns into a WHERE clause.
+
+    The clause selects a superset of the matching rows, the filters still
+    have to be applied to the parsed objects.
+
+    """
+    clauses = []
+    params = []
+    for filter_ in filters:
+        if filter_.property not in _COLUMNS:
+            continue
+
+        value = filter_.value
+        if filter_.op == "in":
+            values = list(value)
+            if filter_.property in _TIMESTAMP_COLUMNS:
+                values = [normalize_timestamp(v) for v in values]
+            if not values:
+                return "0", []
+            clauses.append("%s IN (%s)" % (filter_.property, ",".join("?" * len(values))))
+            params.extend(values)
+        elif filter_.op in _SQL_OPS and not isinstance(value, (dict, list, tuple, bool)):
+            if filter_.property in _TIMESTAMP_COLUMNS:
+                value = normalize_timestamp(value)
+            clauses.append("%s %s ?" % (filter_.property, _SQL_OPS[filter_.op]))
+            params.append(value)
+
+    return " AND ".join(clauses) or "1", params
+
+
+class SQLiteStore(DataStoreMixin):
+    """Interface to a SQLite database of STIX objects.
+
+    SQLiteStore is a wrapper around a paired SQLiteSink and SQLiteSource
+    sharing one connection.
+
+    Args:
+        db_path (str): path to the SQLite database, created if missing
+        allow_custom (bool): whether to allow custom STIX content to be
+            pushed/retrieved. Defaults to True for the SQLiteSource side
+            (retrieving data) and False for the SQLiteSink side (pushing
+            data). However, when parameter is supplied, it will be applied
+            to both SQLiteSource and SQLiteSink.
+
+    Attributes:
+        source (SQLiteSource): SQLiteSource
+        sink (SQLiteSink): SQLiteSink
+
+    """
+    def __init__(self, db_path, allow_custom=None):
+        if allow_custom is None:
+            allow_custom_source = True
+            allow_custom_sink = False
+        else:
+            allow_custom_sink = allow_custom_source = allow_custom
+
+        self.connection = connect(db_path)
+
+        super(SQLiteStore, self).__init__(
+            source=SQLiteSource(self.connection, allow_custom=allow_custom_source),
+            sink=SQLiteSink(self.connection, allow_custom=allow_custom_sink),
+        )
+
+    def close(self):
+        self.connection.close()
+
+
+def connect(db_path):
+    """Open (and create if needed) a SQLite STIX database."""
+    connection = sqlite3.connect(db_path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+class SQLiteSink(DataSink):
+    """Interface for adding/pushing STIX objects to a SQLite database.
+
+    Every call to `add` is one transaction.
+
+    Args:
+        connection (sqlite3.Connection): connection returned by `connect`
+        allow_custom (bool): Whether to allow custom STIX content to be
+            added to the SQLiteSink. Default: False
+
+    """
+    def __init__(self, connection, allow_custom=False):
+        super(SQLiteSink, self).__init__()
+        self.connection = connection
+        self.allow_custom = allow_custom
+
+    def _collect(self, stix_data, version, rows):
+        if isinstance(stix_data, (v20.Bundle, v21.Bundle)):
+            for stix_obj in stix_data.get("objects", []):
+                self._collect(stix_obj, version, rows)
+
+        elif isinstance(stix_data, _STIXBase):
+            data = stix_data.serialize(pretty=True, ensure_ascii=False)
+            rows.append(_row(stix_data, data.encode("utf-8")))
+
+        elif isinstance(stix_data, (str, dict)):
+            parsed_data = parse(stix_data, allow_custom=self.allow_custom, version=version)
+            if isinstance(parsed_data, _STIXBase):
+                self._collect(parsed_data, version, rows)
+            else:
+                # custom unregistered object type
+                data = json.dumps(parsed_data, indent=4, ensure_ascii=False)
+                rows.append(_row(parsed_data, data.encode("utf-8")))
+
+        elif isinstance(stix_data, list):
+            for stix_obj in stix_data:
+                self._collect(stix_obj, version, rows)
+
+        else:
+            raise TypeError(
+                "stix_data must be a STIX object (or list of), "
+                "JSON formatted STIX (or list of), "
+                "or a JSON formatted STIX bundle",
+            )
+
+    def add(self, stix_data=None, version=None):
+        """Add STIX objects to the database, in one transaction.
+
+        Args:
+            stix_data (STIX object OR dict OR str OR list): valid STIX 2.0 content
+                in a STIX object (or list of), dict (or list of), or a STIX 2.0
+                json encoded string.
+            version (str): If present, it forces the parser to use the version
+                provided. Otherwise, the library will make the best effort based
+                on checking the "spec_version" property.
+
+        Raises:
+            DataSourceError: if one of the object versions is already stored,
+                nothing is written then.
+
+        """
+        rows = []
+        self._collect(stix_data, version, rows)
+
+        try:
+            with self.connection:
+                self.connection.executemany("INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        except sqlite3.IntegrityError as e:
+            raise DataSourceError("Attempted to overwrite an object version", e)
+
+
+class SQLiteSource(DataSource):
+    """Interface for searching/retrieving STIX objects from a SQLite database.
+
+    Args:
+        connection (sqlite3.Connection): connection returned by `connect`
+        allow_custom (bool): Whether to allow custom STIX content to be
+            retrieved. Default: True
+
+    """
+    def __init__(self, connection, allow_custom=True):
+        super(SQLiteSource, self).__init__()
+        self.connection = connection
+        self.allow_custom = allow_custom
+
+    def _select(self, where, params, version, query, suffix=""):
+        sql = "SELECT json FROM objects WHERE " + where + suffix
+        stix_objs = (
+            parse(json.loads(data), self.allow_custom, version)
+            for data, in self.connection.execute(sql, params)
+        )
+        return list(apply_common_filters(stix_objs, query))
+
+    def _complete_query(self, query, _composite_filters):
+        query = FilterSet(query)
+        if self.filters:
+            query.add(self.filters)
+        if _composite_filters:
+            query.add(_composite_filters)
+        return query
+
+    def get(self, stix_id, version=None, _composite_filters=None):
+        """Retrieve the latest version of a STIX object via STIX ID.
+
+        Args:
+            stix_id (str): The STIX ID of the STIX object to be retrieved.
+            _composite_filters (FilterSet): collection of filters passed from the parent
+                CompositeDataSource, not user supplied
+            version (str): If present, it forces the parser to use the version
+                provided. Otherwise, the library will make the best effort based
+                on checking the "spec_version" property.
+
+        Returns:
+            (STIX object): STIX object that has the supplied STIX ID, or None.
+
+        """
+        query = self._complete_query(None, _composite_filters)
+        results = self._select("id = ?", [stix_id], version, query, " ORDER BY modified DESC LIMIT 1")
+        return results[0] if results else None
+
+    def all_versions(self, stix_id, version=None, _composite_filters=None):
+        """Retrieve every version of a STIX object via STIX ID.
+
+        Args:
+            stix_id (str): The STIX ID of the STIX objects to be retrieved.
+            _composite_filters (FilterSet): collection of filters passed from
+                the parent CompositeDataSource, not user supplied
+            version (str): If present, it forces the parser to use the version
+                provided. Otherwise, the library will make the best effort based
+                on checking the "spec_version" property.
+
+        Returns:
+            (list): of STIX objects that has the supplied STIX ID, oldest first.
+
+        """
+        query = self._complete_query(None, _composite_filters)
+        return self._select("id = ?", [stix_id], version, query, " ORDER BY modified")
+
+    def query(self, query=None, version=None, _composite_filters=None):
+        """Search and retrieve STIX objects based on the complete query.
+
+        Filters on id, type, modified, created, relationship_type, source_ref
+        and target_ref are evaluated by SQLite using its indexes.
+
+        Args:
+            query (list): list of filters to search on
+            _composite_filters (FilterSet): collection of filters passed from
+                the CompositeDataSource, not user supplied
+            version (str): If present, it forces the parser to use the version
+                provided. Otherwise, the library will make the best effort based
+                on checking the "spec_version" property.
+
+        Returns:
+            (list): list of STIX objects that matches the supplied query.
+
+        """
+        query = self._complete_query(query, _composite_filters)
+        where, params = _push_down(query)
+        return self._select(where, params, version, query)
+
+    def related_to(self, obj, relationship_type=None, source_only=False, target_only=False, filters=None):
+        """Retrieve STIX Objects that have a Relationship involving the given
+        STIX object, with one query for all of them.  See
+        `DataSource.related_to`.
+
+        """
+        try:
+            obj_id = obj['id']
+        except TypeError:
+            # Assume `obj` is an ID string
+            obj_id = obj
+
+        ids = set()
+        for r in self.relationships(obj, relationship_type, source_only, target_only):
+            ids.update((r["source_ref"], r["target_ref"]))
+        ids.discard(obj_id)
+        if not ids:
+            return []
+
+        return self.query(list(FilterSet(filters)) + [Filter("id", "in", tuple(ids))])
+
+
+def import_directory(stix_dir, db_path):
+    """Copy every version file of a FileSystemStore directory into a SQLite
+    database, in one transaction.  Versions already in the database are
+    skipped.
+
+    Returns:
+        int: The number of inserted object versions.
+
+    """
+    stix_dir = os.path.abspath(stix_dir)
+    connection = connect(db_path)
+    try:
+        rows = []
+        for path in version_paths(stix_dir):
+            with io.open(os.path.join(stix_dir, path), "rb") as f:
+                data = f.read()
+            stix_obj = json.loads(data)
+            if stix_obj.get("type") == "bundle":
+                stix_obj = stix_obj["objects"][0]
+                data = json.dumps(stix_obj, indent=4, ensure_ascii=False).encode("utf-8")
+            rows.append(_row(stix_obj, data))
+
+        with connection:
+            before = connection.total_changes
+            connection.executemany("INSERT OR IGNORE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            return connection.total_changes - before
+    finally:
+        connection.close()
+
+
+def export_directory(db_path, stix_dir):
+    """Write every object version of a SQLite database into the
+    FileSystemStore layout.  Existing files are left alone.
+
+    Returns:
+        int: The number of written files.
+
+    """
+    written = 0
+    connection = connect(db_path)
+    try:
+        for data, in connection.execute("SELECT json FROM objects ORDER BY type, id, modified"):
+            stix_obj = json.loads(data)
+            if "modified" in stix_obj:
+                obj_dir = os.path.join(stix_dir, stix_obj["type"], stix_obj["id"])
+                filename = version_filename(stix_obj["modified"])
+            else:
+                obj_dir = os.path.join(stix_dir, stix_obj["type"])
+                filename = stix_obj["id"]
+
+            file_path = os.path.join(obj_dir, filename + ".json")
+            if os.path.exists(file_path):
+                continue
+            if not os.path.exists(obj_dir):
+                os.makedirs(obj_dir)
+            with io.open(file_path, "wb") as f:
+                f.write(data)
+            written += 1
+    finally:
+        connection.close()
+
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m menpo.sqlite_store", description="Convert between db/ and SQLite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_ = commands.add_parser("import", help="copy a STIX directory into a SQLite database")
+    import_.add_argument("stix_dir")
+    import_.add_argument("db_path")
+
+    export = commands.add_parser("export", help="write a SQLite database into a STIX directory")
+    export.add_argument("db_path")
+    export.add_argument("stix_dir")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        print("Imported", import_directory(args.stix_dir, args.db_path), "objects")
+    else:
+        print("Exported", export_directory(args.db_path, args.stix_dir), "objects")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
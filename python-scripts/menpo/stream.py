@@ -0,0 +1,385 @@
+"""Streaming ingestion of `x-defi-address` and `x-defi-transaction` feeds.
+
+Reads newline-delimited JSON from a file, a pipe (`-` for stdin, or a named
+pipe) or a local socket (`unix:/path/to/socket`, one producer connection at
+a time) and writes the observables it describes into a FileSystemStore
+directory.  Every line is either an observable:
+
+    {"type": "x-defi-address", "blockchain": "ethereum", "value": "0x...", "description": "..."}
+    {"type": "x-defi-transaction", "blockchain": "ethereum", "value": "0x...", "timestamp": 1667700000}
+
+or a transfer log entry, which gives the transaction and both addresses,
+linked by `sent-from` and `sent-to` relationships from the transaction:
+
+    {"blockchain": "ethereum", "hash": "0x...", "from": "0x...", "to": "0x...", "timestamp": 1667700000}
+
+A reader thread puts chunks of lines into a bounded queue and blocks when it
+is full, so a slow store pushes back on the producer instead of filling the
+memory.  The main thread turns lines into STIX dicts with deterministic ids
+(see `menpo.ids`), skips the observables which are already stored (the
+addresses through `menpo.registry`, whatever their case or id, and the
+relationships of a transfer point at the canonical address SCOs), and
+commits them with `menpo.bulk.BulkWriter` every `batch_size` objects or
+`flush_interval` seconds, whichever comes first.  Objects are built here,
+already valid, so they are written without stix2 validation:
+
+    cd python-scripts
+    python3 -m menpo.stream transfers.jsonl
+    tail -f transfers.jsonl | python3 -m menpo.stream - --flush-interval 5
+    python3 -m menpo.stream unix:/tmp/menpo.sock
+"""
+import argparse
+import datetime
+import functools
+import io
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+
+from stix2.utils import format_datetime, parse_into_datetime
+
+from menpo.bulk import BulkWriter, recover
+from menpo.ids import deterministic_id
+from menpo.index import FileSystemIndex
+from menpo.registry import ADDRESS_TYPE, AddressRegistry
+
+SOCKET_PREFIX = "unix:"
+
+OBSERVABLE_TYPES = ("x-defi-address", "x-defi-transaction")
+
+# Record values stored as they are: anything but a string is rejected
+STRING_FIELDS = ("type", "blockchain", "value", "name", "description", "hash", "tx_hash", "from", "to")
+
+# Relationships of a transfer, from the transaction to its sender and to its
+# receiver
+TRANSFER_RELATIONSHIPS = ("sent-from", "sent-to")
+
+# Bytes read at once.  Whatever complete lines a read returns are queued
+# together: big chunks when the producer is ahead, single lines when it is
+# slow, and never a line held back waiting for the next ones
+READ_SIZE = 65536
+
+
+class StreamError(Exception):
+    """Raised when a line of a feed cannot be used."""
+    pass
+
+
+def _chunks(f, encoding):
+    rest = b""
+    while True:
+        data = f.read1(READ_SIZE)
+        if not data:
+            break
+        lines = (rest + data).split(b"\n")
+        rest = lines.pop()
+        if lines:
+            yield [line.decode(encoding) for line in lines]
+    if rest:
+        yield [rest.decode(encoding)]
+
+
+def _socket_chunks(path, encoding):
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(path)
+        server.listen(1)
+        while True:
+            conn, _ = server.accept()
+            with conn, conn.makefile("rb") as f:
+                for chunk in _chunks(f, encoding):
+                    yield chunk
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def _file_chunks(path, encoding):
+    if path == "-":
+        for chunk in _chunks(sys.stdin.buffer, encoding):
+            yield chunk
+        return
+    with io.open(path, "rb") as f:
+        for chunk in _chunks(f, encoding):
+            yield chunk
+
+
+def open_feed(spec, encoding="utf-8"):
+    """Iterate over the lines of a feed, in chunks (lists of lines).
+
+    Args:
+        spec (str): a file or named pipe path, `-` for stdin, or
+            `unix:PATH` to listen on a local socket (until interrupted)
+        encoding (str): The encoding of the feed.
+
+    """
+    if spec.startswith(SOCKET_PREFIX):
+        return _socket_chunks(spec[len(SOCKET_PREFIX):], encoding)
+    return _file_chunks(spec, encoding)
+
+
+def _timestamp(value):
+    if value is None:
+        value = datetime.datetime.now(datetime.timezone.utc)
+    elif isinstance(value, int):
+        # Unix seconds, the common case: formatted as stix2 would, directly
+        return datetime.datetime.fromtimestamp(value, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    elif isinstance(value, float):
+        value = datetime.datetime.fromtimestamp(value, datetime.timezone.utc)
+    return format_datetime(parse_into_datetime(value))
+
+
+@functools.lru_cache(maxsize=65536)
+def _observable_id(stix_type, blockchain, value):
+    # Addresses come back in transfer after transfer
+    return deterministic_id({"type": stix_type, "blockchain": blockchain, "value": value})
+
+
+def make_observable(stix_type, blockchain, value, created, name=None, description=None):
+    """An `x-defi-address` or `x-defi-transaction` dict with its
+    deterministic id."""
+    return {
+        "type": stix_type,
+        "spec_version": "2.1",
+        "id": _observable_id(stix_type, blockchain, value),
+        "name": name or "%s - %s" % (value, blockchain.capitalize()),
+        "description": description or "%s %s" % (
+            blockchain.capitalize(), "address" if stix_type == "x-defi-address" else "transaction",
+        ),
+        "created": created,
+        "modified": created,
+        "blockchain": blockchain,
+        "value": value,
+    }
+
+
+def make_relationship(relationship_type, source_ref, target_ref, created):
+    """A `relationship` dict with its deterministic id."""
+    stix_obj = {
+        "type": "relationship",
+        "spec_version": "2.1",
+        "created": created,
+        "modified": created,
+        "relationship_type": relationship_type,
+        "source_ref": source_ref,
+        "target_ref": target_ref,
+    }
+    stix_obj["id"] = deterministic_id(stix_obj)
+    return stix_obj
+
+
+def observables(record):
+    """The observables described by one feed record (a parsed line).
+
+    Raises:
+        StreamError: the record is neither an observable nor a transfer,
+            or one of its values is not a string
+        ValueError, OverflowError, OSError: the timestamp is unusable
+
+    """
+    if not isinstance(record, dict):
+        raise StreamError("not an object: %r" % (record,))
+    # The writer does not validate, so every value is checked here
+    for key in STRING_FIELDS:
+        if record.get(key) is not None and not isinstance(record[key], str):
+            raise StreamError("%s is not a string in %r" % (key, record))
+    blockchain = record.get("blockchain")
+    if not blockchain:
+        raise StreamError("no blockchain in %r" % (record,))
+    blockchain = blockchain.lower()
+    created = _timestamp(record.get("timestamp"))
+
+    stix_type = record.get("type")
+    if stix_type in OBSERVABLE_TYPES:
+        if not record.get("value"):
+            raise StreamError("no value in %r" % (record,))
+        return [make_observable(
+            stix_type, blockchain, record["value"], created,
+            name=record.get("name"), description=record.get("description"),
+        )]
+    if stix_type is not None:
+        raise StreamError("unknown type %r" % stix_type)
+
+    tx_hash = record.get("hash") or record.get("tx_hash")
+    if not tx_hash or not record.get("from") or not record.get("to"):
+        raise StreamError("a transfer needs a hash, a from and a to address: %r" % (record,))
+    return [
+        make_observable(
+            "x-defi-transaction", blockchain, tx_hash, created,
+            description="Transfer from %s to %s" % (record["from"], record["to"]),
+        ),
+        make_observable("x-defi-address", blockchain, record["from"], created),
+        make_observable("x-defi-address", blockchain, record["to"], created),
+    ]
+
+
+class StreamIngester(object):
+    """Writes the observables of a feed into a FileSystemStore directory.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        batch_size (int): objects per commit
+        flush_interval (float): seconds after which a partial batch is
+            committed anyway, so slow feeds are stored without delay
+        queue_size (int): chunks the reader may get ahead of the writer
+            before it blocks
+        sync (bool): sync every batch to disk, see `BulkWriter`
+        strict (bool): raise StreamError on unusable lines instead of
+            counting them as rejected
+
+    """
+    def __init__(self, stix_dir, batch_size=10000, flush_interval=1.0, queue_size=64, sync=True, strict=False):
+        recover(stix_dir)
+        self.index = FileSystemIndex(stix_dir)
+        self.index.refresh()
+        self.registry = AddressRegistry(stix_dir)
+        self.registry.refresh(self.index)
+        # The manifest hashes the files it has not recorded when it needs
+        # them, hashing every observable here would halve the throughput
+        self.writer = BulkWriter(stix_dir, allow_custom=True, index=self.index, sync=sync, validate=False,
+                                 registry=self.registry)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.strict = strict
+        self.stats = {"lines": 0, "written": 0, "skipped": 0, "rejected": 0, "batches": 0}
+
+    def _read(self, feed, chunks, failure):
+        try:
+            for chunk in feed:
+                chunks.put(chunk)
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            chunks.put(None)
+
+    def _commit(self, batch):
+        if batch:
+            self.stats["written"] += self.writer.write(list(batch.values()))
+            self.stats["batches"] += 1
+            batch.clear()
+
+    def _add(self, line, batch):
+        line = line.strip()
+        if not line:
+            return
+        self.stats["lines"] += 1
+        try:
+            record = json.loads(line)
+            stix_objs = observables(record)
+        except (ValueError, TypeError, OverflowError, OSError, StreamError) as e:
+            if self.strict:
+                raise StreamError("line %d: %s" % (self.stats["lines"], e)) from e
+            self.stats["rejected"] += 1
+            return
+
+        refs = []
+        for stix_obj in stix_objs:
+            ref = self.registry.resolve(stix_obj) if stix_obj["type"] == ADDRESS_TYPE else stix_obj["id"]
+            refs.append(ref)
+            self._queue(stix_obj, batch, ref != stix_obj["id"])
+
+        if "type" not in record:
+            # A transfer: the transaction, its sender and its receiver
+            transaction_ref, from_ref, to_ref = refs
+            for relationship_type, address_ref in zip(TRANSFER_RELATIONSHIPS, (from_ref, to_ref)):
+                self._queue(make_relationship(relationship_type, transaction_ref, address_ref, stix_objs[0]["created"]),
+                            batch)
+
+    def _queue(self, stix_obj, batch, stored=False):
+        if stored or stix_obj["id"] in batch or stix_obj["id"] in self.index:
+            self.stats["skipped"] += 1
+        else:
+            batch[stix_obj["id"]] = stix_obj
+
+    def run(self, feed):
+        """Ingest a feed until it is exhausted.  When interrupted, the lines
+        read so far are committed before the KeyboardInterrupt goes on.
+
+        Args:
+            feed (iterable): chunks (lists) of lines, see `open_feed`
+
+        Returns:
+            dict: the numbers of lines read, objects written, skipped
+            (already stored) and rejected lines, and of batches
+
+        """
+        chunks = queue.Queue(maxsize=self.queue_size)
+        failure = []
+        reader = threading.Thread(target=self._read, args=(feed, chunks, failure), daemon=True)
+        reader.start()
+
+        batch = {}
+        deadline = time.monotonic() + self.flush_interval
+        try:
+            while True:
+                try:
+                    chunk = chunks.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    chunk = ()
+                if chunk is None:
+                    break
+
+                for line in chunk:
+                    self._add(line, batch)
+                    if len(batch) >= self.batch_size:
+                        self._commit(batch)
+                        deadline = time.monotonic() + self.flush_interval
+
+                if time.monotonic() >= deadline:
+                    self._commit(batch)
+                    deadline = time.monotonic() + self.flush_interval
+        except KeyboardInterrupt:
+            self._commit(batch)
+            raise
+
+        self._commit(batch)
+        reader.join()
+        if failure:
+            raise failure[0]
+        return dict(self.stats)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m menpo.stream", description="Ingest a feed of x-defi observables")
+    parser.add_argument("feed", help="file or named pipe, - for stdin, unix:PATH for a local socket")
+    parser.add_argument("--stix-dir", default=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "db"))
+    parser.add_argument("--batch-size", type=int, default=10000, help="objects per commit")
+    parser.add_argument("--flush-interval", type=float, default=1.0, help="seconds before a partial batch is committed")
+    parser.add_argument("--queue-size", type=int, default=64, help="reads of %d bytes queued ahead" % READ_SIZE)
+    parser.add_argument("--no-sync", action="store_true", help="do not sync the batches to disk")
+    parser.add_argument("--strict", action="store_true", help="stop at the first unusable line")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.stix_dir, exist_ok=True)
+    ingester = StreamIngester(
+        args.stix_dir, batch_size=args.batch_size, flush_interval=args.flush_interval,
+        queue_size=args.queue_size, sync=not args.no_sync, strict=args.strict,
+    )
+    start = time.perf_counter()
+    try:
+        stats = ingester.run(open_feed(args.feed))
+    except StreamError as e:
+        print("Error:", e, file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        stats = ingester.stats
+        if args.feed.startswith(SOCKET_PREFIX) and os.path.exists(args.feed[len(SOCKET_PREFIX):]):
+            os.unlink(args.feed[len(SOCKET_PREFIX):])
+
+    seconds = time.perf_counter() - start
+    print(f"{stats['lines']} lines, {stats['written']} objects written in {stats['batches']} batches, "
+          f"{stats['skipped']} already stored, {stats['rejected']} rejected lines, "
+          f"{seconds:.3f}s ({stats['written'] / seconds if seconds else 0:.0f} observables/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
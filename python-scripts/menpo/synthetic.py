@@ -0,0 +1,266 @@
+"""Synthetic DeFi-incident corpora, shaped like the `data-input` scripts.
+
+Every incident is a report (with `x_defi_estimated_loss_usd`), a threat-actor,
+a victim identity, an attack-pattern (with the `x_defi_taxonomy_*`
+properties), indicators with `x-defi-address` patterns and their
+`indicates` relationships, victim `x-defi-address` SCOs bound with `uses`,
+the `uses`/`targets` relationships between attacker, attack-pattern and
+victim, and a few timeline notes pointing to the report.  A small share of
+the indicator addresses is reused across incidents, as real laundering
+addresses are.
+
+Objects are generated as JSON dicts, lazily, so that corpora of millions of
+objects are written with bounded memory:
+
+    python3 -m menpo.synthetic /tmp/menpo-100k --objects 100000 --seed 1
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import random
+import sys
+import uuid
+
+from menpo.index import version_filename
+from menpo.schema import ATTACK_PATTERN_EXTENSION_DEFINITION_ID, REPORT_EXTENSION_DEFINITION_ID
+
+BLOCKCHAINS = (
+    "ethereum", "ethereum", "ethereum", "bsc", "bsc", "polygon", "arbitrum",
+    "avalanche", "fantom", "bitcoin", "algorand", "eos", "mixin",
+)
+
+TAXONOMY = (
+    ("SC", "Coding mistake", "Reentrancy"),
+    ("SC", "Coding mistake", "Absence of coding logic or sanity check"),
+    ("SC", "Access control mistake", "Inconsistent access control"),
+    ("PRO", "Unsafe dependency", "On-chain oracle manipulation"),
+    ("PRO", "Unsafe dependency", "Other unsafe DeFi protocol dependency"),
+    ("AUX", "Faulty Operation", "Compromised private key / wallet"),
+    ("AUX", "Faulty Web Development", "N/A"),
+    ("AUX", "Greedy Operator", "Insider trade or other activities"),
+    ("CON", "Faulty Operation", "N/A"),
+    ("NET", "Faulty Operation", "N/A"),
+)
+
+ATTACK_PATTERN_NAMES = (
+    "Price oracle manipulation", "Read-only reentrancy vulnerability",
+    "Private key theft incident", "Logic error vulnerability",
+    "Invocation of privileged function", "Front-end Exploit",
+    "Flash loan attack", "Unauthorized withdrawals",
+)
+
+PROTOCOL_WORDS = (
+    "Swap", "Finance", "Markets", "Capital", "Bridge", "Lend", "Vault",
+    "Rings", "Hub", "Protocol", "DAO", "Exchange",
+)
+
+PROTOCOL_PREFIXES = (
+    "Kyber", "Baby", "Transit", "Mango", "Pando", "Helio", "Lode", "Midas",
+    "Platy", "Algo", "Deri", "Orbit", "Nova", "Astra", "Zeta", "Hydra",
+)
+
+
+class _Incident(object):
+
+    def __init__(self, rng, number, reused_addresses):
+        self.rng = rng
+        self.number = number
+        self.reused_addresses = reused_addresses
+
+        day = datetime.date(2020, 1, 1) + datetime.timedelta(days=rng.randrange(365 * 4))
+        self.published = day.strftime("%Y-%m-%dT00:00:00Z")
+        self.stamp = (day + datetime.timedelta(days=rng.randrange(1, 180))).strftime("%Y-%m-%dT00:00:00.000Z")
+        self.sco_stamp = self.stamp.replace(".000Z", "Z")
+        self.protocol = "%s%s %d" % (rng.choice(PROTOCOL_PREFIXES), rng.choice(PROTOCOL_WORDS), number)
+        self.name = "%s %s" % (self.protocol, day.strftime("%y.%m.%d"))
+
+    def make_id(self, stix_type):
+        return "%s--%s" % (stix_type, uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def sdo(self, stix_type, **properties):
+        stix_obj = {
+            "type": stix_type,
+            "spec_version": "2.1",
+            "id": self.make_id(stix_type),
+            "created": self.stamp,
+            "modified": self.stamp,
+        }
+        stix_obj.update(properties)
+        return stix_obj
+
+    def relationship(self, relationship_type, source_ref, target_ref):
+        return self.sdo(
+            "relationship", relationship_type=relationship_type,
+            source_ref=source_ref, target_ref=target_ref,
+        )
+
+    def address(self, blockchain):
+        rng = self.rng
+        if blockchain == "bitcoin":
+            return "bc1q" + "".join(rng.choice("023456789acdefghjklmnpqrstuvwxyz") for _ in range(38))
+        if blockchain == "algorand":
+            return "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ234567") for _ in range(58))
+        if blockchain == "eos":
+            return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz12345") for _ in range(12))
+        if blockchain == "mixin":
+            return str(uuid.UUID(int=rng.getrandbits(128), version=3))
+        return "0x%040x" % rng.getrandbits(160)
+
+    def attacker_address(self):
+        rng = self.rng
+        if self.reused_addresses and rng.random() < 0.05:
+            return rng.choice(self.reused_addresses)
+
+        address = (rng.choice(BLOCKCHAINS), None)
+        address = (address[0], self.address(address[0]))
+        if len(self.reused_addresses) < 10000:
+            self.reused_addresses.append(address)
+        return address
+
+    def objects(self, max_indicators):
+        rng = self.rng
+
+        attacker = self.sdo(
+            "threat-actor", name="%s Attacker" % self.protocol,
+            description="Attacker of %s" % self.name,
+        )
+        yield attacker
+
+        victim = self.sdo(
+            "identity", name=self.protocol,
+            description="%s is a DeFi protocol." % self.protocol,
+            identity_class="organization", sectors=["financial-services"],
+            external_references=[{
+                "source_name": self.protocol,
+                "url": "https://%s.example/" % self.protocol.lower().replace(" ", "-"),
+            }],
+        )
+        yield victim
+
+        layer, cause, incident_type = rng.choice(TAXONOMY)
+        attack_pattern = self.sdo(
+            "attack-pattern", name=rng.choice(ATTACK_PATTERN_NAMES),
+            extensions={ATTACK_PATTERN_EXTENSION_DEFINITION_ID: {"extension_type": "toplevel-property-extension"}},
+            x_defi_taxonomy_layer=layer,
+            x_defi_taxonomy_incident_cause=cause,
+            x_defi_taxonomy_incident_type=incident_type,
+        )
+        yield attack_pattern
+
+        for _ in range(rng.randint(1, max_indicators)):
+            blockchain, value = self.attacker_address()
+            pattern = "[x-defi-address:value = '%s' AND x-defi-address:blockchain = '%s']" % (value, blockchain)
+            if rng.random() < 0.05:
+                other = rng.choice(BLOCKCHAINS)
+                pattern = (
+                    "[x-defi-address:value = '%s' AND (x-defi-address:blockchain = '%s' "
+                    "OR x-defi-address:blockchain = '%s')]" % (value, blockchain, other)
+                )
+            indicator = self.sdo(
+                "indicator", name=value,
+                description="%s Address" % attacker["name"],
+                pattern=pattern, pattern_type="stix", pattern_version="2.1",
+                valid_from=self.sco_stamp,
+            )
+            yield indicator
+            yield self.relationship("indicates", indicator["id"], attacker["id"])
+
+        for i in range(rng.randint(1, 3)):
+            blockchain = rng.choice(BLOCKCHAINS)
+            value = self.address(blockchain)
+            address = {
+                "type": "x-defi-address",
+                "spec_version": "2.1",
+                "id": self.make_id("x-defi-address"),
+                "name": "%s - %s" % (value, blockchain.capitalize()),
+                "description": "%s Attack Victim %d" % (self.protocol, i),
+                "created": self.sco_stamp,
+                "modified": self.sco_stamp,
+                "blockchain": blockchain,
+                "value": value,
+            }
+            yield address
+            yield self.relationship("uses", victim["id"], address["id"])
+
+        yield self.relationship("uses", attacker["id"], attack_pattern["id"])
+        yield self.relationship("targets", attacker["id"], victim["id"])
+        yield self.relationship("targets", attack_pattern["id"], victim["id"])
+
+        report = self.sdo(
+            "report", name=self.name,
+            description="On %s %s users lost funds to an exploit." % (self.published[:10], self.protocol),
+            report_types=["threat-actor", "attack-pattern"],
+            published=self.published,
+            object_refs=[attacker["id"], victim["id"]],
+            external_references=[{
+                "source_name": "Rekt News",
+                "url": "https://rekt.news/%s-rekt/" % self.protocol.lower().replace(" ", "-"),
+            }],
+            extensions={REPORT_EXTENSION_DEFINITION_ID: {"extension_type": "toplevel-property-extension"}},
+            x_defi_estimated_loss_usd=rng.randrange(10000, 600000000),
+        )
+        yield report
+
+        for minute in sorted(rng.sample(range(24 * 60), rng.randint(1, 4))):
+            yield self.sdo(
+                "note",
+                content="%sT%02d:%02d:00Z - Incident timeline event" % (self.published[:10], minute // 60, minute % 60),
+                object_refs=[report["id"]],
+            )
+
+
+def generate_corpus(objects, seed=0, max_indicators=24):
+    """Yield at least `objects` STIX dicts, whole incidents at a time.
+
+    Args:
+        objects (int): number of objects to generate
+        seed (int): seed of the generator, the same seed gives the same corpus
+        max_indicators (int): maximum number of indicators per incident
+
+    """
+    rng = random.Random(seed)
+    reused_addresses = []
+    generated = 0
+    number = 0
+    while generated < objects:
+        number += 1
+        for stix_obj in _Incident(rng, number, reused_addresses).objects(max_indicators):
+            generated += 1
+            yield stix_obj
+
+
+def write_corpus(stix_dir, objects, seed=0, max_indicators=24):
+    """Write a synthetic corpus in the FileSystemStore layout.
+
+    Returns:
+        int: The number of written objects.
+
+    """
+    written = 0
+    for stix_obj in generate_corpus(objects, seed=seed, max_indicators=max_indicators):
+        obj_dir = os.path.join(stix_dir, stix_obj["type"], stix_obj["id"])
+        os.makedirs(obj_dir, exist_ok=True)
+        file_path = os.path.join(obj_dir, version_filename(stix_obj["modified"]) + ".json")
+        with io.open(file_path, "w", encoding="utf-8") as f:
+            json.dump(stix_obj, f, indent=4, ensure_ascii=False)
+        written += 1
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m menpo.synthetic", description="Write a synthetic Menpo corpus")
+    parser.add_argument("stix_dir")
+    parser.add_argument("--objects", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-indicators", type=int, default=24)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.stix_dir, exist_ok=True)
+    print("Wrote", write_corpus(args.stix_dir, args.objects, seed=args.seed, max_indicators=args.max_indicators), "objects")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
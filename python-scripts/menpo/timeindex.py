@@ -0,0 +1,304 @@
+"""Sorted time index over the timestamps of a FileSystemStore directory.
+
+Listing reports by `published`, or the incidents of a quarter, used to load
+every object and sort them.  The time index keeps, for each field of
+`FIELDS`, the `[epoch, id]` pairs of every object sorted by time, with
+timestamps as integer microseconds since the Unix epoch:
+
+- `published`, `created` and `modified` come from the index entries, no
+  object file is read for them;
+- `timeline` is the timestamp a timeline note starts with
+  (`"2022-11-06T03:20:00Z - ..."` in its content or abstract), only note
+  files are read for it.
+
+Range queries are two binary searches, and results are iterated in time
+order (or reverse) as they are needed: the N most recent reports are the
+last N pairs of `published`, whatever the size of the corpus.
+
+The index lives in `<stix_dir>/.menpo-time.json` and is refreshed through
+the index: only the objects whose directory changed are looked at again.
+
+    cd python-scripts
+    python3 -m menpo.timeindex --field published --from 2022-10 --to 2022-12
+    python3 -m menpo.timeindex --latest 5 --type report
+"""
+import argparse
+import bisect
+import datetime
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+
+from itertools import islice
+
+from menpo.index import FileSystemIndex, _read_json, normalize_timestamp
+
+TIME_FILENAME = ".menpo-time.json"
+
+# Bump whenever the layout changes, older time indexes are then rebuilt
+TIME_VERSION = 1
+
+FIELDS = ("published", "created", "modified", "timeline")
+
+# Beyond this share of changed objects, a field is sorted again instead of
+# being updated in place
+RESORT_SHARE = 0.05
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_TIMELINE = re.compile(r"\s*(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d{1,6})?Z)")
+_PERIOD = re.compile(r"(\d{4})(?:-(\d\d)(?:-(\d\d))?)?")
+
+
+def to_epoch(value):
+    """Microseconds since the Unix epoch of a timestamp (string or
+    datetime)."""
+    ts = normalize_timestamp(value)
+    days = datetime.date(int(ts[:4]), int(ts[5:7]), int(ts[8:10])).toordinal() - _EPOCH_ORDINAL
+    seconds = ((days * 24 + int(ts[11:13])) * 60 + int(ts[14:16])) * 60 + int(ts[17:19])
+    return seconds * 1000000 + int(ts[20:26])
+
+
+def from_epoch(epoch):
+    """The timestamp string of epoch microseconds."""
+    return (datetime.datetime(1970, 1, 1) + datetime.timedelta(microseconds=epoch)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def period(value):
+    """The bounds of a period, in epoch microseconds: a year (`"2022"`), a
+    month (`"2022-10"`), a day (`"2022-10-01"`), or a single instant (a
+    timestamp string, a datetime or epoch microseconds).
+
+    Returns:
+        tuple: the start of the period and the end of it, excluded
+
+    """
+    if isinstance(value, int):
+        return value, value + 1
+    if isinstance(value, str):
+        match = _PERIOD.fullmatch(value.strip())
+        if match is not None:
+            year, month, day = match.groups()
+            start = datetime.date(int(year), int(month or 1), int(day or 1))
+            if day is not None:
+                end = start + datetime.timedelta(days=1)
+            elif month is not None:
+                end = (start + datetime.timedelta(days=31)).replace(day=1)
+            else:
+                end = start.replace(year=start.year + 1)
+            return (start.toordinal() - _EPOCH_ORDINAL) * 86400000000, (end.toordinal() - _EPOCH_ORDINAL) * 86400000000
+    epoch = to_epoch(value)
+    return epoch, epoch + 1
+
+
+def note_timeline(note):
+    """The timestamp a timeline note starts with, or None."""
+    for prop in ("content", "abstract"):
+        match = _TIMELINE.match(note.get(prop) or "")
+        if match is not None:
+            return match.group(1)
+    return None
+
+
+class TimeIndex(object):
+    """Objects sorted by `published`, `created`, `modified` and timeline
+    timestamps.
+
+    Args:
+        stix_dir (str): path to directory of STIX objects
+        filename (str): name of the time index file inside `stix_dir`
+        encoding (str): The encoding to use when reading object files.
+
+    """
+    def __init__(self, stix_dir, filename=TIME_FILENAME, encoding="utf-8"):
+        self._stix_dir = os.path.abspath(stix_dir)
+        self._path = os.path.join(self._stix_dir, filename)
+        self.encoding = encoding
+        # id -> [directory mtime, {field: epoch}]
+        self._objects = {}
+        # field -> sorted [epoch, id] pairs
+        self._fields = {field: [] for field in FIELDS}
+        self._dirty = False
+        self.load()
+
+    @property
+    def path(self):
+        return self._path
+
+    def __len__(self):
+        return len(self._objects)
+
+    def load(self):
+        """Load the time index file, if there is one with the current layout."""
+        self._objects = {}
+        self._fields = {field: [] for field in FIELDS}
+        try:
+            with io.open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+
+        if data.get("version") == TIME_VERSION:
+            self._objects = data["objects"]
+            self._fields = data["fields"]
+
+    def save(self):
+        """Atomically write the time index file, if anything changed."""
+        if not self._dirty:
+            return
+
+        data = {"version": TIME_VERSION, "objects": self._objects, "fields": self._fields}
+        fd, tmp_path = tempfile.mkstemp(dir=self._stix_dir, prefix=".menpo-tmp-")
+        try:
+            with io.open(fd, "w", encoding="utf-8") as f:
+                # dumps, unlike dump, uses the C encoder
+                f.write(json.dumps(data, separators=(",", ":")))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self._path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self._dirty = False
+
+    def _times(self, entry):
+        times = {field: to_epoch(entry[field]) for field in ("published", "created", "modified") if field in entry}
+        if entry["type"] == "note":
+            timeline = note_timeline(_read_json(os.path.join(self._stix_dir, entry["path"]), self.encoding))
+            if timeline is not None:
+                times["timeline"] = to_epoch(timeline)
+        return times
+
+    def refresh(self, index=None):
+        """Bring the time index up to date with the store.  The time index
+        file is saved when anything changed.
+
+        Args:
+            index (FileSystemIndex): an up to date index of the store, one is
+                refreshed here by default
+
+        Returns:
+            int: The number of objects updated or removed.
+
+        """
+        if index is None:
+            index = FileSystemIndex(self._stix_dir)
+            index.refresh()
+
+        entries = index.entries()
+        stored = {entry["id"] for entry in entries}
+        changes = [(stix_id, self._objects[stix_id][1], {}) for stix_id in self._objects if stix_id not in stored]
+        for stix_id, _, _ in changes:
+            del self._objects[stix_id]
+        for entry in entries:
+            current = self._objects.get(entry["id"])
+            if current is None or current[0] != entry["mtime"]:
+                times = self._times(entry)
+                changes.append((entry["id"], current[1] if current is not None else {}, times))
+                self._objects[entry["id"]] = [entry["mtime"], times]
+        if not changes:
+            return 0
+
+        if len(changes) > RESORT_SHARE * len(self._objects):
+            for field in FIELDS:
+                self._fields[field] = sorted(
+                    [times[field], stix_id] for stix_id, (_, times) in self._objects.items() if field in times
+                )
+        else:
+            for stix_id, old, new in changes:
+                for field in FIELDS:
+                    if old.get(field) == new.get(field):
+                        continue
+                    pairs = self._fields[field]
+                    if field in old:
+                        del pairs[bisect.bisect_left(pairs, [old[field], stix_id])]
+                    if field in new:
+                        bisect.insort(pairs, [new[field], stix_id])
+
+        self._dirty = True
+        self.save()
+        return len(changes)
+
+    def range(self, field="published", start=None, end=None, types=None, reverse=False):
+        """Iterate over the objects with a timestamp in a range, in time order.
+
+        Args:
+            field (str): one of `FIELDS`
+            start: the first period included (see `period`), from the
+                earliest timestamp by default
+            end: the last period included (see `period`), up to the latest
+                timestamp by default
+            types (iterable): only objects of these STIX types
+            reverse (bool): latest first
+
+        Returns:
+            iterator: `(epoch, stix_id)` pairs
+
+        """
+        if field not in FIELDS:
+            raise ValueError("no time index of %r, only of %s" % (field, ", ".join(FIELDS)))
+        pairs = self._fields[field]
+        low = bisect.bisect_left(pairs, [period(start)[0]]) if start is not None else 0
+        high = bisect.bisect_left(pairs, [period(end)[1]]) if end is not None else len(pairs)
+
+        positions = range(high - 1, low - 1, -1) if reverse else range(low, high)
+        prefixes = tuple(stix_type + "--" for stix_type in types) if types is not None else None
+        for position in positions:
+            epoch, stix_id = pairs[position]
+            if prefixes is None or stix_id.startswith(prefixes):
+                yield epoch, stix_id
+
+    def latest(self, count, field="published", types=None):
+        """Return the `count` objects with the latest timestamps, latest
+        first, as `(epoch, stix_id)` pairs."""
+        return list(islice(self.range(field, types=types, reverse=True), count))
+
+    def count(self, field="published", start=None, end=None):
+        """Return the number of objects with a timestamp in a range, see
+        `range`."""
+        if field not in FIELDS:
+            raise ValueError("no time index of %r, only of %s" % (field, ", ".join(FIELDS)))
+        pairs = self._fields[field]
+        low = bisect.bisect_left(pairs, [period(start)[0]]) if start is not None else 0
+        high = bisect.bisect_left(pairs, [period(end)[1]]) if end is not None else len(pairs)
+        return max(high - low, 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m menpo.timeindex", description="List Menpo objects in time order")
+    parser.add_argument("--field", choices=FIELDS, default="published")
+    parser.add_argument("--from", dest="start", help="first year, month, day or timestamp included")
+    parser.add_argument("--to", dest="end", help="last year, month, day or timestamp included")
+    parser.add_argument("--type", action="append", help="only objects of this type, may be repeated")
+    parser.add_argument("--latest", type=int, help="only the latest N objects, latest first")
+    parser.add_argument("--stix-dir", default=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "db"))
+    parser.add_argument("--no-refresh", action="store_true", help="answer from the time index file as it is")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    index = FileSystemIndex(args.stix_dir)
+    times = TimeIndex(args.stix_dir)
+    if not args.no_refresh:
+        index.refresh()
+        times.refresh(index)
+
+    try:
+        results = times.range(args.field, args.start, args.end, types=args.type, reverse=args.latest is not None)
+        results = list(islice(results, args.latest)) if args.latest is not None else list(results)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(json.dumps([{"id": stix_id, args.field: from_epoch(epoch)} for epoch, stix_id in results], indent=4))
+    else:
+        for epoch, stix_id in results:
+            entry = index.lookup(stix_id) or {}
+            print(f"{from_epoch(epoch)[:19]}  {stix_id}  {entry.get('name') or ''}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
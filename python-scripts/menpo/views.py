@@ -0,0 +1,181 @@
+"""Lazy, dict-backed STIX objects for read paths.
+
+Building a stix2 object runs every property through validation, which is
+wasted work for trusted data that is already in `db/`.  `StixView` is the
+JSON dict as read from the file, with attribute access on top of it
+(`report.name`, `report.external_references[0].url`), and `promote` builds
+the validated stix2 object only when it is needed.
+
+Timestamps stay the strings stored in the files.  Filters on timestamp
+properties still compare them as timestamps.
+"""
+import io
+import json
+import os
+
+from stix2.datastore.filters import FilterSet, _check_filter
+from stix2.parsing import parse
+
+from menpo.index import (
+    NARROWING_PROPERTIES, IndexedFileSystemSource, normalize_timestamp,
+)
+
+# Common and Menpo timestamp properties, compared as timestamps by filters
+TIMESTAMP_PROPERTIES = (
+    "created", "modified", "published", "valid_from", "valid_until",
+    "first_seen", "last_seen", "first_observed", "last_observed",
+)
+
+
+def _wrap(value):
+    if isinstance(value, dict) and not isinstance(value, StixView):
+        return StixView(value)
+    if isinstance(value, list) and any(isinstance(v, dict) for v in value):
+        return [_wrap(v) for v in value]
+    return value
+
+
+class StixView(dict):
+    """A STIX object as a plain dict, with attribute access.
+
+    Nested dicts (e.g. external references) are wrapped on access, the
+    object itself is never validated unless it is promoted.
+
+    Args:
+        version (str): STIX version to promote the view with, detected by
+            default
+
+    """
+    __slots__ = ("_version",)
+
+    def __init__(self, *args, version=None, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._version = version
+
+    def __getattr__(self, name):
+        try:
+            return _wrap(self[name])
+        except KeyError:
+            raise AttributeError("'%s' object has no attribute '%s'" % (self.get("type", "StixView"), name))
+
+    def __repr__(self):
+        return "StixView(%s)" % dict.__repr__(self)
+
+    def promote(self, allow_custom=True, version=None):
+        """Build the validated stix2 object for this view."""
+        return parse(dict(self), allow_custom=allow_custom, version=version or self._version)
+
+
+def apply_filters(views, query):
+    """Like `apply_common_filters`, for views: timestamp properties are
+    normalized on both sides before they are compared."""
+    filters = []
+    for filter_ in query:
+        if filter_.property in TIMESTAMP_PROPERTIES and not isinstance(filter_.value, (list, tuple)):
+            filter_ = filter_._replace(value=normalize_timestamp(filter_.value))
+        filters.append(filter_)
+
+    for view in views:
+        for filter_ in filters:
+            if filter_.property in TIMESTAMP_PROPERTIES and filter_.property in view:
+                match = _check_filter(filter_, {filter_.property: normalize_timestamp(view[filter_.property])})
+            else:
+                match = _check_filter(filter_, view)
+            if not match:
+                break
+        else:
+            yield view
+
+
+def read_view(filepath, encoding="utf-8", version=None):
+    """Read a STIX JSON file into a `StixView`, promoted with `version`."""
+    with io.open(filepath, "r", encoding=encoding) as f:
+        stix_json = json.load(f)
+
+    if stix_json.get("type") == "bundle":
+        stix_json = stix_json["objects"][0]
+
+    return StixView(stix_json, version=version)
+
+
+class LazyFileSystemSource(IndexedFileSystemSource):
+    """IndexedFileSystemSource which returns `StixView` objects.
+
+    Same arguments and queries as `IndexedFileSystemSource`, but nothing is
+    validated: only use it on trusted data, and `promote` the views that
+    need to be full stix2 objects.
+
+    """
+    def _read_versions(self, path, version=None):
+        if path.count("/") == 1:
+            return [read_view(os.path.join(self._stix_dir, path), self.encoding, version)]
+
+        obj_dir = os.path.join(self._stix_dir, os.path.dirname(path))
+        return [
+            read_view(os.path.join(obj_dir, filename), self.encoding, version)
+            for filename in os.listdir(obj_dir) if filename.endswith(".json")
+        ]
+
+    def _directory_versions(self, stix_id, version=None):
+        # Objects written since the index was refreshed, in the layout of
+        # FileSystemSink: <type>/<id>/<modified>.json or <type>/<id>.json
+        stix_type = stix_id.split("--", 1)[0]
+        path = "%s/%s.json" % (stix_type, stix_id)
+        if os.path.isfile(os.path.join(self._stix_dir, path)):
+            return self._read_versions(path, version)
+        if os.path.isdir(os.path.join(self._stix_dir, stix_type, stix_id)):
+            return self._read_versions("%s/%s/" % (stix_type, stix_id), version)
+        return []
+
+    def _versions(self, stix_id, version=None):
+        entry = self.index.lookup(stix_id)
+        if entry is not None:
+            try:
+                return self._read_versions(entry["path"], version)
+            except FileNotFoundError:
+                pass
+        return self._directory_versions(stix_id, version)
+
+    def _complete_query(self, query, _composite_filters):
+        query = FilterSet(query)
+        if self.filters:
+            query.add(self.filters)
+        if _composite_filters:
+            query.add(_composite_filters)
+        return query
+
+    def get(self, stix_id, version=None, _composite_filters=None):
+        """Retrieve the latest version of a STIX object as a view.  Objects
+        missing from the index are looked up in their directory."""
+        query = self._complete_query(None, _composite_filters)
+        entry = self.index.lookup(stix_id)
+        if entry is not None and not query:
+            try:
+                return read_view(os.path.join(self._stix_dir, entry["path"]), self.encoding, version)
+            except FileNotFoundError:
+                pass
+
+        views = sorted(
+            apply_filters(self._versions(stix_id, version), query),
+            key=lambda k: normalize_timestamp(k["modified"]) if "modified" in k else "",
+        )
+        return views[-1] if views else None
+
+    def all_versions(self, stix_id, version=None, _composite_filters=None):
+        """Retrieve every version of a STIX object as views."""
+        query = self._complete_query(None, _composite_filters)
+        return list(apply_filters(self._versions(stix_id, version), query))
+
+    def query(self, query=None, version=None, _composite_filters=None):
+        """Search and retrieve STIX objects as views.  Id and type filters
+        narrow the candidates with the index, every version of which is then
+        checked against the whole query."""
+        query = self._complete_query(query, _composite_filters)
+        self._refresh_if_changed()
+        indexed = [f for f in query if f.property in NARROWING_PROPERTIES]
+        entries = self.index.query(indexed) if indexed else self.index.entries()
+
+        results = []
+        for entry in entries:
+            results.extend(apply_filters(self._read_versions(entry["path"], version), query))
+        return results
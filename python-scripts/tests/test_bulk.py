@@ -0,0 +1,51 @@
+import json
+import os
+import threading
+
+from menpo.bulk import COMMIT_FILENAME, STAGE_PREFIX, BulkWriter, recover, store_lock
+
+IDENTITY = {
+    "type": "identity",
+    "spec_version": "2.1",
+    "id": "identity--0d1f4e2a-9c35-4b7e-8a6c-2f0d4c3e8b7a",
+    "created": "2023-03-01T00:00:00.000Z",
+    "modified": "2023-03-01T00:00:00.000Z",
+    "name": "KyberSwap",
+    "identity_class": "organization",
+}
+PATH = "identity/identity--0d1f4e2a-9c35-4b7e-8a6c-2f0d4c3e8b7a/20230301000000000.json"
+
+
+def test_write(tmp_path):
+    assert BulkWriter(str(tmp_path)).write([IDENTITY]) == 1
+    assert json.loads((tmp_path / PATH).read_text())["name"] == "KyberSwap"
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(STAGE_PREFIX)]
+
+
+def test_recover_completes_committed_batches(tmp_path):
+    stage_dir = tmp_path / (STAGE_PREFIX + "crashed")
+    stage_dir.mkdir()
+    (stage_dir / "0.json").write_text(json.dumps(IDENTITY))
+    (stage_dir / COMMIT_FILENAME).write_text(json.dumps([PATH]))
+    (tmp_path / (STAGE_PREFIX + "uncommitted")).mkdir()
+
+    assert recover(str(tmp_path)) == 1
+    assert (tmp_path / PATH).is_file()
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(STAGE_PREFIX)]
+
+
+def test_recover_waits_for_batches_being_written(tmp_path):
+    stage_dir = tmp_path / (STAGE_PREFIX + "writing")
+    with store_lock(str(tmp_path)):
+        # Another writer staging a batch
+        stage_dir.mkdir()
+        (stage_dir / "0.json").write_text(json.dumps(IDENTITY))
+        recovery = threading.Thread(target=BulkWriter, args=(str(tmp_path),))
+        recovery.start()
+        recovery.join(0.2)
+        assert recovery.is_alive()
+        assert (stage_dir / "0.json").is_file()
+        (stage_dir / COMMIT_FILENAME).write_text(json.dumps([PATH]))
+
+    recovery.join()
+    assert (tmp_path / PATH).is_file()
@@ -0,0 +1,62 @@
+import pytest
+
+from stix2 import FileSystemSink, FileSystemSource, MemorySource
+
+from menpo.cache import CachedSource
+
+IDENTITY = {
+    "type": "identity",
+    "spec_version": "2.1",
+    "id": "identity--0d1f4e2a-9c35-4b7e-8a6c-2f0d4c3e8b7a",
+    "created": "2023-03-01T00:00:00.000Z",
+    "modified": "2023-03-01T00:00:00.000Z",
+    "name": "KyberSwap",
+    "identity_class": "organization",
+}
+
+
+def identity(number, **properties):
+    return dict(IDENTITY, id="identity--0d1f4e2a-9c35-4b7e-8a6c-2f0d4c3e8b%02d" % number, **properties)
+
+
+def test_hits_and_invalidation_by_directory_mtime(tmp_path):
+    FileSystemSink(str(tmp_path)).add(IDENTITY)
+    source = CachedSource(FileSystemSource(str(tmp_path)))
+
+    assert source.get(IDENTITY["id"]).name == "KyberSwap"
+    assert source.get(IDENTITY["id"]).name == "KyberSwap"
+    assert (source.hits, source.misses) == (1, 1)
+    # Cached apart from the objects of other STIX versions
+    source.get(IDENTITY["id"], version="2.1")
+    assert source.misses == 2
+
+    FileSystemSink(str(tmp_path)).add(dict(IDENTITY, modified="2023-03-02T00:00:00.000Z", name="Kyber"))
+    assert source.get(IDENTITY["id"]).name == "Kyber"
+    assert source.misses == 3
+
+
+def test_least_recently_used_objects_are_evicted(tmp_path):
+    FileSystemSink(str(tmp_path)).add([identity(number) for number in range(3)])
+    source = CachedSource(FileSystemSource(str(tmp_path)), maxsize=2)
+
+    for number in (0, 1, 0, 2):
+        source.get(identity(number)["id"])
+    assert len(source) == 2
+    source.get(identity(0)["id"])
+    source.get(identity(1)["id"])
+    assert (source.hits, source.misses) == (2, 4)
+
+
+def test_generation_invalidates_other_sources():
+    generation = [0]
+    source = CachedSource(MemorySource([IDENTITY]), generation=lambda: generation[0])
+    source.get(IDENTITY["id"])
+    source.get(IDENTITY["id"])
+    assert source.hits == 1
+
+    generation[0] += 1
+    source.get(IDENTITY["id"])
+    assert source.misses == 2
+
+    with pytest.raises(ValueError):
+        CachedSource(MemorySource([IDENTITY]))
@@ -0,0 +1,14 @@
+import datetime
+
+from menpo.extract import latest_by_id
+
+
+def test_latest_by_id_compares_timestamps_not_strings():
+    # "...00.5Z" is later than "...00.123Z", but sorts before it as a string
+    later = {"id": "identity--0d1f4e2a-9c35-4b7e-8a6c-2f0d4c3e8b7a", "modified": "2023-04-19T00:00:00.5Z"}
+    earlier = {"id": later["id"], "modified": "2023-04-19T00:00:00.123Z"}
+    assert latest_by_id([later, earlier])[later["id"]] is later
+    assert latest_by_id([earlier, later])[later["id"]] is later
+
+    dated = {"id": later["id"], "modified": datetime.datetime(2023, 4, 19, 0, 0, 1, tzinfo=datetime.timezone.utc)}
+    assert latest_by_id([later, dated])[later["id"]] is dated
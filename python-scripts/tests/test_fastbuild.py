@@ -0,0 +1,39 @@
+import glob
+import json
+import os
+
+from stix2.parsing import parse
+
+from menpo import fastbuild
+from menpo.fastbuild import FastBuilder
+
+DB = os.path.join(os.path.dirname(__file__), "..", "..", "db")
+
+
+def db_objects():
+    for path in sorted(glob.glob(os.path.join(DB, "*", "*", "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            yield json.load(f)
+
+
+def test_same_objects_as_stix2_parse_on_the_db():
+    builder = FastBuilder(allow_custom=True)
+    count = 0
+    for stix_dict in db_objects():
+        fast = builder.build(stix_dict)
+        parsed = parse(stix_dict, allow_custom=True)
+        assert type(fast) is type(parsed)
+        assert fast.serialize(pretty=True) == parsed.serialize(pretty=True)
+        assert fast.has_custom == parsed.has_custom
+        count += 1
+    assert count == 273
+    # Every object of the db is built on the fast path
+    assert builder.fallbacks == 0
+
+
+def test_other_stix2_versions_fall_back_to_parse(monkeypatch):
+    monkeypatch.setattr(fastbuild, "FAST_PATH", False)
+    builder = FastBuilder(allow_custom=True)
+    stix_dict = next(db_objects())
+    assert builder.build(stix_dict).serialize() == parse(stix_dict, allow_custom=True).serialize()
+    assert builder.fallbacks == 1
@@ -0,0 +1,39 @@
+import pytest
+
+from menpo.bulk import BulkWriter
+from menpo.flagged import FlaggedFilters
+from menpo.flagged_export import EvaluatedPatternError, build_filters, flagged_addresses
+
+
+def indicator(pattern, uuid):
+    return {
+        "type": "indicator",
+        "spec_version": "2.1",
+        "id": "indicator--%s" % uuid,
+        "created": "2023-03-01T00:00:00.000Z",
+        "modified": "2023-03-01T00:00:00.000Z",
+        "pattern": pattern,
+        "pattern_type": "stix",
+        "valid_from": "2023-03-01T00:00:00Z",
+    }
+
+
+def test_values_on_any_blockchain_are_flagged_everywhere(tmp_path):
+    BulkWriter(str(tmp_path)).write([
+        indicator("[x-defi-address:value = '0xAAA' AND x-defi-address:blockchain = 'ethereum']",
+                  "6f2b3c59-5a1b-4d6e-9d1c-3f7b2a8e4c10"),
+        indicator("[x-defi-address:value = '0xBBB']", "0d1f4e2a-9c35-4b7e-8a6c-2f0d4c3e8b7a"),
+    ])
+    filters = FlaggedFilters.from_bytes(build_filters(flagged_addresses(str(tmp_path))).to_bytes())
+
+    assert filters.maybe_flagged("Ethereum", "0xaaa")
+    assert filters.maybe_flagged("polygon", "0xbbb")
+    assert filters.flagged_blockchains("0xbbb") == ["*"]
+
+
+def test_evaluated_patterns_are_refused(tmp_path):
+    BulkWriter(str(tmp_path)).write([
+        indicator("[x-defi-address:value LIKE '0xaaa%']", "6f2b3c59-5a1b-4d6e-9d1c-3f7b2a8e4c10"),
+    ])
+    with pytest.raises(EvaluatedPatternError):
+        flagged_addresses(str(tmp_path))
@@ -0,0 +1,82 @@
+import copy
+
+from menpo.ids import assign_ids
+
+REPORT = {
+    "type": "report",
+    "spec_version": "2.1",
+    "id": "report--6f2b3c59-5a1b-4d6e-9d1c-3f7b2a8e4c10",
+    "created": "2023-03-01T00:00:00.000Z",
+    "modified": "2023-03-01T00:00:00.000Z",
+    "name": "KyberSwap 22.09.01",
+    "published": "2022-09-01T00:00:00Z",
+    "object_refs": ["indicator--0b9e4a6c-2f0d-4c3e-8b7a-6d1f4e2a9c35"],
+}
+
+INDICATOR = {
+    "type": "indicator",
+    "spec_version": "2.1",
+    "id": "indicator--0b9e4a6c-2f0d-4c3e-8b7a-6d1f4e2a9c35",
+    "created": "2023-03-01T00:00:00.000Z",
+    "modified": "2023-03-01T00:00:00.000Z",
+    "name": "0x57a72ce4fd69ebedefc1a938b690fbf11a7dff80",
+    "description": "KyberSwap Attacker",
+    "pattern": "[x-defi-address:value = '0x57a72ce4fd69ebedefc1a938b690fbf11a7dff80']",
+    "pattern_type": "stix",
+    "pattern_version": "2.1",
+    "valid_from": "2023-03-01T00:00:00Z",
+}
+
+
+def note(content, i):
+    return {
+        "type": "note",
+        "spec_version": "2.1",
+        "id": "note--0b9e4a6c-2f0d-4c3e-8b7a-6d1f4e2a9c%02d" % i,
+        "created": "2023-03-01T00:00:00.000Z",
+        "modified": "2023-03-01T00:00:00.000Z",
+        "content": content,
+        "object_refs": [REPORT["id"]],
+    }
+
+
+def batch():
+    return [copy.deepcopy(INDICATOR), copy.deepcopy(REPORT), note("2022-09-01T10:00:00Z - first", 1),
+            note("2022-09-01T11:00:00Z - second", 2)]
+
+
+def ids(stix_objs):
+    return [stix_obj["id"] for stix_obj in assign_ids(stix_objs)]
+
+
+def test_editing_a_description_keeps_the_id():
+    edited = batch()
+    edited[0]["description"] = "KyberSwap Attacker, funds moved to Tornado Cash"
+    edited[0]["name"] = "KyberSwap attacker address"
+    assert ids(edited) == ids(batch())
+
+
+def test_editing_note_content_keeps_the_id():
+    edited = batch()
+    edited[2]["content"] = "2022-09-01T10:00:00Z - first, reworded"
+    assert ids(edited) == ids(batch())
+
+
+def test_notes_of_the_same_report_get_distinct_ids():
+    stix_ids = ids(batch())
+    assert len(set(stix_ids)) == len(stix_ids)
+
+
+def test_changing_the_pattern_gives_a_new_id():
+    changed = batch()
+    changed[0]["pattern"] = "[x-defi-address:value = '0x0000000000000000000000000000000000000000']"
+    assert ids(changed)[0] != ids(batch())[0]
+
+
+def test_note_ids_do_not_depend_on_their_order():
+    notes = batch()[2:] + [note("Funds were bridged to BSC", 3), note("The team offered a bounty", 4)]
+    reordered = list(reversed(notes))
+    stix_ids = dict(zip((n["id"] for n in notes), ids([copy.deepcopy(REPORT)] + notes)[1:]))
+    reordered_ids = dict(zip((n["id"] for n in reordered), ids([copy.deepcopy(REPORT)] + reordered)[1:]))
+    assert stix_ids == reordered_ids
+    assert len(set(stix_ids.values())) == len(notes)
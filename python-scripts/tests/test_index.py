@@ -0,0 +1,66 @@
+import os
+import shutil
+
+from stix2 import FileSystemSink, Filter
+
+from menpo.index import FileSystemIndex, IndexedFileSystemSource
+from menpo.views import LazyFileSystemSource
+
+IDENTITY = {
+    "type": "identity",
+    "spec_version": "2.1",
+    "id": "identity--0d1f4e2a-9c35-4b7e-8a6c-2f0d4c3e8b7a",
+    "created": "2023-03-01T00:00:00.000Z",
+    "modified": "2023-03-01T00:00:00.000Z",
+    "name": "KyberSwap",
+    "identity_class": "organization",
+}
+
+
+def test_get_finds_objects_written_after_the_index_was_refreshed(tmp_path):
+    source = IndexedFileSystemSource(str(tmp_path))
+    FileSystemSink(str(tmp_path)).add(IDENTITY)
+
+    assert source.index.lookup(IDENTITY["id"]) is None
+    assert source.get(IDENTITY["id"])["name"] == "KyberSwap"
+    assert source.get("identity--2f0d4c3e-8b7a-4d1f-8e2a-9c350b9e4a6c") is None
+
+
+def test_get_finds_objects_whose_indexed_version_is_gone(tmp_path):
+    FileSystemSink(str(tmp_path)).add(IDENTITY)
+    index = FileSystemIndex(str(tmp_path))
+    index.refresh()
+    source = IndexedFileSystemSource(str(tmp_path), index=index)
+
+    obj_dir = os.path.join(str(tmp_path), "identity", IDENTITY["id"])
+    shutil.rmtree(obj_dir)
+    FileSystemSink(str(tmp_path)).add(dict(IDENTITY, modified="2023-03-02T00:00:00.000Z", name="Kyber"))
+    assert source.get(IDENTITY["id"])["name"] == "Kyber"
+
+
+def test_query_checks_every_version(tmp_path):
+    FileSystemSink(str(tmp_path)).add(IDENTITY)
+    FileSystemSink(str(tmp_path)).add(dict(IDENTITY, modified="2023-03-02T00:00:00.000Z", name="Kyber"))
+
+    for source in (IndexedFileSystemSource(str(tmp_path)), LazyFileSystemSource(str(tmp_path))):
+        results = source.query([Filter("type", "=", "identity"), Filter("name", "=", "KyberSwap")])
+        assert [obj["name"] for obj in results] == ["KyberSwap"]
+
+
+def test_query_finds_objects_written_after_the_index_was_refreshed(tmp_path):
+    source = IndexedFileSystemSource(str(tmp_path))
+    FileSystemSink(str(tmp_path)).add(IDENTITY)
+
+    assert [obj["name"] for obj in source.query([Filter("type", "=", "identity")])] == ["KyberSwap"]
+    assert IDENTITY["id"] in source.index
+
+
+def test_views_of_objects_written_after_the_index_was_refreshed(tmp_path):
+    source = LazyFileSystemSource(str(tmp_path))
+    FileSystemSink(str(tmp_path)).add(IDENTITY)
+    FileSystemSink(str(tmp_path)).add(dict(IDENTITY, modified="2023-03-02T00:00:00.000Z", name="Kyber"))
+
+    assert source.get(IDENTITY["id"]).name == "Kyber"
+    assert len(source.all_versions(IDENTITY["id"])) == 2
+    assert source.get(IDENTITY["id"], version="2.1").promote().name == "Kyber"
+    assert source.all_versions("identity--2f0d4c3e-8b7a-4d1f-8e2a-9c350b9e4a6c") == []
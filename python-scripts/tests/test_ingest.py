@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from stix2 import FileSystemSink
+
+from menpo.ingest import write_objects
+from menpo.manifest import ChangedVersionError
+from menpo.stream import make_observable, make_relationship
+
+IDENTITY = {
+    "type": "identity",
+    "spec_version": "2.1",
+    "id": "identity--0d1f4e2a-9c35-4b7e-8a6c-2f0d4c3e8b7a",
+    "created": "2023-03-01T00:00:00.000Z",
+    "modified": "2023-03-01T00:00:00.000Z",
+    "name": "KyberSwap",
+    "identity_class": "organization",
+}
+
+
+def test_edits_need_a_new_modified(tmp_path):
+    stix_dir = str(tmp_path)
+    assert len(write_objects(stix_dir, [IDENTITY])["added"]) == 1
+    assert len(write_objects(stix_dir, [IDENTITY])["unchanged"]) == 1
+
+    edited = dict(IDENTITY, description="DEX aggregator")
+    assert len(write_objects(stix_dir, [edited], dry_run=True)["changed"]) == 1
+    with pytest.raises(ChangedVersionError, match=IDENTITY["id"]):
+        write_objects(stix_dir, [edited])
+    assert "description" not in (tmp_path / "identity" / IDENTITY["id"] / "20230301000000000.json").read_text()
+
+    bumped = dict(edited, modified="2023-03-02T00:00:00.000Z")
+    assert len(write_objects(stix_dir, [bumped])["added"]) == 1
+
+
+def test_dry_run_leaves_the_sidecar_files_alone(tmp_path):
+    FileSystemSink(str(tmp_path)).add(IDENTITY)
+    assert len(write_objects(str(tmp_path), [IDENTITY], dry_run=True)["unchanged"]) == 1
+    assert [name for name in os.listdir(str(tmp_path)) if name.startswith(".")] == []
+
+
+def test_original_ids_of_objects_pointed_at_canonical_addresses(tmp_path):
+    created = "2023-03-01T00:00:00.000Z"
+    stored = make_observable("x-defi-address", "ethereum", "0x57A72cE4fd69eBEdEfC1a938b690fbf11A7Dff80", created)
+    write_objects(str(tmp_path), [IDENTITY, stored])
+
+    address = make_observable("x-defi-address", "ethereum", "0x57a72ce4fd69ebedefc1a938b690fbf11a7dff80", created)
+    relationship = make_relationship("attributed-to", address["id"], IDENTITY["id"], created)
+    written = write_objects(str(tmp_path), [address, relationship])
+
+    [added] = written["added"]
+    assert added["source_ref"] == stored["id"]
+    assert written["original_ids"] == {added["id"]: relationship["id"]}
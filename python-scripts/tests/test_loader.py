@@ -0,0 +1,23 @@
+import os
+
+from stix2 import Filter
+
+from menpo.loader import GraphSource, load_graph
+
+STIX_ID = "identity--0d1f4e2a-9c35-4b7e-8a6c-2f0d4c3e8b7a"
+
+
+def test_latest_version_by_timestamp_not_string():
+    # "...00.5Z" is later than "...00.123Z", but sorts before it as a string
+    later = {"type": "identity", "id": STIX_ID, "modified": "2023-04-19T00:00:00.5Z", "name": "later"}
+    earlier = {"type": "identity", "id": STIX_ID, "modified": "2023-04-19T00:00:00.123Z", "name": "earlier"}
+    for versions in ([later, earlier], [earlier, later]):
+        graph = GraphSource(versions)
+        assert graph.get(STIX_ID)["name"] == "later"
+        graph.filters.add(Filter("type", "=", "identity"))
+        assert graph.get(STIX_ID)["name"] == "later"
+
+
+def test_load_graph_of_the_db():
+    graph = load_graph(os.path.join(os.path.dirname(__file__), "..", "..", "db"), workers=1, use_threads=True)
+    assert len(graph) == 273
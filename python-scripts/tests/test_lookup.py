@@ -0,0 +1,27 @@
+from menpo.lookup import pattern_addresses
+
+
+def test_value_only_pattern_is_on_any_blockchain():
+    pattern = "[x-defi-address:value = '0x57a72ce4fd69ebedefc1a938b690fbf11a7dff80']"
+    assert pattern_addresses(pattern) == [(None, "0x57a72ce4fd69ebedefc1a938b690fbf11a7dff80")]
+
+
+def test_in_list_gives_every_value():
+    pattern = (
+        "[x-defi-address:value IN ('0xaaa', '0xbbb') AND x-defi-address:blockchain = 'ethereum']"
+    )
+    assert pattern_addresses(pattern) == [("ethereum", "0xaaa"), ("ethereum", "0xbbb")]
+
+
+def test_or_of_observations_keeps_each_value_with_its_blockchain():
+    pattern = (
+        "[x-defi-address:value = '0xaaa' AND x-defi-address:blockchain = 'ethereum']"
+        " OR [x-defi-address:value = '0xbbb' AND x-defi-address:blockchain = 'polygon']"
+    )
+    assert pattern_addresses(pattern) == [("ethereum", "0xaaa"), ("polygon", "0xbbb")]
+
+
+def test_transaction_and_invalid_patterns_have_no_address():
+    pattern = "[x-defi-transaction:value = '0xabc' AND x-defi-address:blockchain = 'ethereum']"
+    assert pattern_addresses(pattern) == []
+    assert pattern_addresses("[x-defi-address:value = ") == []
@@ -0,0 +1,26 @@
+from menpo.matcher import IndicatorMatcher
+
+ADDRESS = "0x57A72cE4fd69eBEdEfC1a938b690fbf11A7Dff80"
+
+
+def test_evaluated_and_lowered_patterns_match_the_same_addresses():
+    matcher = IndicatorMatcher()
+    # Lowered to hash table entries
+    matcher.add("indicator--lowered", "[x-defi-address:value = '%s' AND x-defi-address:blockchain = 'Ethereum, BSC']" % ADDRESS)
+    # Evaluated, because of the != comparison
+    matcher.add(
+        "indicator--evaluated",
+        "[x-defi-address:value = '%s' AND x-defi-address:blockchain = 'Ethereum, BSC'"
+        " AND x-defi-address:value != '0xbbb']" % ADDRESS,
+    )
+    assert matcher.evaluated == ["indicator--evaluated"]
+
+    for blockchain in ("ethereum", "BSC"):
+        assert matcher.match(blockchain, ADDRESS.lower()) == ["indicator--lowered", "indicator--evaluated"]
+    assert matcher.match("polygon", ADDRESS) == []
+
+
+def test_evaluated_in_lists_are_normalized():
+    matcher = IndicatorMatcher()
+    matcher.add("indicator--in", "[x-defi-address:value IN ('%s', '0xbbb') AND x-defi-address:blockchain LIKE 'Eth%%']" % ADDRESS)
+    assert matcher.match("ethereum", ADDRESS.lower()) == ["indicator--in"]
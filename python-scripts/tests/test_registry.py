@@ -0,0 +1,79 @@
+from menpo.ids import deterministic_id
+from menpo.ingest import write_objects
+from menpo.registry import AddressRegistry
+
+
+def address(value, blockchain="ethereum"):
+    stix_obj = {
+        "type": "x-defi-address",
+        "spec_version": "2.1",
+        "name": value,
+        "description": "KyberSwap Attacker",
+        "created": "2023-03-01T00:00:00.000Z",
+        "modified": "2023-03-01T00:00:00.000Z",
+        "blockchain": blockchain,
+        "value": value,
+    }
+    stix_obj["id"] = deterministic_id(stix_obj)
+    return stix_obj
+
+
+CHECKSUMMED = address("0x57A72cE4fd69eBEdEfC1a938b690fbf11A7Dff80")
+LOWERCASE = address("0x57a72ce4fd69ebedefc1a938b690fbf11a7dff80")
+
+
+def test_resolve_registers_nothing_before_writing(tmp_path):
+    registry = AddressRegistry(str(tmp_path))
+    assert registry.resolve(CHECKSUMMED) == CHECKSUMMED["id"]
+    # The same address again, before the first one is written
+    assert registry.resolve(LOWERCASE) == CHECKSUMMED["id"]
+    assert registry.lookup("ethereum", LOWERCASE["value"]) is None
+    assert len(registry) == 0
+
+
+def test_dry_run_leaves_the_registry_alone(tmp_path):
+    write_objects(str(tmp_path), [CHECKSUMMED], dry_run=True)
+    registry = AddressRegistry(str(tmp_path))
+    registry.refresh()
+    assert len(registry) == 0
+
+    write_objects(str(tmp_path), [CHECKSUMMED])
+    registry = AddressRegistry(str(tmp_path))
+    assert registry.lookup("ethereum", LOWERCASE["value"]) == CHECKSUMMED["id"]
+
+
+def test_canonical_refs_give_the_ids_of_canonical_relationships(tmp_path):
+    write_objects(str(tmp_path), [CHECKSUMMED])
+    registry = AddressRegistry(str(tmp_path))
+    registry.refresh()
+
+    uses = {
+        "type": "relationship",
+        "spec_version": "2.1",
+        "id": "relationship--0b9e4a6c-2f0d-4c3e-8b7a-6d1f4e2a9c35",
+        "created": "2023-03-01T00:00:00.000Z",
+        "modified": "2023-03-01T00:00:00.000Z",
+        "relationship_type": "uses",
+        "source_ref": "threat-actor--60f3f7fc-5ac3-5386-9719-e621b8d04104",
+        "target_ref": LOWERCASE["id"],
+    }
+    uses["id"] = deterministic_id(uses)
+    report = {
+        "type": "report",
+        "spec_version": "2.1",
+        "id": "report--6f2b3c59-5a1b-4d6e-9d1c-3f7b2a8e4c10",
+        "created": "2023-03-01T00:00:00.000Z",
+        "modified": "2023-03-01T00:00:00.000Z",
+        "name": "KyberSwap 22.09.01",
+        "published": "2022-09-01T00:00:00Z",
+        "object_refs": [LOWERCASE["id"], uses["id"]],
+    }
+    report["id"] = deterministic_id(report)
+
+    canonical_uses, canonical_report = registry.canonicalize([LOWERCASE, uses, report])
+    assert canonical_uses["target_ref"] == CHECKSUMMED["id"]
+    assert canonical_uses["id"] == deterministic_id(canonical_uses)
+    assert canonical_uses["id"] != uses["id"]
+    assert canonical_report["object_refs"] == [CHECKSUMMED["id"], canonical_uses["id"]]
+    # Reports are not identified by their references
+    assert canonical_report["id"] == report["id"]
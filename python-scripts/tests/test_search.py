@@ -0,0 +1,36 @@
+from menpo.bulk import BulkWriter
+from menpo.search import SearchIndex
+
+
+def note(content, modified="2023-03-01T00:00:00.000Z"):
+    return {
+        "type": "note",
+        "spec_version": "2.1",
+        "id": "note--2f0d4c3e-8b7a-4d1f-8e2a-9c350b9e4a6c",
+        "created": "2023-03-01T00:00:00.000Z",
+        "modified": modified,
+        "content": content,
+        "object_refs": ["report--6f2b3c59-5a1b-4d6e-9d1c-3f7b2a8e4c10"],
+    }
+
+
+def test_phrases_and_reopening(tmp_path):
+    search = SearchIndex(str(tmp_path))
+    BulkWriter(str(tmp_path), search=search).write([note("Price oracle manipulation through a flash loan")])
+    search.close()
+
+    search = SearchIndex(str(tmp_path))
+    assert len(search) == 1
+    assert [stix_id for stix_id, _ in search.search('"oracle manipulation"')] == [note("")["id"]]
+    assert search.search('"manipulation oracle"') == []
+
+
+def test_new_version_replaces_the_postings(tmp_path):
+    search = SearchIndex(str(tmp_path))
+    writer = BulkWriter(str(tmp_path), search=search)
+    writer.write([note("Private key leaked")])
+    writer.write([note("Reentrancy in the vault", modified="2023-03-02T00:00:00.000Z")])
+
+    assert search.search("leaked") == []
+    assert len(search.search("reentrancy")) == 1
+    assert search.refresh() == 0
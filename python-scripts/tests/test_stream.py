@@ -0,0 +1,39 @@
+import json
+
+from menpo.index import FileSystemIndex
+from menpo.stream import StreamIngester
+
+TRANSFERS = [
+    {"blockchain": "ethereum", "hash": "0xaaa", "from": "0x57A72cE4fd69eBEdEfC1a938b690fbf11A7Dff80", "to": "0xbbb",
+     "timestamp": 1667700000},
+    # The sender again, in lowercase
+    {"blockchain": "ethereum", "hash": "0xccc", "from": "0x57a72ce4fd69ebedefc1a938b690fbf11a7dff80", "to": "0xbbb",
+     "timestamp": 1667700060},
+]
+
+
+def test_transfers_link_the_transaction_to_both_addresses(tmp_path):
+    ingester = StreamIngester(str(tmp_path), sync=False)
+    stats = ingester.run([[json.dumps(transfer) for transfer in TRANSFERS]])
+    # 2 transactions, 2 addresses and 4 relationships
+    assert stats["written"] == 8
+
+    index = FileSystemIndex(str(tmp_path))
+    index.refresh()
+    addresses = {entry["id"] for entry in index.entries("x-defi-address")}
+    links = [(entry["id"], index.adjacency.related(entry["id"])) for entry in index.entries("x-defi-transaction")]
+    assert len(addresses) == 2
+    assert all(related == addresses for _, related in links)
+
+
+def test_unusable_lines_are_rejected(tmp_path):
+    lines = [
+        "[1, 2]",
+        json.dumps({"blockchain": "ethereum", "hash": "0xddd", "from": ["0xaaa"], "to": "0xbbb"}),
+        json.dumps({"blockchain": 1, "type": "x-defi-address", "value": "0xaaa"}),
+        json.dumps({"blockchain": "ethereum", "type": "x-defi-address", "value": "0xaaa", "timestamp": 10 ** 20}),
+        json.dumps(TRANSFERS[0]),
+    ]
+    stats = StreamIngester(str(tmp_path), sync=False).run([lines])
+    assert stats["rejected"] == 4
+    assert stats["written"] == 5
@@ -0,0 +1,34 @@
+import pytest
+
+from menpo.bulk import BulkWriter
+from menpo.index import FileSystemIndex
+from menpo.timeindex import TimeIndex
+
+
+def report(uuid, published):
+    return {
+        "type": "report",
+        "spec_version": "2.1",
+        "id": "report--%s" % uuid,
+        "created": "2023-03-01T00:00:00.000Z",
+        "modified": "2023-03-01T00:00:00.000Z",
+        "name": "Incident of %s" % published[:10],
+        "published": published,
+        "object_refs": ["identity--0d1f4e2a-9c35-4b7e-8a6c-2f0d4c3e8b7a"],
+    }
+
+
+def test_count(tmp_path):
+    BulkWriter(str(tmp_path)).write([
+        report("6f2b3c59-5a1b-4d6e-9d1c-3f7b2a8e4c10", "2022-09-01T00:00:00Z"),
+        report("2f0d4c3e-8b7a-4d1f-8e2a-9c350b9e4a6c", "2022-11-05T00:00:00Z"),
+    ])
+    index = FileSystemIndex(str(tmp_path))
+    index.refresh()
+    times = TimeIndex(str(tmp_path))
+    times.refresh(index)
+
+    assert times.count("published") == 2
+    assert times.count("published", "2022-11", "2022") == 1
+    with pytest.raises(ValueError, match="no time index of 'valid_from'"):
+        times.count("valid_from")